@@ -0,0 +1 @@
+"""可复现的性能基准：python -m bench.run（合成数据见 bench/synth.py）"""
@@ -0,0 +1,197 @@
+"""
+性能基准：首图时间、翻页延迟、缩放重绘延迟、文件移动吞吐
+
+    python -m bench.run                          # 在临时目录生成 small 预设并运行
+    python -m bench.run --json base.json         # 保存结果
+    python -m bench.run --compare base.json      # 与基线比较，退化超过阈值时返回非零
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from bench.synth import PRESETS, generate_preset
+from img_cls import (
+    PREVIEW_RESAMPLE, TRACER, DirectoryScanner, FileMover, ImagePrefetcher, ImagePyramid, decode_image,
+    fit_view, render_tile, visible_tiles,
+)
+
+CANVAS_SIZE = (1280, 800)  # 固定的 canvas 尺寸，保证不同机器 / 版本间可比
+ZOOM_STEPS = (1, 2, 4, 8)  # 相对 fit 缩放的倍数
+
+
+def _ms(seconds):
+    return seconds * 1000
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return statistics.median(samples), p95
+
+
+def bench_first_image(image_dir, repeat):
+    """打开目录到首张图像解码完成：后台扫描出第一批 + 降采样解码"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        scanner = DirectoryScanner(image_dir)
+        batch = scanner.batches.get()
+        decode_image(batch[0], CANVAS_SIZE)
+        samples.append(time.perf_counter() - start)
+        scanner.cancel()
+    return {"first_image_ms": _ms(statistics.median(samples))}
+
+
+def bench_next_image(files, dwell_ms):
+    """连续翻页：每张停留 dwell_ms 后切到下一张，测量取得解码结果的延迟（预取命中时接近 0）"""
+    prefetcher = ImagePrefetcher()
+    samples = []
+    try:
+        for idx, path in enumerate(files):
+            prefetcher.schedule(files, idx, CANVAS_SIZE)
+            start = time.perf_counter()
+            decoded = prefetcher.take(path)
+            if decoded is None:
+                decoded = decode_image(path, CANVAS_SIZE)
+                prefetcher.put(path, decoded)
+            samples.append(time.perf_counter() - start)
+            time.sleep(dwell_ms / 1000)
+    finally:
+        prefetcher.shutdown()
+    p50, p95 = _summary(samples)
+    return {"next_image_p50_ms": _ms(p50), "next_image_p95_ms": _ms(p95)}
+
+
+def bench_zoom(files):
+    """最大的图像在各缩放倍数下重绘可见瓦片（预览重采样与高质量重采样分别计时）"""
+    path = max(files, key=lambda p: os.path.getsize(p))
+    decoded = decode_image(path)
+    pyramid = ImagePyramid(decoded.image, decoded.full_size)
+    fit_zoom, _, _ = fit_view(decoded.full_size, CANVAS_SIZE)
+    results = {}
+    for step in ZOOM_STEPS:
+        zoom = fit_zoom * step
+        target_size = (max(1, int(decoded.full_size[0] * zoom)), max(1, int(decoded.full_size[1] * zoom)))
+        # 视图中心对准图像中心
+        origin = ((CANVAS_SIZE[0] - target_size[0]) // 2, (CANVAS_SIZE[1] - target_size[1]) // 2)
+        tiles = visible_tiles(origin, CANVAS_SIZE, target_size, margin=0)
+        for name, resample in (("preview", PREVIEW_RESAMPLE), ("refine", Image.Resampling.LANCZOS)):
+            start = time.perf_counter()
+            for tile in tiles:
+                render_tile(pyramid, zoom, tile, target_size, resample)
+            results[f"zoom_x{step}_{name}_ms"] = _ms(time.perf_counter() - start)
+    return results
+
+
+def bench_move(files, work_dir, categories=4):
+    """FileMover 吞吐：复制一份样本到临时目录，按类别轮流移动，等待全部落盘"""
+    src_dir = Path(work_dir) / "move_src"
+    shutil.rmtree(src_dir, ignore_errors=True)
+    src_dir.mkdir(parents=True)
+    paths = []
+    for path in files:
+        dst = src_dir / Path(path).name
+        shutil.copyfile(path, dst)
+        paths.append(dst)
+    mover = FileMover(src_dir)
+    mover.recover()
+    start = time.perf_counter()
+    for i, path in enumerate(paths):
+        mover.move(path, src_dir / f"class_{i % categories}")
+    mover.close(wait=True)
+    elapsed = time.perf_counter() - start
+    failed = mover.failures.qsize()
+    shutil.rmtree(src_dir, ignore_errors=True)
+    return {"move_files_per_s": len(paths) / elapsed if elapsed else 0.0, "move_failed": failed}
+
+
+def run(image_dir, work_dir, repeat=5, dwell_ms=30, limit=None):
+    files = sorted(p for p in Path(image_dir).iterdir() if not p.name.startswith(".") and p.is_file())
+    if limit:
+        files = files[:limit]
+    results = {}
+    results.update(bench_first_image(image_dir, repeat))
+    results.update(bench_next_image(files, dwell_ms))
+    results.update(bench_zoom(files))
+    results.update(bench_move(files, work_dir))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    与基线比较：*_ms 越小越好，*_per_s 越大越好
+
+    :return: 退化超过 tolerance（比例）的指标 [(name, baseline, current), ...]
+    """
+    regressions = []
+    for name, base in baseline.items():
+        current = results.get(name)
+        if current is None or not base:
+            continue
+        if name.endswith("_ms") and current > base * (1 + tolerance):
+            regressions.append((name, base, current))
+        elif name.endswith("_per_s") and current < base * (1 - tolerance):
+            regressions.append((name, base, current))
+    return regressions
+
+
+def print_table(results, baseline=None):
+    width = max(len(name) for name in results)
+    for name, value in results.items():
+        line = f"{name:<{width}}  {value:>10.2f}"
+        if baseline and baseline.get(name):
+            line += f"  ({(value / baseline[name] - 1) * 100:+.1f}%)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图像分类工具性能基准")
+    parser.add_argument("--dir", help="使用已有图像目录（默认在临时目录生成合成数据）")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small")
+    parser.add_argument("--data", help="合成数据存放目录（可复用，避免每次重新生成）")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--dwell-ms", type=int, default=30, help="翻页测试中每张图的停留时间")
+    parser.add_argument("--limit", type=int, help="最多使用的文件数")
+    parser.add_argument("--json", help="将结果写入 JSON 文件")
+    parser.add_argument("--compare", help="基线 JSON 文件")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的退化比例")
+    parser.add_argument("--trace", help="记录热路径计时并导出（.json 为 Chrome trace，.jsonl 为逐行事件）")
+    args = parser.parse_args()
+    TRACER.enabled = bool(args.trace)
+
+    with tempfile.TemporaryDirectory(prefix="img_cls_bench_") as tmp:
+        image_dir = args.dir
+        if image_dir is None:
+            image_dir = args.data or os.path.join(tmp, "data")
+            print(f"生成合成数据（{args.preset}）→ {image_dir}")
+            generate_preset(image_dir, args.preset)
+        results = run(image_dir, tmp, args.repeat, args.dwell_ms, args.limit)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+    if args.trace:
+        TRACER.export(args.trace)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        for name, base, current in regressions:
+            print(f"[Regression] {name}: {base:.2f} → {current:.2f}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
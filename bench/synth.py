@@ -0,0 +1,89 @@
+"""生成合成图像目录：固定随机种子，相同参数得到相同的文件（尺寸、格式、数量可配置）"""
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+# 预设：(数量, [(宽, 高), ...], [格式, ...])，按序号轮流取尺寸和格式
+PRESETS = {
+    "small": (120, [(1920, 1080), (1280, 960), (4000, 3000)], ["jpg", "jpg", "png"]),
+    "large": (400, [(4000, 3000), (6000, 4000), (1920, 1080)], ["jpg", "jpg", "webp", "png"]),
+    "huge": (40, [(8000, 6000), (12000, 8000)], ["jpg", "png"]),
+}
+MARKER = ".synth.json"
+
+
+def _make_image(rng, size):
+    """渐变 + 色块 + 噪声：压缩率接近真实照片，避免纯色图像让解码耗时失真"""
+    w, h = size
+    # 先在 1/8 分辨率上生成，再放大，生成速度与真实感兼顾
+    sw, sh = max(1, w // 8), max(1, h // 8)
+    x = np.linspace(0, 1, sw, dtype=np.float32)[None, :, None]
+    y = np.linspace(0, 1, sh, dtype=np.float32)[:, None, None]
+    base = rng.random(3, dtype=np.float32) * 255 * (x * rng.random() + y * rng.random()) / 2
+    base = base + rng.normal(0, 24, (sh, sw, 3)).astype(np.float32)
+    for _ in range(6):
+        bx, by = rng.integers(0, sw), rng.integers(0, sh)
+        base[by:by + sh // 4, bx:bx + sw // 4] += rng.integers(-80, 80, 3)
+    small = Image.fromarray(np.clip(base, 0, 255).astype(np.uint8), "RGB")
+    img = small.resize((w, h), Image.Resampling.BILINEAR)
+    # 全分辨率再叠加一层细噪声，保留高频细节
+    noise = rng.integers(-8, 9, (h, w, 1), dtype=np.int16)
+    return Image.fromarray(np.clip(np.asarray(img, dtype=np.int16) + noise, 0, 255).astype(np.uint8), "RGB")
+
+
+def generate(out_dir, count, sizes, formats, seed=0):
+    """
+    在 out_dir 下生成 count 张图像，参数与已有数据一致时直接复用
+
+    :return: 生成（或复用）的文件路径列表
+    """
+    out_dir = Path(out_dir)
+    params = {"count": count, "sizes": [list(s) for s in sizes], "formats": list(formats), "seed": seed}
+    names = [f"img_{i:05d}.{formats[i % len(formats)]}" for i in range(count)]
+    paths = [out_dir / name for name in names]
+    marker = out_dir / MARKER
+    if marker.exists() and all(p.exists() for p in paths):
+        try:
+            if json.loads(marker.read_text(encoding="utf-8")) == params:
+                return paths
+        except ValueError:
+            pass
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for i, path in enumerate(paths):
+        # 每张图单独播种：改变数量不影响已有文件的内容
+        rng = np.random.default_rng([seed, i])
+        img = _make_image(rng, sizes[i % len(sizes)])
+        if path.suffix == ".jpg":
+            img.save(path, quality=90)
+        elif path.suffix == ".webp":
+            img.save(path, quality=85)
+        else:
+            img.save(path, compress_level=1)
+    marker.write_text(json.dumps(params), encoding="utf-8")
+    return paths
+
+
+def generate_preset(out_dir, preset="small", seed=0):
+    count, sizes, formats = PRESETS[preset]
+    return generate(out_dir, count, sizes, formats, seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成图像目录")
+    parser.add_argument("out_dir")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small")
+    parser.add_argument("--count", type=int, help="覆盖预设的数量")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    count, sizes, formats = PRESETS[args.preset]
+    paths = generate(args.out_dir, args.count or count, sizes, formats, args.seed)
+    total = sum(os.path.getsize(p) for p in paths)
+    print(f"{len(paths)} 张图像，共 {total / 1024 / 1024:.1f} MB → {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,28 @@
 @echo off
 :: 支持中文字符
 chcp 65001 >nul
+:: build.bat          单文件 ImgCls.exe（每次启动都要先解压到临时目录，启动较慢）
+:: build.bat onedir   目录版 ImgCls\ImgCls.exe（免解压、不经 UPX 压缩，启动更快）
+set PYINSTALLER=D:\miniforge\envs\common\Scripts\pyinstaller.exe
+if /i "%1"=="onedir" goto onedir
 echo "删除已有程序"
 del ImgCls.exe
 echo "开始编译打包"
-D:\miniforge\envs\common\Scripts\pyinstaller.exe --icon=assets/256xicon.ico --windowed --onefile --collect-all customtkinter --name ImgCls main.py
+%PYINSTALLER% --icon=assets/256xicon.ico --windowed --onefile --collect-all customtkinter --name ImgCls main.py
 echo "编译完成"
 move dist\ImgCls.exe .
+goto cleanup
+
+:onedir
+echo "删除已有程序"
+if exist ImgCls rd /s /q ImgCls
+echo "开始编译打包（目录版）"
+:: --contents-directory . 让依赖与 assets 和 exe 放在同一目录，程序按相对路径即可找到图标
+%PYINSTALLER% --icon=assets/256xicon.ico --windowed --onedir --noupx --contents-directory . --add-data "assets;assets" --collect-all customtkinter --name ImgCls main.py
+echo "编译完成"
+move dist\ImgCls .
+
+:cleanup
 rd /s /q build
 rd /s /q dist
 del ImgCls.spec
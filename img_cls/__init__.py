@@ -0,0 +1,41 @@
+"""
+图像分类标注的无界面引擎：解码、扫描、渲染、文件操作、缩略图、去重、预标注与完整性预检（GUI 见 main.py）
+
+导出的名称在首次访问时才导入所在的子模块：界面启动时不必加载 numpy（去重 / 预标注才用到）
+"""
+import importlib
+
+_EXPORTS = {
+    "cache": ("LRUCache",),
+    "decode": ("DecodedImage", "ImagePrefetcher", "decode_image", "image_nbytes"),
+    "dedup": ("cluster_hashes", "find_similar_images", "image_hashes"),
+    "export": ("ENCODE_FORMATS", "encode_image", "export_shards", "list_samples", "mix_samples"),
+    "files": ("FileMover", "LabelManifest", "NameIndex", "move_file", "transfer_file"),
+    "integrity": ("CHECK_STATUS_NAMES", "IntegrityChecker", "check_image"),
+    "lease": ("LeaseManager", "default_owner"),
+    "predict": (
+        "FEATURE_DIM", "FeatureCache", "LabelPredictor", "build_predictor", "collect_references", "extract_features",
+        "features_from_pixels",
+    ),
+    "render": ("PREVIEW_RESAMPLE", "TILE_SIZE", "ImagePyramid", "fit_view", "render_tile", "visible_tiles", "zoom_at"),
+    "scan": ("IMAGE_EXTS", "DirectoryScanner", "SessionIndex"),
+    "thumbs": ("THUMB_EDGE", "ThumbnailCache", "ThumbnailLoader", "make_thumbnail"),
+    "trace": ("TRACER", "StartupTimer", "Tracer", "process_age", "process_memory_mb"),
+    "workqueue": ("WorkQueue",),
+}
+_MODULE_OF = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = list(_MODULE_OF)
+
+
+def __getattr__(name):
+    module = _MODULE_OF.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value  # 之后直接命中模块字典
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,61 @@
+"""按字节预算淘汰的缓存"""
+from collections import OrderedDict
+
+
+class LRUCache:
+    """按字节预算淘汰的 LRU 缓存，统计命中 / 未命中 / 淘汰次数"""
+    
+    def __init__(self, max_mb=256):
+        self.max_bytes = max_mb * 1024 * 1024
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()  # {key: (value, nbytes)}，越靠前越久未用
+    
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._data.move_to_end(key)
+        return entry[0]
+    
+    def put(self, key, value, nbytes):
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.current_bytes -= old[1]
+        self._data[key] = (value, nbytes)
+        self.current_bytes += nbytes
+        # 至少保留刚放入的一项
+        while self.current_bytes > self.max_bytes and len(self._data) > 1:
+            _, (_, size) = self._data.popitem(last=False)
+            self.current_bytes -= size
+            self.evictions += 1
+    
+    def discard(self, predicate):
+        """删除 key 满足 predicate 的所有条目（如某个文件被移走）"""
+        for key in [k for k in self._data if predicate(k)]:
+            self.current_bytes -= self._data.pop(key)[1]
+    
+    def clear(self):
+        self._data.clear()
+        self.current_bytes = 0
+    
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self.current_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+    
+    def __contains__(self, key):
+        return key in self._data
+    
+    def __len__(self):
+        return len(self._data)
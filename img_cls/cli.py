@@ -0,0 +1,338 @@
+"""
+命令行批量模式（不创建窗口）：读取外部标注清单，按 config.json 的类别校验后批量移动 / 复制到类别目录；
+把分好类的图像导出为训练用的 tar 分片；或检查目录中截断 / 损坏 / 空的图像文件
+
+    python main.py apply labels.csv --dir D:/images --mode copy --dry-run
+    python -m img_cls apply labels.json --dir D:/images
+    python main.py export --dir D:/images --out D:/shards --val 0.1 --max-edge 512
+    python main.py check --dir D:/images --move
+
+清单格式：
+- CSV：含表头时取 path/file/filename/image 列与 label/category/class 列，无表头时取前两列
+- JSON：{"路径": "类别", ...} 或 [{"path": ..., "label": ...}, ...]；.jsonl 每行一个对象
+路径相对 --dir，也可以是 --dir 内的绝对路径
+
+导入的标注写入目录下的标注清单（与界面「仅标注」模式共用），中断后重新运行同一命令即可继续
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from .export import ENCODE_FORMATS, export_shards, list_samples
+from .files import LabelManifest, NameIndex, move_file
+from .integrity import CHECK_STATUS_NAMES, IntegrityChecker
+from .scan import DirectoryScanner, SessionIndex
+
+PATH_COLUMNS = ("path", "file", "filename", "image")
+LABEL_COLUMNS = ("label", "category", "class")
+PROGRESS_INTERVAL = 0.5  # 进度输出间隔（秒）
+
+
+class ManifestError(ValueError):
+    """清单无法解析或未通过校验"""
+
+
+def _pick(record, columns, line):
+    for column in columns:
+        if record.get(column) not in (None, ""):
+            return str(record[column])
+    raise ManifestError(f"第 {line} 项缺少 {'/'.join(columns)} 字段")
+
+
+def read_manifest(path):
+    """读取标注清单，返回 [(路径字符串, 类别), ...]（保持文件中的顺序）"""
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".csv":
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            rows = [row for row in csv.reader(f) if row and any(cell.strip() for cell in row)]
+        if not rows:
+            return []
+        header = [cell.strip().lower() for cell in rows[0]]
+        if any(c in header for c in PATH_COLUMNS) and any(c in header for c in LABEL_COLUMNS):
+            records = [dict(zip(header, row)) for row in rows[1:]]
+            return [(_pick(r, PATH_COLUMNS, i).strip(), _pick(r, LABEL_COLUMNS, i).strip())
+                    for i, r in enumerate(records, 2)]
+        for i, row in enumerate(rows, 1):
+            if len(row) < 2:
+                raise ManifestError(f"第 {i} 行少于两列")
+        return [(row[0].strip(), row[1].strip()) for row in rows]
+    if suffix == ".jsonl":
+        with open(path, "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    elif suffix == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            return [(str(k), str(v)) for k, v in data.items()]
+        records = data
+    else:
+        raise ManifestError(f"不支持的清单格式：{path.suffix}（支持 .csv / .json / .jsonl）")
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        raise ManifestError("JSON 清单应为 {路径: 类别} 或对象列表")
+    return [(_pick(r, PATH_COLUMNS, i), _pick(r, LABEL_COLUMNS, i)) for i, r in enumerate(records, 1)]
+
+
+def validate(entries, image_dir, categories):
+    """
+    校验清单：类别必须在 categories 中，路径必须位于 image_dir 内，同一文件不能有不同类别
+    
+    :return: (labels, errors)：去重后的 [(Path, 类别), ...] 与错误信息列表
+    """
+    allowed = set(categories)
+    image_dir = Path(image_dir).resolve()
+    labels, errors = {}, []
+    unknown = Counter()
+    for raw, category in entries:
+        if category not in allowed:
+            unknown[category] += 1
+            continue
+        path = Path(raw)
+        path = (path if path.is_absolute() else image_dir / path).resolve()
+        if image_dir not in path.parents:
+            errors.append(f"不在图像目录内：{raw}")
+            continue
+        previous = labels.setdefault(path, category)
+        if previous != category:
+            errors.append(f"同一文件有不同类别：{raw}（{previous} / {category}）")
+    for category, count in unknown.most_common():
+        errors.append(f"未知类别 {category!r}（{count} 项），config.json 中的类别：{', '.join(categories)}")
+    return list(labels.items()), errors
+
+
+def load_categories(config_path):
+    with open(config_path, "r", encoding="utf-8") as f:
+        cats = json.load(f).get("categories", [])
+    if not cats:
+        raise ManifestError(f"{config_path} 中 categories 为空")
+    return list(map(str, cats))
+
+
+def _progress_printer(stream):
+    """返回 progress(done, total) 回调：限频输出到 stream（apply 在工作线程中调用）"""
+    lock = threading.Lock()
+    last = [0.0]
+    
+    def progress(done, total):
+        now = time.perf_counter()
+        with lock:
+            if done < total and now - last[0] < PROGRESS_INTERVAL:
+                return
+            last[0] = now
+        stream.write(f"\r已完成 {done}/{total}")
+        if done == total:
+            stream.write("\n")
+        stream.flush()
+    
+    return progress
+
+
+def cmd_apply(args):
+    try:
+        categories = load_categories(args.config)
+        entries = read_manifest(args.manifest)
+    except (OSError, ValueError) as e:  # ManifestError / JSON 解析错误均为 ValueError
+        print(f"[Error] {e}", file=sys.stderr)
+        return 2
+    image_dir = Path(args.dir)
+    if not image_dir.is_dir():
+        print(f"[Error] 图像目录不存在：{image_dir}", file=sys.stderr)
+        return 2
+    labels, errors = validate(entries, image_dir, categories)
+    if errors:
+        for message in errors[:50]:
+            print(f"[Error] {message}", file=sys.stderr)
+        if len(errors) > 50:
+            print(f"[Error] …… 共 {len(errors)} 项错误", file=sys.stderr)
+        return 2
+    
+    manifest = LabelManifest(image_dir.resolve())
+    try:
+        if args.dry_run:
+            # 在未提交的事务中导入并规划，结束后撤销：与真实运行的目标文件名完全一致，且不修改任何东西
+            manifest.set_many(labels, commit=False)
+            finished, missing, planned = manifest.plan(args.mode)
+            manifest.discard_changes()
+            per_category = Counter(Path(dst).parent.name for _, _, dst in planned)
+            shown = planned if args.verbose else planned[:20]
+            for _, src, dst in shown:
+                print(f"{src} → {dst}")
+            if len(shown) < len(planned):
+                print(f"…… 共 {len(planned)} 项（-v 显示全部）")
+            print(f"[dry-run] 待{args.mode} {len(planned)} 个文件，已完成 {len(finished)}，源文件缺失 {len(missing)}")
+            for category, count in sorted(per_category.items()):
+                print(f"  {category}: {count}")
+            return 0
+        
+        manifest.set_many(labels)
+        summary = manifest.apply(args.mode, args.workers, progress=_progress_printer(sys.stderr))
+    finally:
+        manifest.close()
+    
+    seconds = max(summary["seconds"], 1e-9)
+    done = len(summary["done"])
+    print(f"{args.mode}：完成 {done}，失败 {len(summary['failed'])}，源文件缺失 {len(summary['missing'])}，"
+          f"用时 {summary['seconds']:.2f}s，{done / seconds:.1f} 个/s，"
+          f"{summary['bytes'] / 1024 / 1024 / seconds:.1f} MB/s")
+    for src, error in summary["failed"][:50]:
+        print(f"[Failed] {src}: {error}", file=sys.stderr)
+    for src in summary["missing"][:50]:
+        print(f"[Missing] {src}", file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+
+def cmd_export(args):
+    try:
+        categories = load_categories(args.config)
+    except (OSError, ValueError) as e:
+        print(f"[Error] {e}", file=sys.stderr)
+        return 2
+    image_dir = Path(args.dir)
+    if not image_dir.is_dir():
+        print(f"[Error] 图像目录不存在：{image_dir}", file=sys.stderr)
+        return 2
+    if not 0 <= args.val < 1:
+        print("[Error] --val 应在 [0, 1) 之间", file=sys.stderr)
+        return 2
+    labels = None
+    if args.from_manifest:
+        manifest = LabelManifest(image_dir.resolve())
+        try:
+            labels = manifest.labels()
+        finally:
+            manifest.close()
+    by_category = list_samples(image_dir, categories, labels)
+    total = sum(len(paths) for paths in by_category.values())
+    if not total:
+        print("[Error] 没有可导出的图像" + ("（标注清单为空）" if args.from_manifest else "（类别目录为空）"),
+              file=sys.stderr)
+        return 2
+    summary = export_shards(
+        by_category, args.out,
+        val_ratio=args.val,
+        shard_size=args.shard_size,
+        shard_bytes=args.shard_mb * 1024 * 1024,
+        max_edge=args.max_edge,
+        fmt=args.format,
+        quality=args.quality,
+        workers=args.workers,
+        prefix=args.prefix,
+        progress=_progress_printer(sys.stderr),
+    )
+    seconds = max(summary["seconds"], 1e-9)
+    written = sum(summary["samples"].values())
+    print(f"导出 {written} 张到 {args.out}，失败 {len(summary['failed'])}，用时 {summary['seconds']:.2f}s，"
+          f"{written / seconds:.1f} 张/s，{summary['bytes'] / 1024 / 1024 / seconds:.1f} MB/s")
+    for split, per_category in sorted(summary["per_category"].items()):
+        print(f"  {split}: " + "，".join(f"{c} {n}" for c, n in per_category.items()))
+    for src, error in summary["failed"][:50]:
+        print(f"[Failed] {src}: {error}", file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+
+def cmd_check(args):
+    image_dir = Path(args.dir)
+    if not image_dir.is_dir():
+        print(f"[Error] 图像目录不存在：{image_dir}", file=sys.stderr)
+        return 2
+    start = time.perf_counter()
+    # 与界面共用会话索引：检查结果按 (大小, mtime) 缓存，界面预检与再次检查都不必重新解码
+    index = SessionIndex(image_dir)
+    checker = IntegrityChecker(index, workers=args.workers)
+    try:
+        scanner = DirectoryScanner(image_dir, index=index)
+        while True:
+            batch = scanner.batches.get()
+            if batch is None:
+                break
+            checker.submit(batch)
+        checker.finish()
+        progress = _progress_printer(sys.stderr)
+        while not checker.done.wait(PROGRESS_INTERVAL):
+            progress(checker.checked, checker.total)
+        progress(checker.checked, checker.total)
+    finally:
+        checker.stop(wait=True)
+        index.close()
+    bad = []
+    while not checker.bad.empty():
+        bad.append(checker.bad.get())
+    bad.sort()
+    names = NameIndex()
+    quarantine_dir = image_dir / args.quarantine_dir
+    failed = 0
+    for path, status, error in bad:
+        print(f"{CHECK_STATUS_NAMES[status]}\t{path}\t{error}")
+        if args.move:
+            try:
+                quarantine_dir.mkdir(exist_ok=True)
+                move_file(path, names.reserve(quarantine_dir, path.name))
+            except OSError as e:
+                failed += 1
+                print(f"[Failed] {path}: {e}", file=sys.stderr)
+    detail = "，".join(f"{name} {checker.counts[s]}" for s, name in CHECK_STATUS_NAMES.items() if checker.counts[s])
+    print(f"检查 {checker.checked} 张，问题图像 {len(bad)} 张" + (f"（{detail}）" if detail else "")
+          + (f"，已移入 {quarantine_dir}" if args.move and bad else "")
+          + f"，用时 {time.perf_counter() - start:.2f}s")
+    return 1 if bad or failed else 0
+
+
+def _attach_console():
+    """打包为窗口程序（--windowed）时没有标准输出：Windows 下附着到启动它的控制台"""
+    if sys.stdout is not None or sys.platform != "win32":
+        return
+    import ctypes
+    if ctypes.windll.kernel32.AttachConsole(-1):  # ATTACH_PARENT_PROCESS
+        sys.stdout = open("CONOUT$", "w", encoding="utf-8")
+        sys.stderr = sys.stdout
+    else:
+        sys.stdout = sys.stderr = open(os.devnull, "w")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="ImgCls", description="图像分类工具命令行模式（不带参数运行则打开界面）")
+    sub = parser.add_subparsers(dest="command", required=True)
+    apply = sub.add_parser("apply", help="按外部标注清单把文件批量移动 / 复制到类别目录")
+    apply.add_argument("manifest", help="标注清单（.csv / .json / .jsonl）")
+    apply.add_argument("--dir", required=True, help="图像目录，类别目录创建在其下")
+    apply.add_argument("--config", default="config.json", help="包含 categories 的配置文件")
+    apply.add_argument("--mode", choices=LabelManifest.APPLY_MODES, default="move")
+    apply.add_argument("--workers", type=int, default=8, help="并行线程数")
+    apply.add_argument("--dry-run", action="store_true", help="只显示将要执行的操作")
+    apply.add_argument("-v", "--verbose", action="store_true")
+    apply.set_defaults(func=cmd_apply)
+    
+    export = sub.add_parser("export", help="把类别目录（或标注清单）中的图像导出为 WebDataset 风格的 tar 分片")
+    export.add_argument("--dir", required=True, help="图像目录（其下为各类别目录）")
+    export.add_argument("--out", required=True, help="输出目录")
+    export.add_argument("--config", default="config.json", help="包含 categories 的配置文件")
+    export.add_argument("--from-manifest", action="store_true", help="按标注清单（仅标注模式）导出，而不是类别目录")
+    export.add_argument("--val", type=float, default=0.0, help="验证集比例（按类别分层）")
+    export.add_argument("--shard-size", type=int, default=1000, help="每个分片的样本数上限")
+    export.add_argument("--shard-mb", type=int, default=1024, help="每个分片的大小上限（MB）")
+    export.add_argument("--max-edge", type=int, help="缩放到最长边不超过该值（像素）")
+    export.add_argument("--format", choices=sorted(ENCODE_FORMATS), help="重新编码的格式（默认保留原文件）")
+    export.add_argument("--quality", type=int, default=90)
+    export.add_argument("--workers", type=int, help="重新编码的进程数（默认 CPU 核数）")
+    export.add_argument("--prefix", default="data", help="分片文件名前缀")
+    export.set_defaults(func=cmd_export)
+    
+    check = sub.add_parser("check", help="检查图像目录中截断、损坏或空的图像文件（多进程完整解码）")
+    check.add_argument("--dir", required=True, help="图像目录")
+    check.add_argument("--move", action="store_true", help="把问题图像移入隔离目录")
+    check.add_argument("--quarantine-dir", default="_quarantine", help="隔离目录名（在图像目录下）")
+    check.add_argument("--workers", type=int, help="进程数（默认 CPU 核数）")
+    check.set_defaults(func=cmd_check)
+    return parser
+
+
+def main(argv=None):
+    _attach_console()
+    args = build_parser().parse_args(argv)
+    return args.func(args)
@@ -0,0 +1,210 @@
+"""图像解码与后台预取"""
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from .trace import TRACER
+
+
+def image_nbytes(img):
+    """估算解码后图像占用的内存（字节）"""
+    return img.width * img.height * len(img.getbands())
+
+
+class DecodedImage:
+    """解码结果：image 可能是降采样后的图像，full_size 为原图尺寸，mode 为原图模式（image 已转为 RGBA）"""
+    
+    def __init__(self, image, full_size, mode=None):
+        self.image = image
+        self.full_size = tuple(full_size)
+        self.mode = mode
+    
+    @property
+    def scale(self):
+        """已解码分辨率相对原图的比例（1.0 为全分辨率）"""
+        return self.image.width / self.full_size[0]
+    
+    @property
+    def is_full(self):
+        return self.image.size == self.full_size
+    
+    @property
+    def nbytes(self):
+        return image_nbytes(self.image)
+
+
+def decode_image(image_path, fit_size=None):
+    """
+    解码图像为 RGBA（可在后台线程中调用）
+    
+    :param image_path: 图像路径
+    :param fit_size: (w, h)，给定时只解码到足以「自适应填充」该区域的分辨率：
+                     JPEG 使用 draft（在 DCT 域按 1/2、1/4、1/8 缩放解码），其余格式解码后 reduce
+    :return: DecodedImage
+    """
+    with TRACER.span("decode", path=str(image_path)), Image.open(image_path) as img:
+        full_size = img.size
+        mode = img.mode
+        factor = 1
+        if fit_size:
+            iw, ih = full_size
+            scale = min(fit_size[0] / iw, fit_size[1] / ih, 1.0)
+            need = (max(1, math.ceil(iw * scale)), max(1, math.ceil(ih * scale)))
+            if img.format == "JPEG":
+                img.draft("RGB", need)
+            else:
+                factor = max(1, int(1 / scale))
+        if factor > 1:
+            # reduce 只支持部分模式，其余先转 RGBA
+            src = img if img.mode in ("L", "RGB", "RGBA") else img.convert("RGBA")
+            return DecodedImage(src.reduce(factor).convert("RGBA"), full_size, mode)
+        return DecodedImage(img.convert("RGBA"), full_size, mode)
+
+
+class ImagePrefetcher:
+    """后台预取：在线程池中解码当前图像前后若干张，按内存预算缓存已解码图像"""
+    
+    def __init__(self, ahead=3, behind=1, memory_mb=512, workers=2):
+        self.ahead = ahead
+        self.behind = behind
+        self.memory_budget = memory_mb * 1024 * 1024
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._buffer = OrderedDict()  # {path: DecodedImage}，越靠前越旧
+        self._buffer_bytes = 0
+        self._pending = {}  # {path: Future}
+        self._window = []  # 当前预取窗口内的路径，按优先级排序
+        self._fit_size = None  # 降采样解码的目标区域（canvas 尺寸）
+        self.hits = 0  # 已在缓冲中
+        self.waits = 0  # 正在解码，等待其完成
+        self.misses = 0  # 未预取，由调用方同步解码
+    
+    def schedule(self, image_files, curr_idx, fit_size=None):
+        """以 curr_idx 为中心重新规划预取窗口：取消窗口外的任务，提交缺失的解码任务"""
+        if not image_files or curr_idx < 0:
+            self.cancel()
+            return
+        # 优先级：当前 → 下一张 → 上一张 → 下两张 ...（向前翻页更常见）
+        order = [curr_idx]
+        for step in range(1, max(self.ahead, self.behind) + 1):
+            if step <= self.ahead and curr_idx + step < len(image_files):
+                order.append(curr_idx + step)
+            if step <= self.behind and curr_idx - step >= 0:
+                order.append(curr_idx - step)
+        window = [str(image_files[i]) for i in order]
+        with self._lock:
+            self._window = window
+            self._fit_size = fit_size
+            wanted = set(window)
+            for key in [k for k in self._pending if k not in wanted]:
+                self._pending.pop(key).cancel()
+            for key in window:
+                if key not in self._buffer and key not in self._pending:
+                    self._pending[key] = self._executor.submit(self._decode, key)
+            self._evict()
+    
+    def take(self, image_path):
+        """取出已解码的 DecodedImage；若正在解码则等待其完成，未命中返回 None"""
+        key = str(image_path)
+        with self._lock:
+            img = self._buffer.get(key)
+            if img is not None:
+                self._buffer.move_to_end(key)
+                self.hits += 1
+                return img
+            future = self._pending.get(key)
+            if future is not None and future.cancel():
+                # 尚未开始的任务不必排队等待，由调用方同步解码更快
+                self._pending.pop(key)
+                future = None
+            if future is None:
+                self.misses += 1
+                return None
+            self.waits += 1
+        try:
+            return future.result()
+        except Exception:
+            return None
+    
+    def stats(self):
+        lookups = self.hits + self.waits + self.misses
+        return {
+            "entries": len(self._buffer),
+            "bytes": self._buffer_bytes,
+            "hits": self.hits,
+            "waits": self.waits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+    
+    def put(self, image_path, decoded):
+        """将同步解码的图像放入缓冲，便于回看"""
+        with self._lock:
+            self._store(str(image_path), decoded)
+            self._evict()
+    
+    def submit_full(self, image_path):
+        """在后台解码全分辨率图像（放大超过已解码分辨率时使用），不进入缓冲"""
+        return self._executor.submit(decode_image, image_path)
+    
+    def invalidate(self, image_path):
+        """文件被移动/删除时丢弃其缓冲与任务"""
+        key = str(image_path)
+        with self._lock:
+            future = self._pending.pop(key, None)
+            if future is not None:
+                future.cancel()
+            decoded = self._buffer.pop(key, None)
+            if decoded is not None:
+                self._buffer_bytes -= decoded.nbytes
+            if key in self._window:
+                self._window.remove(key)
+    
+    def cancel(self):
+        """跳转或切换目录时取消所有未完成的预取，并清空缓冲"""
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+            self._buffer.clear()
+            self._buffer_bytes = 0
+            self._window = []
+    
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _decode(self, key):
+        decoded = None
+        try:
+            decoded = decode_image(key, self._fit_size)
+        finally:
+            # 无论成败都清除在途记录：解码失败的图像下次 schedule 时会重新提交
+            with self._lock:
+                # 解码期间窗口已移走（跳转/移动文件），结果作废
+                if self._pending.pop(key, None) is not None and decoded is not None and key in self._window:
+                    self._store(key, decoded)
+                    self._evict()
+        return decoded
+    
+    def _store(self, key, decoded):
+        old = self._buffer.pop(key, None)
+        if old is not None:
+            self._buffer_bytes -= old.nbytes
+        self._buffer[key] = decoded
+        self._buffer_bytes += decoded.nbytes
+    
+    def _evict(self):
+        # 超出预算时：先淘汰窗口外最旧的，再按优先级从窗口末端淘汰
+        if self._buffer_bytes <= self.memory_budget:
+            return
+        rank = {key: i for i, key in enumerate(self._window)}
+        outside = [k for k in self._buffer if k not in rank]
+        inside = sorted((k for k in self._buffer if k in rank), key=rank.get, reverse=True)
+        for key in outside + inside:
+            if self._buffer_bytes <= self.memory_budget or rank.get(key) == 0:
+                break
+            self._buffer_bytes -= self._buffer.pop(key).nbytes
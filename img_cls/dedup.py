@@ -0,0 +1,161 @@
+"""感知哈希与近重复图像聚类"""
+import hashlib
+import io
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+import numpy as np
+from PIL import Image
+
+
+def _dct_matrix(n=32):
+    """正交 DCT-II 矩阵，pHash 用 M @ X @ M.T 计算二维 DCT"""
+    k = np.arange(n)
+    m = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n)) * np.sqrt(2 / n)
+    m[0] /= np.sqrt(2)
+    return m
+
+
+_DCT_32 = _dct_matrix(32)
+
+
+def _pack_bits(bits):
+    """64 个布尔值 → 64 位整数"""
+    return int(np.packbits(bits.ravel()).view(">u8")[0])
+
+
+def image_hashes(image_path):
+    """
+    计算 (dHash, pHash, 内容摘要)（在进程池中执行，必须是模块级函数）
+    
+    两种哈希都是 64 位整数；内容摘要为文件字节的 blake2b，用于识别完全相同的文件
+    """
+    with open(image_path, "rb") as f:
+        data = f.read()
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft("L", (64, 64))  # 哈希只需要很小的图，JPEG 直接低分辨率解码
+        gray = img.convert("L")
+    d = np.asarray(gray.resize((9, 8), Image.Resampling.BILINEAR), dtype=np.int16)
+    dhash = _pack_bits(d[:, 1:] > d[:, :-1])
+    p = np.asarray(gray.resize((32, 32), Image.Resampling.BILINEAR), dtype=np.float64)
+    low = (_DCT_32 @ p @ _DCT_32.T)[:8, :8].ravel()
+    phash = _pack_bits(low > np.median(low[1:]))  # 不含直流分量
+    return dhash, phash, digest
+
+
+def _safe_image_hashes(image_path):
+    try:
+        return image_hashes(image_path)
+    except Exception:
+        return None
+
+
+def popcount64(x):
+    """uint64 数组逐元素统计 1 的个数"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    return np.unpackbits(x.view(np.uint8).reshape(*x.shape, 8), axis=-1).sum(axis=-1)
+
+
+def _pairs_brute_force(h, threshold):
+    """分块两两比较（n 较小时最快），返回距离 ≤ threshold 的 (i, j)，i < j"""
+    n = len(h)
+    block = max(1, 4_000_000 // max(n, 1))
+    for start in range(0, n, block):
+        dist = popcount64(h[start:start + block, None] ^ h[None, :])
+        i, j = np.nonzero(dist <= threshold)
+        i = i + start
+        keep = j > i
+        yield i[keep], j[keep]
+
+
+def _pairs_multi_index(h, threshold, segments=4):
+    """
+    多段索引：64 位分成 segments 段，距离 ≤ threshold 的两个哈希至少有一段的距离 ≤ threshold // segments，
+    因此只需在每段中查找「该段相同或只差几位」的候选对，再校验完整距离
+    """
+    n = len(h)
+    radius = threshold // segments
+    bounds = np.linspace(0, 64, segments + 1).astype(int)
+    idx = np.arange(n)
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        width = int(hi - lo)
+        keys = (h >> np.uint64(lo)) & np.uint64((1 << width) - 1)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        flips = [0] + [sum(1 << b for b in bits) for r in range(1, radius + 1) for bits in combinations(range(width), r)]
+        for flip in flips:
+            probe = keys ^ np.uint64(flip)
+            left = np.searchsorted(sorted_keys, probe, "left")
+            counts = np.searchsorted(sorted_keys, probe, "right") - left
+            total = int(counts.sum())
+            if not total:
+                continue
+            i = np.repeat(idx, counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            j = order[np.repeat(left, counts) + offsets]
+            keep = j > i
+            i, j = i[keep], j[keep]
+            keep = popcount64(h[i] ^ h[j]) <= threshold
+            yield i[keep], j[keep]
+
+
+def cluster_hashes(hashes, threshold=6, brute_force_limit=20000):
+    """
+    按汉明距离把 64 位哈希聚类（连通分量）
+    
+    先合并完全相同的哈希；去重后数量不超过 brute_force_limit 时用 NumPy 分块两两比较，否则用多段索引
+    
+    :return: 与 hashes 等长的簇编号数组
+    """
+    uniq, inverse = np.unique(np.asarray(hashes, dtype=np.uint64), return_inverse=True)
+    finder = _pairs_brute_force if len(uniq) <= brute_force_limit else _pairs_multi_index
+    labels = np.arange(len(uniq))
+    pairs = [(i, j) for i, j in finder(uniq, threshold) if len(i)]
+    if pairs:
+        i = np.concatenate([p[0] for p in pairs])
+        j = np.concatenate([p[1] for p in pairs])
+        # 标签传播 + 指针跳跃求连通分量
+        while True:
+            low = np.minimum(labels[i], labels[j])
+            new = labels.copy()
+            np.minimum.at(new, i, low)
+            np.minimum.at(new, j, low)
+            new = new[new]
+            if np.array_equal(new, labels):
+                break
+            labels = new
+    return labels[inverse.ravel()]
+
+
+def find_similar_images(paths, threshold=6, hash_name="phash", workers=None, progress=None):
+    """
+    近重复检测：进程池计算感知哈希，再按汉明距离聚类
+    
+    :param paths: 图像路径列表
+    :param threshold: 汉明距离阈值（64 位中不同的位数）
+    :param hash_name: "phash" 或 "dhash"
+    :param progress: 可选回调 progress(done, total)
+    :return: {"clusters": [[Path, ...], ...]（≥2 张的组，保持 paths 中的顺序）, "digests": {Path: 摘要}, "failed": [Path]}
+    """
+    paths = list(paths)
+    hashes, digests, ok, failed = [], {}, [], []
+    column = 1 if hash_name == "phash" else 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(_safe_image_hashes, map(str, paths), chunksize=64)
+        for n, (path, result) in enumerate(zip(paths, results), 1):
+            if result is None:
+                failed.append(path)
+            else:
+                hashes.append(result[column])
+                digests[path] = result[2]
+                ok.append(path)
+            if progress is not None:
+                progress(n, len(paths))
+    groups = {}
+    if ok:
+        for path, label in zip(ok, cluster_hashes(hashes, threshold)):
+            groups.setdefault(int(label), []).append(path)
+    clusters = [members for members in groups.values() if len(members) > 1]
+    return {"clusters": clusters, "digests": digests, "failed": failed}
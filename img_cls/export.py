@@ -0,0 +1,243 @@
+"""
+训练数据导出：类别目录（或标注清单）→ WebDataset 风格的 tar 分片
+
+- 每个样本在分片中为 {key}.{扩展名}（图像）+ {key}.cls（类别编号）+ {key}.json（来源等元数据）
+- 图像逐个流式写入：不重新编码时原样读出写入 tar，重新编码时在进程池中进行且在途任务数有上限，
+  内存占用与数据集大小无关（只保存文件路径列表）
+- 输出目录中 index.jsonl 逐样本记录所在分片与偏移，dataset.json 记录类别表、划分与分片清单
+"""
+import heapq
+import io
+import json
+import os
+import tarfile
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+from .scan import IMAGE_EXTS
+
+ENCODE_FORMATS = {"jpeg": ("JPEG", "jpg"), "png": ("PNG", "png"), "webp": ("WEBP", "webp")}
+
+
+def list_samples(image_dir, categories, labels=None):
+    """
+    待导出的样本 {类别: [Path, ...]}（按文件名排序，保证多次导出结果一致）
+    
+    :param labels: 可选 {路径: 类别}（仅标注模式的标注清单）；为 None 时读取 image_dir 下的类别目录，
+                   跳过空文件（共享模式下其他实例尚未替换的占位文件）
+    """
+    by_category = {category: [] for category in categories}
+    if labels is not None:
+        for path, category in labels.items():
+            if category in by_category:
+                by_category[category].append(Path(path))
+    else:
+        for category in categories:
+            folder = Path(image_dir) / category
+            if not folder.is_dir():
+                continue
+            with os.scandir(folder) as it:
+                by_category[category] = [
+                    Path(entry.path) for entry in it
+                    if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTS
+                    and entry.stat().st_size > 0
+                ]
+    for paths in by_category.values():
+        paths.sort()
+    return by_category
+
+
+def mix_samples(by_category, val_ratio=0.0):
+    """
+    按比例交错各类别（每个分片中的类别分布与整体一致），并按类别分层划分 train / val
+    
+    第 j 张（共 n 张）的排序键为 (j + 0.5) / n，用 heapq.merge 归并；
+    val：每个类别内按顺序每隔 1 / val_ratio 张取一张，各类别的 val 比例都等于 val_ratio
+    
+    :return: 生成器 (Path, 类别, "train" / "val")
+    """
+    def stream(category, paths):
+        n = len(paths)
+        for j, path in enumerate(paths):
+            split = "val" if int((j + 1) * val_ratio) > int(j * val_ratio) else "train"
+            yield (j + 0.5) / n, category, path, split
+    
+    streams = [stream(category, paths) for category, paths in by_category.items() if paths]
+    for _, category, path, split in heapq.merge(*streams):
+        yield path, category, split
+
+
+def encode_image(image_path, max_edge=None, fmt="jpeg", quality=90):
+    """缩放（最长边不超过 max_edge）并重新编码，返回 (字节, 扩展名)（在进程池中执行，必须是模块级函数）"""
+    pil_format, ext = ENCODE_FORMATS[fmt]
+    with Image.open(image_path) as img:
+        if max_edge:
+            img.draft("RGB", (max_edge, max_edge))  # JPEG 直接按比例低分辨率解码
+        keep_alpha = pil_format != "JPEG" and img.mode in ("RGBA", "LA", "P")
+        img = img.convert("RGBA" if keep_alpha else "RGB")
+    if max_edge:
+        img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, pil_format, quality=quality)
+    return buf.getvalue(), ext
+
+
+def _safe_encode_image(args):
+    try:
+        return encode_image(*args), None
+    except Exception as e:
+        return None, str(e)
+
+
+class _ShardWriter:
+    """一个划分（train / val）的分片写入：达到样本数或字节数上限时换下一个分片；先写 .tmp，写完再改名"""
+    
+    def __init__(self, out_dir, prefix, split, shard_size, shard_bytes):
+        self.out_dir = Path(out_dir)
+        self.prefix = prefix
+        self.split = split
+        self.shard_size = shard_size
+        self.shard_bytes = shard_bytes
+        self.shards = []  # [{"name", "samples", "bytes"}]
+        self.samples = 0
+        self._tar = None
+        self._tmp = None
+    
+    def add(self, key, members):
+        """members: [(文件名后缀, 字节)]，返回 (分片名, 样本在分片中的偏移)"""
+        if self._tar is None or self._current["samples"] >= self.shard_size or \
+                self._current["bytes"] >= self.shard_bytes:
+            self._open_next()
+        shard = self._current
+        offset = self._tar.offset
+        for ext, data in members:
+            info = tarfile.TarInfo(f"{key}.{ext}")
+            info.mtime = int(time.time())
+            info.size = len(data)
+            self._tar.addfile(info, io.BytesIO(data))
+            shard["bytes"] += info.size
+        shard["samples"] += 1
+        self.samples += 1
+        return shard["name"], offset
+    
+    def close(self):
+        if self._tar is not None:
+            self._tar.close()
+            os.replace(self._tmp, self.out_dir / self._current["name"])
+            self._tar = None
+    
+    @property
+    def _current(self):
+        return self.shards[-1]
+    
+    def _open_next(self):
+        self.close()
+        name = f"{self.prefix}-{self.split}-{len(self.shards):06d}.tar"
+        self.shards.append({"name": name, "samples": 0, "bytes": 0})
+        self._tmp = self.out_dir / (name + ".tmp")
+        self._tar = tarfile.open(self._tmp, "w", format=tarfile.PAX_FORMAT)
+
+
+def export_shards(by_category, out_dir, val_ratio=0.0, shard_size=1000, shard_bytes=1 << 30,
+                  max_edge=None, fmt=None, quality=90, workers=None, prefix="data", progress=None):
+    """
+    流式导出为 tar 分片
+    
+    :param by_category: list_samples() 的结果
+    :param max_edge: 最长边上限（像素）
+    :param fmt: 重新编码的格式（ENCODE_FORMATS）；max_edge / fmt 任一不为 None 时在进程池中处理（fmt 默认 jpeg），
+                否则原样拷贝源文件
+    :param progress: 可选回调 progress(done, total)
+    :return: 汇总 {"samples": {split: 数量}, "per_category": {split: {类别: 数量}}, "failed": [(路径, 错误)],
+             "bytes", "seconds"}
+    """
+    start = time.perf_counter()
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    categories = list(by_category)
+    class_index = {category: i for i, category in enumerate(categories)}
+    total = sum(len(paths) for paths in by_category.values())
+    writers = {}
+    counts = {}
+    failed = []
+    reencode = max_edge is not None or fmt is not None
+    fmt = fmt or "jpeg"
+    samples = mix_samples(by_category, val_ratio)
+    
+    def write(path, category, split, data, ext):
+        writer = writers.get(split)
+        if writer is None:
+            writer = writers[split] = _ShardWriter(out_dir, prefix, split, shard_size, shard_bytes)
+        split_counts = counts.setdefault(split, Counter())
+        key = f"{writer.samples:08d}"  # 不含 "."：WebDataset 以第一个 "." 分隔键与后缀
+        meta = {"category": category, "source": str(path)}
+        shard, offset = writer.add(key, [
+            (ext, data),
+            ("cls", str(class_index[category]).encode()),
+            ("json", json.dumps(meta, ensure_ascii=False).encode("utf-8")),
+        ])
+        split_counts[category] += 1
+        index.write(json.dumps({"key": key, "split": split, "shard": shard, "offset": offset, **meta},
+                               ensure_ascii=False) + "\n")
+    
+    done = 0
+    with open(out_dir / "index.jsonl", "w", encoding="utf-8") as index:
+        if not reencode:
+            for path, category, split in samples:
+                try:
+                    # 整个文件读出后再写入：读取失败不会在 tar 中留下半个成员
+                    write(path, category, split, path.read_bytes(), path.suffix.lower().lstrip("."))
+                except OSError as e:
+                    failed.append((str(path), str(e)))
+                done += 1
+                if progress is not None:
+                    progress(done, total)
+        else:
+            # 按提交顺序取结果，在途任务不超过 workers * 4 个：输出顺序确定，内存占用有上限
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                limit = (workers or os.cpu_count() or 1) * 4
+                pending = deque()
+                samples = iter(samples)
+                while True:
+                    while len(pending) < limit:
+                        sample = next(samples, None)
+                        if sample is None:
+                            break
+                        args = (str(sample[0]), max_edge, fmt, quality)
+                        pending.append((sample, pool.submit(_safe_encode_image, args)))
+                    if not pending:
+                        break
+                    (path, category, split), future = pending.popleft()
+                    payload, error = future.result()
+                    if error is None:
+                        write(path, category, split, *payload)
+                    else:
+                        failed.append((str(path), error))
+                    done += 1
+                    if progress is not None:
+                        progress(done, total)
+        for writer in writers.values():
+            writer.close()
+    
+    summary = {
+        "samples": {split: sum(c.values()) for split, c in counts.items()},
+        "per_category": {split: dict(c) for split, c in counts.items()},
+        "failed": failed,
+        "bytes": sum(shard["bytes"] for writer in writers.values() for shard in writer.shards),
+        "seconds": time.perf_counter() - start,
+    }
+    with open(out_dir / "dataset.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "categories": categories,
+            "val_ratio": val_ratio,
+            "format": fmt if reencode else "original",
+            "max_edge": max_edge,
+            "shards": {split: writer.shards for split, writer in writers.items()},
+            "samples": summary["samples"],
+            "per_category": summary["per_category"],
+        }, f, ensure_ascii=False, indent=2)
+    return summary
@@ -0,0 +1,696 @@
+"""文件移动 / 复制、操作日志与标注清单"""
+import errno
+import json
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from .trace import TRACER
+
+
+def move_file(src, dst, placeholder=False):
+    """
+    移动单个文件：同卷直接 rename，跨卷（如 NAS）才退回复制 + 删除；不覆盖已有文件
+    
+    :param placeholder: dst 是 NameIndex 共享模式下预先创建的空占位文件，直接替换它
+    """
+    if placeholder:
+        if os.path.getsize(dst) != 0:
+            raise FileExistsError(errno.EEXIST, "目标文件已存在", dst)
+    elif os.path.exists(dst):
+        raise FileExistsError(errno.EEXIST, "目标文件已存在", dst)
+    with TRACER.span("move"):
+        try:
+            if placeholder:
+                os.replace(src, dst)
+            else:
+                os.rename(src, dst)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            shutil.move(src, dst)
+
+
+def transfer_file(src, dst, mode="move", placeholder=False):
+    """
+    按 mode 把 src 放到 dst（不覆盖已有文件）：move / copy / hardlink（无法硬链接时退回复制）
+    
+    复制先写到 dst.part 再改名：中途退出时 dst 要么不存在、要么是完整的副本
+    
+    :param placeholder: 同 move_file，dst 是 NameIndex 共享模式下预先创建的空占位文件，直接替换它
+    """
+    if mode == "move":
+        move_file(src, dst, placeholder)
+        return
+    if placeholder:
+        if os.path.getsize(dst) != 0:
+            raise FileExistsError(errno.EEXIST, "目标文件已存在", dst)
+    elif os.path.exists(dst):
+        raise FileExistsError(errno.EEXIST, "目标文件已存在", dst)
+    part = f"{dst}.part"
+    try:
+        if mode == "hardlink":
+            try:
+                # 有占位文件时先链接到 .part 再替换占位文件（os.link 不覆盖已有文件）
+                with TRACER.span("hardlink"):
+                    os.link(src, part if placeholder else dst)
+                if placeholder:
+                    os.replace(part, dst)
+                return
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.ENOTSUP):
+                    raise
+        with TRACER.span("copy"):
+            shutil.copy2(src, part)
+        os.replace(part, dst)
+    except BaseException:
+        if os.path.exists(part):
+            os.remove(part)
+        raise
+
+
+class NameIndex:
+    """
+    目标目录已占用文件名的内存索引：重名时直接分配 `_1`、`_2` 后缀，每个目录只扫描一次（线程安全）
+    
+    共享模式（多个实例同时向同一目录移动）：内存索引看不到其他实例分配的文件名，
+    分配时再以 O_CREAT | O_EXCL 创建空的占位文件，创建失败说明已被占用，换下一个序号
+    """
+    
+    def __init__(self, shared=False):
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._names = {}  # {目录: 已占用文件名集合}
+    
+    def reserve(self, dst_dir, name):
+        """为 name 在 dst_dir 中分配一个未占用的文件名并占用，返回目标路径"""
+        stem, suffix = os.path.splitext(name)
+        candidate, counter = name, 1
+        with self._lock:
+            names = self._index(dst_dir)
+            if self.shared:
+                os.makedirs(dst_dir, exist_ok=True)
+            while True:
+                # 防止重名覆盖（加序号），单实例时只查内存索引
+                while candidate in names:
+                    candidate = f"{stem}_{counter}{suffix}"
+                    counter += 1
+                names.add(candidate)
+                if not self.shared or self._create_placeholder(Path(dst_dir) / candidate):
+                    break
+        return Path(dst_dir) / candidate
+    
+    def reserve_exact(self, dst):
+        """
+        占用指定的目标路径（续做上次登记的操作）
+        
+        共享模式下占位文件已不在时重新创建；目标已被其他实例占用（非空文件或抢先创建了占位文件）时返回 False
+        """
+        with self._lock:
+            self._index(os.path.dirname(dst)).add(os.path.basename(dst))
+        if not self.shared:
+            return True
+        try:
+            return os.path.getsize(dst) == 0
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            return self._create_placeholder(Path(dst))
+    
+    def release(self, dst, placeholder=False):
+        """释放文件名；placeholder=True 时同时删除尚未被替换的占位文件（移动取消 / 失败）"""
+        with self._lock:
+            self._index(os.path.dirname(dst)).discard(os.path.basename(dst))
+        if placeholder and self.shared:
+            try:
+                if os.path.getsize(dst) == 0:
+                    os.remove(dst)
+            except OSError:
+                pass
+    
+    @staticmethod
+    def _create_placeholder(path):
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            return False
+    
+    def _index(self, dst_dir):
+        key = str(dst_dir)
+        names = self._names.get(key)
+        if names is None:
+            try:
+                with os.scandir(dst_dir) as it:
+                    names = {entry.name for entry in it}
+            except FileNotFoundError:
+                names = set()
+            self._names[key] = names
+        return names
+
+
+class FileMover:
+    """
+    后台移动文件：分类操作立即返回，由工作线程按批执行移动
+    
+    - 目标文件名由 NameIndex 在内存中分配，不必为重名逐个探测文件系统
+    - 每个操作先写入追加式日志（image_dir/.img_cls_journal.jsonl），崩溃后重新打开目录时继续执行未完成的移动
+    - 撤回同样作为日志中的一个操作执行，可连续多步撤回
+    - 多人共享目录时（owner 不为空）每个实例使用自己的日志，目标文件名用占位文件跨实例占用
+    """
+    JOURNAL_NAME = ".img_cls_journal.jsonl"
+    HISTORY_LIMIT = 100  # 日志压缩后保留的可撤回操作数
+    BATCH_SIZE = 64  # 每批最多执行的操作数（目录创建、日志落盘按批进行）
+    
+    def __init__(self, image_dir, on_done=None, owner=None):
+        """
+        :param image_dir: 图像目录（日志存放位置）
+        :param on_done: 可选回调 on_done(ops, dir_mtimes)，每批执行完后在工作线程中调用，ops 为成功的操作，
+                        dir_mtimes 为本批执行前各源 / 目标目录的 mtime {目录: mtime_ns}
+        :param owner: 共享模式下本实例的标识（LeaseManager.owner）
+        """
+        self.image_dir = Path(image_dir)
+        journal_name = self.JOURNAL_NAME if owner is None else self.JOURNAL_NAME.replace(".jsonl", f".{owner}.jsonl")
+        self.journal_path = self.image_dir / journal_name
+        self.on_done = on_done
+        self.failures = queue.Queue()  # 执行失败的操作，由 UI 线程轮询
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self.names = NameIndex(shared=owner is not None)
+        self._next_id = 1
+        self._journal = None
+        self._worker = None
+    
+    def recover(self):
+        """
+        读取日志：重新执行崩溃前未完成的操作，压缩日志并启动工作线程
+        
+        :return: (replayed, history)，replayed 为重新排队的操作，history 为可撤回的已完成移动（从旧到新）
+        """
+        ops = {}
+        if self.journal_path.exists():
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # 崩溃时写了一半的行
+                    ops.setdefault(record["id"], {}).update(record)
+        self._next_id = max(ops, default=0) + 1
+        
+        replayed = []
+        for op in ops.values():
+            if op.get("state") in ("pending", "running"):
+                if os.path.exists(op["src"]) and not self._target_taken(op):
+                    op["state"] = "pending"
+                    replayed.append(op)
+                elif self._target_taken(op):
+                    op["state"] = "done"
+                else:
+                    op["state"] = "failed"
+                    self.names.release(op["dst"], placeholder=True)
+        undone = {op["of"] for op in ops.values() if op.get("op") == "undo" and op.get("state") in ("done", "pending")}
+        history = [op for op in ops.values()
+                   if op.get("op") == "move" and op.get("state") == "done" and op["id"] not in undone]
+        history = history[-self.HISTORY_LIMIT:]
+        
+        # 压缩：只保留可撤回的历史和待执行的操作
+        tmp_path = self.journal_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for op in history + replayed:
+                f.write(json.dumps(op, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.journal_path)
+        
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._worker = threading.Thread(target=self._run, name="file-mover", daemon=True)
+        self._worker.start()
+        for op in replayed:
+            if op["op"] == "move":
+                self.names.reserve_exact(op["dst"])  # 撤回的目标是原位置，不占用类别目录中的文件名
+        for op in replayed:
+            self._queue.put(op)
+        return replayed, history
+    
+    def _target_taken(self, op):
+        """目标已存在（共享模式下尚未被替换的空占位文件不算）"""
+        if not os.path.exists(op["dst"]):
+            return False
+        return not (self.names.shared and op["op"] == "move" and os.path.getsize(op["dst"]) == 0)
+    
+    def move(self, src, dst_dir):
+        """登记一次移动并立即返回操作记录（dict），目标文件名此时已确定"""
+        with self._lock:
+            dst = self.names.reserve(dst_dir, Path(src).name)
+            op = {"id": self._next_id, "op": "move", "src": str(src), "dst": str(dst), "state": "pending"}
+            self._next_id += 1
+            self._log(op)
+        self._queue.put(op)
+        return op
+    
+    def undo(self, op):
+        """
+        撤回一次移动：尚未执行的直接取消（返回 None），否则排队一个反向移动并返回该操作
+        """
+        with self._lock:
+            self.names.release(op["dst"], placeholder=op["state"] == "pending")
+            if op["state"] == "pending":
+                op["state"] = "cancelled"
+                self._log({"id": op["id"], "state": "cancelled"})
+                return None
+            rev = {"id": self._next_id, "op": "undo", "of": op["id"], "src": op["dst"], "dst": op["src"],
+                   "state": "pending"}
+            self._next_id += 1
+            self._log(rev)
+        self._queue.put(rev)
+        return rev
+    
+    def pending_count(self):
+        return self._queue.qsize()
+    
+    def close(self, wait=True):
+        """停止工作线程；wait=True 时先执行完队列中的操作"""
+        if self._worker is None:
+            return
+        self._queue.put(None)
+        if wait:
+            self._worker.join()
+        with self._lock:
+            self._journal.close()
+        self._worker = None
+    
+    def _run(self):
+        stop = False
+        while not stop:
+            op = self._queue.get()
+            if op is None:
+                break
+            batch = [op]
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    op = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if op is None:
+                    stop = True
+                    break
+                batch.append(op)
+            self._execute(batch)
+    
+    def _execute(self, batch):
+        made_dirs = set()
+        done = []
+        # 执行前先记下涉及目录的 mtime：会话索引据此判断目录在本批之前是否已被外部修改
+        dir_mtimes = {}
+        if self.on_done is not None:
+            for op in batch:
+                for dir_path in (os.path.dirname(op["src"]), os.path.dirname(op["dst"])):
+                    if dir_path not in dir_mtimes:
+                        try:
+                            dir_mtimes[dir_path] = os.stat(dir_path).st_mtime_ns
+                        except OSError:
+                            dir_mtimes[dir_path] = None
+        for op in batch:
+            with self._lock:
+                if op["state"] != "pending":
+                    continue  # 已被撤回取消
+                op["state"] = "running"
+            try:
+                dst_dir = os.path.dirname(op["dst"])
+                if dst_dir not in made_dirs:
+                    os.makedirs(dst_dir, exist_ok=True)
+                    made_dirs.add(dst_dir)
+                move_file(op["src"], op["dst"], placeholder=self.names.shared and op["op"] == "move")
+                state = "done"
+            except Exception as e:
+                op["error"] = str(e)
+                state = "failed"
+            with self._lock:
+                op["state"] = state
+                self._log({"id": op["id"], "state": state})
+                if state == "failed" and op["op"] == "move":
+                    self.names.release(op["dst"], placeholder=True)
+            if state == "failed":
+                self.failures.put(op)
+            else:
+                done.append(op)
+        # 一批操作只落盘一次
+        with self._lock:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+        if self.on_done is not None and done:
+            try:
+                self.on_done(done, dir_mtimes)
+            except Exception as e:
+                print(f"[Error] FileMover.on_done: {e}")
+    
+    def _log(self, record):
+        self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._journal.flush()
+
+
+class LabelManifest:
+    """
+    仅标注模式的标注清单（image_dir/.img_cls_labels.sqlite）：只记录 (文件, 类别)，不移动文件
+    
+    重新标注只是更新一行；apply() 再一次性把全部标注批量移动 / 复制 / 硬链接到类别目录，
+    已应用的行保留（applied = 1），重复导入同一份外部清单时不会再次执行；
+    共享模式下（owner 不为空）每个实例只写自己的清单（.img_cls_labels.<owner>.sqlite）；
+    逐张标注（set）由后台线程批量提交，各类别的待应用数量保存在内存中
+    """
+    DB_NAME = ".img_cls_labels.sqlite"
+    APPLY_MODES = ("move", "copy", "hardlink")
+    # 批量写入：类别未变的行保持原状（保留上次 apply 登记的目标路径以便续做）
+    _UPSERT = (
+        "INSERT INTO labels (rel, category, updated) VALUES (?, ?, ?) "
+        "ON CONFLICT(rel) DO UPDATE SET category = excluded.category, dst = NULL, applied = 0, "
+        "updated = excluded.updated WHERE labels.category != excluded.category"
+    )
+    # 逐张标注：重新标注为同一类别也重置为待应用
+    _SET = (
+        "INSERT INTO labels (rel, category, updated) VALUES (?, ?, ?) "
+        "ON CONFLICT(rel) DO UPDATE SET category = excluded.category, dst = NULL, applied = 0, "
+        "updated = excluded.updated"
+    )
+    
+    def __init__(self, image_dir, owner=None):
+        self.image_dir = Path(image_dir)
+        self._lock = threading.Lock()
+        db_name = self.DB_NAME if owner is None else self.DB_NAME.replace(".sqlite", f".{owner}.sqlite")
+        self._db_path = self.image_dir / db_name
+        # 单实例用 WAL：后台写线程提交时 UI 线程的查询不被阻塞（关闭时删除 -wal / -shm 会改变目录 mtime，
+        # 由调用方报告给会话索引）；共享模式下清单多在网络共享上，WAL 依赖的共享内存不可靠，仍用回滚日志
+        self._journal_mode = "WAL" if owner is None else "PERSIST"
+        self._conn = sqlite3.connect(self._db_path, check_same_thread=False)
+        self._conn.execute(f"PRAGMA journal_mode={self._journal_mode}")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # dst：apply 时登记的目标路径（崩溃后据此判断是否已完成）；applied：copy/hardlink 已完成
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS labels ("
+            "rel TEXT PRIMARY KEY, category TEXT NOT NULL, dst TEXT, applied INTEGER NOT NULL DEFAULT 0, updated REAL)"
+        )
+        self._conn.commit()
+        # 待应用的标注数 {类别: 数量}：只在打开时统计一次，之后随标注 / 撤回 / 应用更新
+        self._counts = Counter()
+        self._recount()
+        # 已交给写线程、尚未提交的标注 {rel: 类别}，查询时优先于数据库
+        self._staged = {}
+        self._writes = queue.Queue()
+        self._writer = None
+    
+    def get(self, path):
+        rel = self._rel(path)
+        with self._lock:
+            if rel in self._staged:
+                return self._staged[rel]
+            row = self._conn.execute("SELECT category FROM labels WHERE rel = ?", (rel,)).fetchone()
+        return row[0] if row else None
+    
+    def get_many(self, paths):
+        """批量查询 {路径: 类别}，没有标注的路径省略"""
+        self.flush()
+        names = {self._rel(path): path for path in paths}
+        keys = list(names)
+        result = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT rel, category FROM labels WHERE rel IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+                for rel, category in rows:
+                    result[names[rel]] = category
+        return result
+    
+    def set(self, path, category):
+        """
+        记录标注，返回之前的类别（用于撤回）
+        
+        不等待写入：由后台线程攒批提交，其余读写清单的方法会先等它写完（见 flush）
+        """
+        rel = self._rel(path)
+        with self._lock:
+            if rel in self._staged:
+                prev, pending = self._staged[rel], True
+            else:
+                prev, pending = self._states([rel]).get(rel, (None, False))
+            self._staged[rel] = category
+            if pending:
+                self._counts[prev] -= 1
+            self._counts[category] += 1
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="label-writer", daemon=True)
+                self._writer.start()
+        self._writes.put((rel, category, time.time()))
+        return prev
+    
+    def set_many(self, labels, commit=True):
+        """
+        批量导入 [(路径, 类别), ...]（一个事务）：类别未变的行保持原状，保留上次 apply 登记的目标路径以便续做
+        
+        :param commit: False 时不提交，之后可用 discard_changes() 撤销（dry-run）
+        """
+        self.flush()
+        now = time.time()
+        rows = [(self._rel(path), category, now) for path, category in labels]
+        with self._lock:
+            self._count_upserts(rows)
+            self._conn.executemany(self._UPSERT, rows)
+            if commit:
+                self._conn.commit()
+    
+    def discard_changes(self):
+        """撤销尚未提交的修改"""
+        with self._lock:
+            self._conn.rollback()
+        self._recount()
+    
+    def flush(self):
+        """等待后台线程提交已记录的逐张标注"""
+        self._writes.join()
+    
+    def restore(self, path, category):
+        """撤回：恢复为之前的类别，None 表示删除标注"""
+        self.restore_many({path: category})
+    
+    def restore_many(self, labels):
+        """批量撤回 {路径: 之前的类别}（一个事务），None 表示删除标注"""
+        self.flush()
+        now = time.time()
+        rows = [(self._rel(path), category, now) for path, category in labels.items()]
+        with self._lock:
+            self._count_upserts(rows)
+            self._conn.executemany(self._UPSERT, [row for row in rows if row[1] is not None])
+            self._conn.executemany("DELETE FROM labels WHERE rel = ?", [(row[0],) for row in rows if row[1] is None])
+            self._conn.commit()
+    
+    def labeled_paths(self):
+        """有待应用标注的文件 {绝对路径字符串}"""
+        return set(self.labels())
+    
+    def labels(self):
+        """待应用的标注 {绝对路径字符串: 类别}"""
+        self.flush()
+        root = str(self.image_dir)
+        with self._lock:
+            rows = self._conn.execute("SELECT rel, category FROM labels WHERE applied = 0").fetchall()
+        return {os.path.normpath(os.path.join(root, rel)): category for rel, category in rows}
+    
+    def counts(self):
+        """待应用的标注数 {类别: 数量}（内存中的计数，不查询数据库）"""
+        with self._lock:
+            return {category: n for category, n in self._counts.items() if n > 0}
+    
+    def plan(self, mode="move", names=None):
+        """
+        为待应用的标注分配目标路径（只读清单，除共享模式的占位文件外不触碰文件），apply() 与 dry-run 共用
+        
+        :return: (finished, missing, planned)：上次中途退出前已完成的 [(rel, 目标路径), ...]、源文件不存在的路径、
+                 待执行的 [(rel, 源路径, 目标路径), ...]
+        """
+        names = names or NameIndex()
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute("SELECT rel, category, dst FROM labels WHERE applied = 0").fetchall()
+        
+        finished, missing, planned = [], [], []
+        for rel, category, dst in rows:
+            src = self.image_dir / rel
+            if dst and self._finished(src, dst, mode, names.shared):
+                finished.append((rel, dst))  # 上次 apply 中途退出前已完成
+                continue
+            if not src.exists():
+                missing.append(str(src))
+                continue
+            if dst and not names.reserve_exact(dst):
+                dst = None  # 上次登记的目标已被其他实例占用：重新分配
+            if not dst:
+                dst = str(names.reserve(self.image_dir / category, src.name))
+            planned.append((rel, str(src), dst))
+        return finished, missing, planned
+    
+    def apply(self, mode="move", workers=4, names=None, progress=None):
+        """
+        批量执行标注：按 mode 把文件放入 image_dir/<类别>/
+        
+        先在一个事务中登记全部目标路径，再在线程池中并行执行，最后一次性更新清单
+        
+        :param mode: move / copy / hardlink
+        :param workers: 并行线程数
+        :param names: 共享的 NameIndex（与 FileMover 共用，避免两边分配到同一文件名）
+        :param progress: 可选回调 progress(done, total)，在工作线程中调用
+        :return: {"done": [源路径], "failed": [(源路径, 错误)], "missing": [源路径], "bytes": 已处理字节数,
+                  "seconds": 耗时}
+        """
+        if mode not in self.APPLY_MODES:
+            raise ValueError(f"未知的应用方式：{mode}")
+        start = time.perf_counter()
+        names = names or NameIndex()
+        finished, missing, planned = self.plan(mode, names)
+        with self._lock:
+            self._conn.executemany("UPDATE labels SET dst = ? WHERE rel = ?", [(d, rel) for rel, _, d in planned])
+            self._conn.commit()
+        for dst_dir in {os.path.dirname(d) for _, _, d in planned}:
+            os.makedirs(dst_dir, exist_ok=True)
+        if mode != "move" and not names.shared:  # 共享模式下不完整的旧副本已在 plan 中换了新文件名
+            for _, _, dst in planned:
+                if os.path.exists(dst):
+                    os.remove(dst)  # 上次登记的目标是不完整的副本（plan 已核对大小），重新复制
+        
+        done, failed, released, nbytes = list(finished), [], [], 0
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="apply") as executor:
+            futures = {executor.submit(self._transfer, src, dst, mode, names.shared): (rel, src, dst)
+                       for rel, src, dst in planned}
+            for i, future in enumerate(as_completed(futures), 1):
+                rel, src, dst = futures[future]
+                try:
+                    nbytes += future.result()
+                    done.append((rel, dst))
+                except Exception as e:
+                    failed.append((src, str(e)))
+                    # 释放文件名（共享模式下删除占位文件），下次重新分配
+                    names.release(dst, placeholder=True)
+                    released.append((rel, dst))
+                if progress is not None:
+                    progress(i, len(planned))
+        
+        # 只更新仍指向本次目标路径的行：执行期间被重新标注的行（dst 已清空）保持待应用
+        with self._lock:
+            self._conn.executemany("UPDATE labels SET applied = 1 WHERE rel = ? AND dst = ?", done)
+            self._conn.executemany("UPDATE labels SET dst = NULL WHERE rel = ? AND dst = ?", released)
+            self._conn.commit()
+        self._recount()
+        return {
+            "done": [str(self.image_dir / rel) for rel, _ in done],
+            "failed": failed,
+            "missing": missing,
+            "bytes": nbytes,
+            "seconds": time.perf_counter() - start,
+        }
+    
+    @staticmethod
+    def _finished(src, dst, mode, shared=False):
+        """
+        上次登记的 src → dst 是否已完成：move 要求源文件已不在，copy / hardlink 要求大小一致；
+        共享模式下空的目标只是尚未被替换的占位文件
+        """
+        try:
+            dst_size = os.path.getsize(dst)
+        except OSError:
+            return False
+        if shared and dst_size == 0:
+            return False
+        if mode == "move":
+            return not src.exists()
+        try:
+            return os.path.getsize(src) == dst_size
+        except OSError:
+            return True  # 源文件已被删除：无从核对，保留已有的副本
+    
+    @staticmethod
+    def _transfer(src, dst, mode, placeholder=False):
+        size = os.path.getsize(src)
+        transfer_file(src, dst, mode, placeholder)
+        return size
+    
+    def close(self):
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join()
+            self._writer = None
+        with self._lock:
+            self._conn.close()
+    
+    def _write_loop(self):
+        conn = sqlite3.connect(self._db_path)
+        conn.execute(f"PRAGMA journal_mode={self._journal_mode}")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        stop = False
+        while not stop:
+            rows = []
+            item = self._writes.get()
+            while True:
+                if item is None:
+                    stop = True
+                    break
+                rows.append(item)
+                try:
+                    item = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+            if rows:
+                # 一批标注一个事务
+                try:
+                    conn.executemany(self._SET, rows)
+                    conn.commit()
+                except sqlite3.Error as e:
+                    conn.rollback()
+                    print(f"[Error] LabelManifest: 写入 {len(rows)} 条标注失败：{e}")
+                with self._lock:
+                    for rel, category, _ in rows:
+                        if self._staged.get(rel) == category:
+                            del self._staged[rel]  # 之后又被重新标注的仍以内存中的为准
+            for _ in range(len(rows) + stop):
+                self._writes.task_done()
+        conn.close()
+    
+    def _states(self, rels):
+        """{rel: (类别, 是否待应用)}，没有标注的省略；调用方持有 _lock"""
+        result = {}
+        for start in range(0, len(rels), 500):
+            chunk = rels[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT rel, category, applied FROM labels WHERE rel IN ({','.join('?' * len(chunk))})", chunk)
+            for rel, category, applied in rows:
+                result[rel] = (category, not applied)
+        return result
+    
+    def _count_upserts(self, rows):
+        """按 _UPSERT / 删除（类别为 None）的规则更新内存计数；调用方持有 _lock"""
+        states = self._states(list({rel for rel, _, _ in rows}))
+        for rel, category, _ in rows:
+            prev, pending = states.get(rel, (None, False))
+            if category is not None and category == prev:
+                continue  # 类别未变：行保持原状
+            if pending:
+                self._counts[prev] -= 1
+            if category is None:
+                states.pop(rel, None)
+            else:
+                self._counts[category] += 1
+                states[rel] = (category, True)
+    
+    def _recount(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT category, COUNT(*) FROM labels WHERE applied = 0 GROUP BY category")
+            self._counts = Counter(dict(rows.fetchall()))
+    
+    def _rel(self, path):
+        path = Path(path)
+        try:
+            return path.relative_to(self.image_dir).as_posix()
+        except ValueError:
+            return path.as_posix()
@@ -0,0 +1,233 @@
+"""完整性预检：在进程池中校验文件头并完整解码一遍，找出空文件、截断或损坏的图像"""
+import os
+import queue
+import threading
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+OK = "ok"
+EMPTY = "empty"  # 0 字节
+TRUNCATED = "truncated"  # 文件头正常，数据不完整
+UNREADABLE = "unreadable"  # 无法识别的格式或损坏的数据
+CHECK_STATUS_NAMES = {EMPTY: "空文件", TRUNCATED: "截断", UNREADABLE: "无法读取"}
+
+_INFLIGHT = object()  # 优先项正在检查
+_SKIPPED = object()  # 优先项尚未出结果时顺序检查已经轮到它：出结果时再计数
+
+
+def check_image(image_path):
+    """
+    检查一个非空图像文件（在进程池中执行，必须是模块级函数），返回 (状态, 宽, 高, 模式, 说明)
+    
+    1. 读取文件头：格式、尺寸、模式
+    2. verify()：不解码像素的结构校验（如 PNG 各数据块的 CRC）
+    3. 完整解码一遍：截断的文件在这里报错；JPEG 用 draft 按 1/8 解码，仍要读完全部压缩数据，但快得多
+    """
+    try:
+        img = Image.open(image_path)
+    except Exception as e:
+        return _failure_status(e), None, None, None, str(e) or type(e).__name__
+    width, height = img.size
+    mode = img.mode
+    try:
+        with img:
+            img.verify()
+        with Image.open(image_path) as img:  # verify() 之后必须重新打开才能解码
+            if img.format == "JPEG":
+                img.draft(None, (1, 1))
+            img.load()
+    except Exception as e:
+        return _failure_status(e), width, height, mode, str(e) or type(e).__name__
+    return OK, width, height, mode, None
+
+
+def _failure_status(e):
+    """按异常区分截断（文件头或数据读到一半就结束）与其他损坏"""
+    message = str(e).lower()
+    truncated = isinstance(e, EOFError) or "truncated" in message or "broken data stream" in message
+    return TRUNCATED if truncated else UNREADABLE
+
+
+class IntegrityChecker:
+    """
+    后台完整性预检：submit() 的文件按顺序检查，prioritize() 给出的（即将浏览的）排在最前
+    
+    - 在进程池中解码，在途任务不超过 workers * 4 个；0 字节的文件不必解码
+    - 给定 SessionIndex 时结果按 (大小, mtime) 缓存，重新打开目录时未变化的文件直接取缓存
+    - 有问题的文件放入 bad 队列 (Path, 状态, 说明)，由 UI 线程轮询；正常文件的尺寸与模式只写入索引
+    """
+    LOOKUP_BATCH = 256  # 每次从队列取出、批量查询缓存的文件数
+    FLUSH_ROWS = 256  # 累积多少条结果写一次索引
+    
+    def __init__(self, index=None, workers=None):
+        self.index = index
+        self.workers = workers or os.cpu_count() or 1
+        self.bad = queue.Queue()
+        self.checked = 0  # 已检查的文件数（不含 prioritize 的重复）
+        self.total = 0
+        self.counts = Counter()  # {状态: 数量}
+        self.done = threading.Event()  # finish() 之后全部检查完毕
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._urgent = deque()
+        self._urgent_done = {}  # {路径: 状态}，已提前检查过的文件，顺序检查轮到它们时直接跳过
+        self._finished = False
+        self._stopped = False
+        self._rows = []
+        self._thread = threading.Thread(target=self._run, name="integrity-check", daemon=True)
+        self._thread.start()
+    
+    def submit(self, paths):
+        """追加待检查的文件（可随目录扫描分批提交）"""
+        paths = list(paths)
+        with self._cond:
+            self._pending.extend(paths)
+            self.total += len(paths)
+            self._cond.notify()
+    
+    def prioritize(self, paths):
+        """下一步先检查这些文件（即将浏览的图像），取代上一次的优先列表"""
+        with self._cond:
+            self._urgent = deque(paths)
+            self._cond.notify()
+    
+    def finish(self):
+        """不再提交新文件：队列处理完后设置 done"""
+        with self._cond:
+            self._finished = True
+            self._cond.notify()
+    
+    def stop(self, wait=False):
+        """停止检查；wait=True 时等待后台线程把已有结果写入索引后再返回（之后才能关闭索引）"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if wait:
+            self._thread.join()
+    
+    # ---------- 内部 ----------
+    
+    def _take(self):
+        """取出下一批待检查的文件 [(Path, 是否为优先项)]；没有时等待，停止后返回 None"""
+        with self._cond:
+            while True:
+                if self._stopped:
+                    return None
+                if self._urgent:
+                    batch = []
+                    while self._urgent and len(batch) < self.workers:
+                        key = str(self._urgent.popleft())
+                        if key not in self._urgent_done:
+                            self._urgent_done[key] = _INFLIGHT
+                            batch.append((Path(key), True))
+                    if batch:
+                        return batch
+                    continue
+                if self._pending:
+                    batch = []
+                    while self._pending and len(batch) < self.LOOKUP_BATCH:
+                        path = self._pending.popleft()
+                        key = str(path)
+                        if key in self._urgent_done:
+                            status = self._urgent_done.pop(key)
+                            if status is _INFLIGHT:
+                                self._urgent_done[key] = _SKIPPED
+                            else:
+                                self._tally(status)
+                            continue
+                        batch.append((path, False))
+                    if batch:
+                        return batch
+                    continue
+                return []
+    
+    def _wait(self):
+        """没有待检查的文件时等待新的提交；finish() 之后全部完成则设置 done"""
+        with self._cond:
+            if self._stopped or self._urgent or self._pending:
+                return
+            if self._finished:
+                self.done.set()
+            self._cond.wait()
+    
+    def _run(self):
+        pool = None
+        inflight = deque()  # (Path, 是否为优先项, size, mtime_ns, Future)
+        limit = self.workers * 4
+        try:
+            while True:
+                batch = self._take() if len(inflight) < limit else []
+                if batch is None:
+                    return
+                if batch:
+                    cached = self.index.cached_checks(p for p, _ in batch) if self.index is not None else {}
+                    for path, urgent in batch:
+                        try:
+                            st = os.stat(path)
+                        except OSError:
+                            self._count(path, urgent, None)  # 已被移走
+                            continue
+                        hit = cached.get(str(path))
+                        if hit is not None and hit[:2] == (st.st_size, st.st_mtime_ns):
+                            self._report(path, urgent, *hit[2:], cache=False)
+                        elif st.st_size == 0:
+                            self._report(path, urgent, EMPTY, None, None, None, "0 字节", size=0,
+                                         mtime_ns=st.st_mtime_ns)
+                        else:
+                            if pool is None:
+                                pool = ProcessPoolExecutor(max_workers=self.workers)
+                            future = pool.submit(check_image, str(path))
+                            inflight.append((path, urgent, st.st_size, st.st_mtime_ns, future))
+                    continue
+                if not inflight:
+                    self._flush()
+                    self._wait()
+                    continue
+                path, urgent, size, mtime_ns, future = inflight.popleft()
+                try:
+                    result = future.result()
+                except Exception as e:  # 工作进程崩溃（如解码器段错误）
+                    result = (UNREADABLE, None, None, None, str(e) or type(e).__name__)
+                self._report(path, urgent, *result, size=size, mtime_ns=mtime_ns)
+        finally:
+            self._flush()
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+    
+    def _tally(self, status):
+        self.checked += 1
+        if status is not None:
+            self.counts[status] += 1
+    
+    def _count(self, path, urgent, status):
+        """每个提交的文件只计数一次：优先项的结果留到顺序检查轮到它时再计"""
+        with self._cond:
+            if not urgent:
+                self._tally(status)
+                return
+            key = str(path)
+            if self._urgent_done.get(key) is _SKIPPED:
+                del self._urgent_done[key]
+                self._tally(status)
+            else:
+                self._urgent_done[key] = status
+    
+    def _report(self, path, urgent, status, width, height, mode, error, size=None, mtime_ns=None, cache=True):
+        self._count(path, urgent, status)
+        if status != OK:
+            self.bad.put((path, status, error))
+        if cache and self.index is not None:
+            self._rows.append((path, size, mtime_ns, status, width, height, mode, error))
+            if len(self._rows) >= self.FLUSH_ROWS:
+                self._flush()
+    
+    def _flush(self):
+        if self._rows and self.index is not None:
+            rows, self._rows = self._rows, []
+            try:
+                self.index.record_checks(rows)
+            except Exception as e:  # 索引已关闭（切换了目录）
+                print(f"[Error] record checks: {e}")
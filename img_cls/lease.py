@@ -0,0 +1,185 @@
+"""多人协作：在共享图像目录中用租约文件划分工作，各实例只处理自己领取的分片"""
+import getpass
+import json
+import os
+import queue
+import re
+import socket
+import threading
+import time
+import zlib
+from pathlib import Path
+
+
+def default_owner():
+    """实例标识：主机名 + 用户名（重启后不变，可以接回自己崩溃前的租约与操作日志）"""
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = "user"
+    return re.sub(r"[^\w.-]", "_", f"{socket.gethostname()}-{user}")
+
+
+class LeaseManager:
+    """
+    分片租约（image_dir/.img_cls_leases/）
+    
+    - 文件按 crc32(文件名) % chunks 分到固定的分片，各实例看到的划分一致，不需要协调进程
+    - 领取分片 = 以 O_CREAT | O_EXCL 创建 chunk_NNN.lease，只有一个实例能成功
+    - 后台线程定期更新租约文件的 mtime 作为心跳；超过 ttl 秒没有心跳的租约可被其他实例接管
+      （接管时先以 O_EXCL 创建 .steal 锁，避免两个实例同时接管）
+    - 自己的租约被接管（例如休眠超时）时，分片编号放入 lost 队列，由 UI 线程轮询后隐藏这些图像
+    
+    过期判断用的是共享目录上的文件 mtime，各机器的时钟偏差应远小于 ttl；
+    同一台机器上同一用户开多个实例时需用不同的 owner
+    """
+    DIR_NAME = ".img_cls_leases"
+    
+    def __init__(self, image_dir, chunks=64, ttl=120, owner=None):
+        self.dir = Path(image_dir) / self.DIR_NAME
+        self.dir.mkdir(exist_ok=True)
+        self.chunks = chunks
+        self.ttl = ttl
+        self.owner = owner or default_owner()
+        self.lost = queue.Queue()  # 被其他实例接管的分片
+        self._lock = threading.Lock()
+        self._owned = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, name="lease-heartbeat", daemon=True)
+        self._thread.start()
+    
+    def chunk_of(self, path):
+        return zlib.crc32(os.path.basename(str(path)).encode("utf-8", "surrogateescape")) % self.chunks
+    
+    def owns(self, path):
+        return self.chunk_of(path) in self._owned
+    
+    @property
+    def owned(self):
+        with self._lock:
+            return set(self._owned)
+    
+    def claim(self, wanted=None, count=1):
+        """
+        再领取最多 count 个分片（只在 wanted 中挑选，None 表示全部），返回新领取的分片编号列表
+        
+        从按 owner 错开的位置开始尝试，几个实例同时启动时不会都去抢同一个分片
+        """
+        candidates = sorted(set(range(self.chunks) if wanted is None else wanted) - self.owned)
+        if not candidates:
+            return []
+        start = zlib.crc32(self.owner.encode()) % len(candidates)
+        claimed = []
+        for chunk in candidates[start:] + candidates[:start]:
+            if len(claimed) >= count:
+                break
+            if self._acquire(chunk):
+                claimed.append(chunk)
+        with self._lock:
+            self._owned.update(claimed)
+        return claimed
+    
+    def release(self, chunks):
+        """归还分片（处理完毕或退出时）；已被接管的不删除"""
+        for chunk in list(chunks):
+            with self._lock:
+                self._owned.discard(chunk)
+            path = self._path(chunk)
+            if self._read_owner(path) == self.owner:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+    
+    def active_owners(self):
+        """当前持有未过期租约的实例 {owner: 分片数}（含自己）"""
+        owners = {}
+        with os.scandir(self.dir) as it:
+            for entry in it:
+                if entry.name.endswith(".lease") and not self._expired(entry.path):
+                    owner = self._read_owner(entry.path)
+                    if owner is not None:
+                        owners[owner] = owners.get(owner, 0) + 1
+        return owners
+    
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=1)
+        self.release(self.owned)
+    
+    # ---------- 内部 ----------
+    
+    def _path(self, chunk):
+        return self.dir / f"chunk_{chunk:03d}.lease"
+    
+    def _acquire(self, chunk):
+        path = self._path(chunk)
+        record = json.dumps({"owner": self.owner, "host": socket.gethostname(), "pid": os.getpid(),
+                             "since": time.time()}).encode()
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if self._read_owner(path) == self.owner:
+                os.utime(path)  # 崩溃前自己持有的租约，直接接回
+                return True
+            return self._steal(path, record)
+        with os.fdopen(fd, "wb") as f:
+            f.write(record)
+        return True
+    
+    def _steal(self, path, record):
+        """接管过期租约：.steal 锁保证同一时刻只有一个实例在接管，拿到锁后再确认一次仍然过期"""
+        if not self._expired(path):
+            return False
+        lock = path.with_suffix(".steal")
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if self._expired(lock):
+                try:
+                    os.remove(lock)  # 接管中途崩溃留下的锁
+                except OSError:
+                    pass
+            return False
+        os.close(fd)
+        try:
+            if not self._expired(path):
+                return False
+            tmp = path.with_name(f"{path.name}.{self.owner}.tmp")
+            with open(tmp, "wb") as f:
+                f.write(record)
+            os.replace(tmp, path)
+            return True
+        finally:
+            try:
+                os.remove(lock)
+            except OSError:
+                pass
+    
+    def _expired(self, path):
+        try:
+            return time.time() - os.stat(path).st_mtime > self.ttl
+        except FileNotFoundError:
+            return False
+    
+    @staticmethod
+    def _read_owner(path):
+        try:
+            with open(path, "rb") as f:
+                return json.loads(f.read()).get("owner")
+        except (OSError, ValueError):
+            return None
+    
+    def _heartbeat(self):
+        while not self._stop.wait(self.ttl / 4):
+            for chunk in self.owned:
+                path = self._path(chunk)
+                if self._read_owner(path) != self.owner:
+                    with self._lock:
+                        self._owned.discard(chunk)
+                    self.lost.put(chunk)
+                    continue
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
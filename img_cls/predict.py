@@ -0,0 +1,401 @@
+"""k-NN 预标注：从已分好类的图像学习，预测其余图像的类别（纯 CPU，NumPy 批量计算）"""
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from .scan import IMAGE_EXTS
+
+
+FEATURE_SIDE = 32  # 特征从 32×32 的缩略像素计算
+HIST_BINS = 4  # 颜色直方图每个通道的分箱数（4×4×4 = 64 维）
+EMBED_SIDE = 8  # 降采样像素嵌入：8×8 亮度 = 64 维
+FEATURE_DIM = HIST_BINS ** 3 + EMBED_SIDE ** 2
+
+
+def load_pixels(image_path, side=FEATURE_SIDE):
+    """解码为 side×side 的 RGB 像素字节（在进程池中执行，必须是模块级函数）"""
+    with Image.open(image_path) as img:
+        img.draft("RGB", (side * 2, side * 2))  # JPEG 直接低分辨率解码
+        img = img.convert("RGB")
+    return img.resize((side, side), Image.Resampling.BILINEAR).tobytes()
+
+
+def _safe_load_pixels(image_path):
+    try:
+        return load_pixels(image_path)
+    except Exception:
+        return None
+
+
+def features_from_pixels(pixels):
+    """
+    批量计算特征：颜色直方图（开方，Hellinger）+ 降采样亮度（去均值）
+    
+    :param pixels: (n, FEATURE_SIDE, FEATURE_SIDE, 3) uint8 数组
+    :return: (n, FEATURE_DIM) float32，每行 L2 范数为 1，余弦相似度即点积
+    """
+    n = len(pixels)
+    flat = pixels.reshape(n, -1, 3)
+    q = (flat >> (8 - (HIST_BINS - 1).bit_length())).astype(np.int32)
+    bins = (q[..., 0] * HIST_BINS + q[..., 1]) * HIST_BINS + q[..., 2] + (np.arange(n) * HIST_BINS ** 3)[:, None]
+    hist = np.bincount(bins.ravel(), minlength=n * HIST_BINS ** 3).reshape(n, -1).astype(np.float32)
+    hist = np.sqrt(hist / flat.shape[1])
+    
+    f = FEATURE_SIDE // EMBED_SIDE
+    gray = pixels.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    embed = gray.reshape(n, EMBED_SIDE, f, EMBED_SIDE, f).mean(axis=(2, 4)).reshape(n, -1)
+    embed -= embed.mean(axis=1, keepdims=True)
+    embed /= np.linalg.norm(embed, axis=1, keepdims=True) + 1e-6
+    return np.hstack([hist, embed]) * np.float32(np.sqrt(0.5))
+
+
+def file_signature(path, stat=None):
+    """缓存键：文件名 + 大小 + mtime（移动到类别目录后仍能命中）"""
+    stat = stat or os.stat(path)
+    return f"{os.path.basename(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+class FeatureCache:
+    """特征磁盘缓存：SQLite，按 file_signature 索引，特征以 float16 存储"""
+    
+    def __init__(self, db_path):
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS features (sig TEXT PRIMARY KEY, dim INTEGER NOT NULL, data BLOB NOT NULL)"
+        )
+        self._conn.commit()
+    
+    def get_many(self, sigs):
+        """{sig: float16 向量}，只含命中的"""
+        found = {}
+        sigs = list(sigs)
+        with self._lock:
+            for start in range(0, len(sigs), 500):
+                chunk = sigs[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT sig, data FROM features WHERE dim = ? AND sig IN ({','.join('?' * len(chunk))})",
+                    (FEATURE_DIM, *chunk)
+                ).fetchall()
+                found.update((sig, np.frombuffer(data, dtype=np.float16)) for sig, data in rows)
+        return found
+    
+    def put_many(self, items):
+        """items: [(sig, 向量)]"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO features VALUES (?, ?, ?)",
+                ((sig, FEATURE_DIM, np.asarray(vec, dtype=np.float16).tobytes()) for sig, vec in items)
+            )
+            self._conn.commit()
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def extract_features(paths, cache=None, workers=None, batch=256, progress=None):
+    """
+    批量提取特征：先查缓存，未命中的在进程池中解码为小图，每攒满 batch 张用 NumPy 一次算完并写回缓存
+    
+    :param progress: 可选回调 progress(done, total)
+    :return: (成功的路径列表, (n, FEATURE_DIM) float16 数组, 失败的路径列表)
+    """
+    paths = list(paths)
+    sigs, failed = {}, []
+    for path in paths:
+        try:
+            sigs[path] = file_signature(path)
+        except OSError:
+            failed.append(path)
+    cached = cache.get_many(sigs.values()) if cache is not None else {}
+    vectors = {path: cached[sig] for path, sig in sigs.items() if sig in cached}
+    todo = [path for path in sigs if path not in vectors]
+    done = len(vectors)
+    if progress is not None:
+        progress(done, len(paths))
+    
+    def flush(pending):
+        feats = features_from_pixels(np.stack([px for _, px in pending]))
+        for (path, _), vec in zip(pending, feats.astype(np.float16)):
+            vectors[path] = vec
+        if cache is not None:
+            cache.put_many((sigs[path], vectors[path]) for path, _ in pending)
+    
+    if todo:
+        pending = []
+        shape = (FEATURE_SIDE, FEATURE_SIDE, 3)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for path, data in zip(todo, pool.map(_safe_load_pixels, map(str, todo), chunksize=32)):
+                if data is None:
+                    failed.append(path)
+                else:
+                    pending.append((path, np.frombuffer(data, dtype=np.uint8).reshape(shape)))
+                if len(pending) >= batch:
+                    flush(pending)
+                    pending = []
+                done += 1
+                if progress is not None and done % 64 == 0:
+                    progress(done, len(paths))
+        if pending:
+            flush(pending)
+    ok = [path for path in paths if path in vectors]
+    matrix = np.stack([vectors[path] for path in ok]) if ok else np.zeros((0, FEATURE_DIM), np.float16)
+    return ok, matrix, failed
+
+
+def _grow(array, n):
+    """按需倍增容量（行数）"""
+    if n <= len(array):
+        return array
+    grown = np.empty((max(n, 2 * len(array), 64),) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class LabelPredictor:
+    """
+    增量 k-NN 预标注
+    
+    - 参考集：已分类图像的特征与类别；待标注集：每张图保存当前的 k 个最近邻（相似度 + 参考行号）
+    - 新标注只需与全部待标注向量比较一次并合并进各自的 top-k，不必重算整个索引
+    - 撤回标注时参考行打墓碑，只重算近邻中含该行的待标注图像
+    
+    所有方法都持锁，可在后台线程更新、UI 线程查询；键为任意字符串（路径）
+    """
+    
+    BLOCK = 65536  # 分块计算相似度的行数
+    
+    def __init__(self, categories, k=7):
+        self.categories = list(categories)
+        self._cat_ids = {c: i for i, c in enumerate(self.categories)}
+        self.k = k
+        self._lock = threading.Lock()
+        self._ref = np.zeros((0, FEATURE_DIM), np.float32)  # 内存中用 float32：增量更新的耗时主要在类型转换上
+        self._ref_cat = np.zeros(0, np.int16)  # -1 = 已撤回（墓碑）
+        self._ref_rows = {}
+        self._n_ref = 0
+        self._query = np.zeros((0, FEATURE_DIM), np.float32)
+        self._nn_sim = np.zeros((0, k), np.float32)
+        self._nn_row = np.zeros((0, k), np.int32)
+        self._active = np.zeros(0, bool)
+        self._query_rows = {}
+        self._query_keys = []
+    
+    # ---------- 构建 ----------
+    
+    def add_references(self, keys, feats, categories):
+        """加入一批已分类图像（categories 与 keys 等长），并更新全部待标注图像的近邻"""
+        with self._lock:
+            rows = self._append_refs(keys, feats, categories)
+            if len(rows):
+                self._merge(rows)
+    
+    def add_queries(self, keys, feats):
+        """加入一批待标注图像，对全部参考集求 top-k"""
+        with self._lock:
+            start = len(self._query_keys)
+            n = start + len(keys)
+            self._query = _grow(self._query, n)
+            self._nn_sim = _grow(self._nn_sim, n)
+            self._nn_row = _grow(self._nn_row, n)
+            self._active = _grow(self._active, n)
+            self._query[start:n] = feats
+            self._active[start:n] = True
+            for i, key in enumerate(keys, start):
+                self._query_rows[key] = i
+            self._query_keys.extend(keys)
+            self._recompute(np.arange(start, n))
+    
+    # ---------- 增量更新 ----------
+    
+    def label(self, keys, category):
+        """
+        图像被标注为 category：待标注图像转入参考集，已在参考集中的改类别；
+        没有特征的键（未参与预测）忽略
+        """
+        with self._lock:
+            new_keys, new_feats = [], []
+            for key in keys:
+                row = self._ref_rows.get(key)
+                if row is not None and self._ref_cat[row] >= 0:
+                    self._ref_cat[row] = self._cat_ids.get(category, -1)
+                    continue
+                q = self._query_rows.get(key)
+                if q is not None and self._active[q]:
+                    self._active[q] = False
+                    new_keys.append(key)
+                    new_feats.append(self._query[q])
+            if new_keys:
+                rows = self._append_refs(new_keys, np.stack(new_feats), [category] * len(new_keys))
+                if len(rows):
+                    self._merge(rows)
+    
+    def unlabel(self, keys):
+        """撤回标注：参考行打墓碑，图像回到待标注集"""
+        with self._lock:
+            dropped = []
+            for key in keys:
+                row = self._ref_rows.pop(key, None)
+                if row is None or self._ref_cat[row] < 0:
+                    continue
+                self._ref_cat[row] = -1
+                dropped.append(row)
+                q = self._query_rows.get(key)
+                if q is not None:
+                    self._active[q] = True
+            if dropped:
+                n = len(self._query_keys)
+                stale = np.isin(self._nn_row[:n], dropped).any(axis=1)
+                for key in keys:
+                    q = self._query_rows.get(key)
+                    if q is not None:
+                        stale[q] = True
+                self._recompute(np.nonzero(stale & self._active[:n])[0])
+    
+    # ---------- 查询 ----------
+    
+    def predict(self, key):
+        """(类别, 置信度 0~1)；未知的键或参考集为空时返回 None"""
+        with self._lock:
+            q = self._query_rows.get(key)
+            if q is None or not self._active[q]:
+                return None
+            scores = self._scores(np.array([q]))[0]
+        best = int(scores.argmax())
+        total = scores.sum()
+        if total <= 0:
+            return None
+        return self.categories[best], float(scores[best] / total)
+    
+    def predict_all(self):
+        """{键: (类别, 置信度)}，全部待标注图像"""
+        with self._lock:
+            rows = np.nonzero(self._active[:len(self._query_keys)])[0]
+            scores = self._scores(rows)
+            keys = [self._query_keys[i] for i in rows]
+        best = scores.argmax(axis=1)
+        total = scores.sum(axis=1)
+        conf = np.divide(scores[np.arange(len(rows)), best], total, out=np.zeros(len(rows)), where=total > 0)
+        return {key: (self.categories[b], float(c)) for key, b, c, t in zip(keys, best, conf, total) if t > 0}
+    
+    def __len__(self):
+        """参考集中的有效图像数"""
+        with self._lock:
+            return int((self._ref_cat[:self._n_ref] >= 0).sum())
+    
+    # ---------- 内部（调用方持锁） ----------
+    
+    def _append_refs(self, keys, feats, categories):
+        cats = np.array([self._cat_ids.get(c, -1) for c in categories], dtype=np.int16)
+        keep = np.nonzero(cats >= 0)[0]
+        start, n = self._n_ref, self._n_ref + len(keep)
+        self._ref = _grow(self._ref, n)
+        self._ref_cat = _grow(self._ref_cat, n)
+        self._ref[start:n] = np.asarray(feats)[keep]
+        self._ref_cat[start:n] = cats[keep]
+        for row, i in enumerate(keep, start):
+            self._ref_rows[keys[i]] = row
+        self._n_ref = n
+        return np.arange(start, n)
+    
+    def _merge(self, rows):
+        """新参考行并入全部待标注图像的 top-k"""
+        n = len(self._query_keys)
+        new = self._ref[rows]
+        step = min(self.BLOCK, max(1, self.BLOCK * 64 // (self.k + len(rows))))
+        for start in range(0, n, step):
+            stop = min(n, start + step)
+            sims = self._query[start:stop] @ new.T
+            if len(rows) <= self.k:
+                # 少量新行（逐条标注时）：逐列替换各行 top-k 中最小的一项
+                nn_sim, nn_row = self._nn_sim[start:stop], self._nn_row[start:stop]
+                lines = np.arange(stop - start)
+                for j, row in enumerate(rows):
+                    weakest = nn_sim.argmin(axis=1)
+                    better = np.nonzero(sims[:, j] > nn_sim[lines, weakest])[0]
+                    nn_sim[better, weakest[better]] = sims[better, j]
+                    nn_row[better, weakest[better]] = row
+                continue
+            all_sim = np.hstack([self._nn_sim[start:stop], sims])
+            all_row = np.hstack([self._nn_row[start:stop], np.broadcast_to(rows.astype(np.int32), sims.shape)])
+            top = np.argpartition(-all_sim, self.k - 1, axis=1)[:, :self.k]
+            self._nn_sim[start:stop] = np.take_along_axis(all_sim, top, axis=1)
+            self._nn_row[start:stop] = np.take_along_axis(all_row, top, axis=1)
+    
+    def _recompute(self, queries):
+        """对给定的待标注行重新求 top-k（分块，参考集中的墓碑行不参与）"""
+        self._nn_sim[queries] = -np.inf
+        self._nn_row[queries] = -1
+        valid = np.nonzero(self._ref_cat[:self._n_ref] >= 0)[0]
+        if not len(valid) or not len(queries):
+            return
+        ref = self._ref[valid]
+        k = min(self.k, len(valid))
+        step = max(1, self.BLOCK * 64 // len(valid))  # 每块的相似度矩阵不超过约 400 万个元素
+        for start in range(0, len(queries), step):
+            chunk = queries[start:start + step]
+            sims = self._query[chunk] @ ref.T
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            self._nn_sim[chunk, :k] = np.take_along_axis(sims, top, axis=1)
+            self._nn_row[chunk, :k] = valid[top]
+    
+    def _scores(self, queries):
+        """按相似度加权投票 → (len(queries), 类别数)"""
+        rows = self._nn_row[queries]
+        cats = np.where(rows >= 0, self._ref_cat[np.maximum(rows, 0)], -1)
+        weights = np.where(cats >= 0, np.maximum(self._nn_sim[queries], 0) + 1e-3, 0)
+        scores = np.zeros((len(queries), len(self.categories)), np.float32)
+        index = np.nonzero(cats >= 0)
+        np.add.at(scores, (index[0], cats[index]), weights[index])
+        return scores
+
+
+def collect_references(image_dir, categories):
+    """类别目录（image_dir/类别）中已分好的图像 [(Path, 类别)]，跳过空文件（共享模式下尚未被替换的占位文件）"""
+    references = []
+    for category in categories:
+        folder = Path(image_dir) / category
+        if not folder.is_dir():
+            continue
+        with os.scandir(folder) as it:
+            references.extend(
+                (Path(entry.path), category) for entry in it
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTS
+                and entry.stat().st_size > 0
+            )
+    return references
+
+
+def build_predictor(references, queries, categories, cache=None, k=7, workers=None, progress=None):
+    """
+    提取全部特征并建立 LabelPredictor（键为路径字符串）
+    
+    :param references: [(路径, 类别)] 已分类图像
+    :param queries: 待预测的路径
+    :return: (LabelPredictor, 读取失败的路径列表)
+    """
+    references, queries = list(references), list(queries)
+    ok, feats, failed = extract_features([path for path, _ in references] + queries, cache, workers, progress=progress)
+    row_of = {path: i for i, path in enumerate(ok)}
+    predictor = LabelPredictor(categories, k)
+    refs = [(path, category) for path, category in references if path in row_of]
+    if refs:
+        predictor.add_references(
+            [str(path) for path, _ in refs],
+            feats[[row_of[path] for path, _ in refs]],
+            [category for _, category in refs],
+        )
+    found = [path for path in queries if path in row_of]
+    if found:
+        predictor.add_queries([str(path) for path in found], feats[[row_of[path] for path in found]])
+    return predictor, failed
@@ -0,0 +1,102 @@
+"""缩放渲染：金字塔、瓦片与视图变换（不依赖 GUI）"""
+import math
+import threading
+
+from PIL import Image
+
+from .trace import TRACER
+
+
+TILE_SIZE = 256  # 渲染瓦片边长（缩放后的屏幕像素）
+PREVIEW_RESAMPLE = Image.Resampling.BILINEAR  # 交互过程中的快速预览
+FILTER_SUPPORT = 3  # Pillow 重采样核的最大半径（LANCZOS），决定瓦片需要多取的邻域
+
+
+class ImagePyramid:
+    """多分辨率金字塔：level 0 为解码图像，之后每级长宽减半（按需生成并缓存，可跨线程共享）"""
+    
+    def __init__(self, image, full_size):
+        self.full_size = tuple(full_size)
+        self.levels = [image]
+        self._lock = threading.Lock()
+    
+    def level_for(self, zoom):
+        """选择分辨率不低于目标缩放的最小层级，保证重采样始终从足够的像素出发"""
+        base_scale = self.levels[0].width / self.full_size[0]
+        level = 0
+        while base_scale / 2 ** (level + 1) >= zoom and min(self._get(level).size) >= 2:
+            level += 1
+        return self._get(level)
+    
+    def _get(self, level):
+        with self._lock:
+            while len(self.levels) <= level:
+                self.levels.append(self.levels[-1].reduce(2))
+            return self.levels[level]
+
+
+def visible_tiles(origin, canvas_size, target_size, margin=1):
+    """计算 canvas 可见区域（外扩 margin 个瓦片）覆盖的瓦片索引 [(tx, ty), ...]"""
+    ox, oy = origin
+    cw, ch = canvas_size
+    target_w, target_h = target_size
+    tx0 = max(0, (-ox) // TILE_SIZE - margin)
+    ty0 = max(0, (-oy) // TILE_SIZE - margin)
+    tx1 = min(math.ceil(target_w / TILE_SIZE), math.ceil((cw - ox) / TILE_SIZE) + margin)
+    ty1 = min(math.ceil(target_h / TILE_SIZE), math.ceil((ch - oy) / TILE_SIZE) + margin)
+    return [(tx, ty) for ty in range(ty0, ty1) for tx in range(tx0, tx1)]
+
+
+def render_tile(pyramid, zoom, tile, target_size, resample=Image.Resampling.LANCZOS):
+    """
+    渲染缩放后图像中的一个瓦片：只从合适的金字塔层级取对应区域重采样，代价与瓦片大小相关而与原图大小无关
+    
+    :param pyramid: ImagePyramid
+    :param zoom: 相对原图的缩放比例
+    :param tile: (tx, ty) 瓦片索引
+    :param target_size: 整图缩放后的尺寸 (w, h)
+    """
+    tx, ty = tile
+    target_w, target_h = target_size
+    x0, y0 = tx * TILE_SIZE, ty * TILE_SIZE
+    x1, y1 = min(x0 + TILE_SIZE, target_w), min(y0 + TILE_SIZE, target_h)
+    img = pyramid.level_for(zoom)
+    fx, fy = img.width / target_w, img.height / target_h
+    bx0, by0, bx1, by1 = x0 * fx, y0 * fy, x1 * fx, y1 * fy
+    # 先裁出「瓦片区域 + 滤波邻域」再重采样：RGBA 的 resize 会先对整张源图预乘 alpha，
+    # 直接在大图上调用时每个瓦片的代价都与原图大小相关
+    pad_x = math.ceil(FILTER_SUPPORT * max(fx, 1)) + 1
+    pad_y = math.ceil(FILTER_SUPPORT * max(fy, 1)) + 1
+    cx0, cy0 = max(0, int(bx0) - pad_x), max(0, int(by0) - pad_y)
+    cx1, cy1 = min(img.width, math.ceil(bx1) + pad_x), min(img.height, math.ceil(by1) + pad_y)
+    with TRACER.span("resize"):
+        region = img.crop((cx0, cy0, cx1, cy1))
+        # box 参数让 Pillow 在裁剪区域外仍能取到滤波所需的邻域像素，瓦片拼接处不会出现接缝
+        return region.resize((x1 - x0, y1 - y0), resample, box=(bx0 - cx0, by0 - cy0, bx1 - cx0, by1 - cy0))
+
+
+def fit_view(image_size, canvas_size):
+    """「自适应填充」：图像完整显示并居中，返回 (zoom, pan_x, pan_y)"""
+    iw, ih = image_size
+    cw, ch = canvas_size
+    scale = min(cw / iw, ch / ih)
+    return scale, (cw - iw * scale) / 2, (ch - ih * scale) / 2
+
+
+def zoom_at(zoom, pan, point, delta, min_zoom, max_zoom, step=1.15):
+    """
+    以 point 为中心缩放 delta 格滚轮，返回 (new_zoom, new_pan_x, new_pan_y)
+    
+    :param pan: 当前图像左上角在 canvas 中的位置 (pan_x, pan_y)
+    :param point: canvas 坐标系中的缩放中心（通常是光标位置）
+    """
+    # ✅ 缩放因子（每次滚轮 ≈ ×1.15），并限制缩放范围
+    new_zoom = max(min_zoom, min(max_zoom, zoom * step ** delta))
+    
+    # ✅ 关键：以光标点为中心缩放 → 先反推该点在图像中的原始坐标，再重新映射
+    x, y = point
+    rel_x = (x - pan[0]) / zoom
+    rel_y = (y - pan[1]) / zoom
+    
+    # 缩放后，该点应仍在光标下 → 新左上角 = 鼠标点 - (rel_x, rel_y) * new_zoom
+    return new_zoom, x - rel_x * new_zoom, y - rel_y * new_zoom
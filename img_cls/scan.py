@@ -0,0 +1,368 @@
+"""目录扫描与会话索引"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+from array import array
+from pathlib import Path
+
+from .trace import TRACER
+from .workqueue import PathBatch
+
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".webp"}
+
+
+class SessionIndex:
+    """
+    目录会话索引（image_dir/.img_cls/index.sqlite）：文件列表、大小、修改时间、图像尺寸、上次浏览位置与完整性检查结果
+    
+    重新打开目录时只重新扫描 mtime 发生变化的目录，其余直接读取索引；
+    多人共享目录时（owner 不为空）每个实例使用自己的索引文件，浏览位置互不覆盖，也不会多台电脑同时写一个数据库
+    """
+    INDEX_DIR = ".img_cls"  # 索引所在的隐藏子目录（扫描跳过隐藏的文件和目录）
+    DB_NAME = "index.sqlite"
+    LEGACY_NAME = ".img_cls_index.sqlite"  # 旧版本直接放在图像目录中的索引，打开时移入 INDEX_DIR
+    VIEW_FLUSH_DELAY = 1.0  # 浏览记录在内存中累积多久后写入（秒）
+    
+    def __init__(self, root, owner=None):
+        """
+        :param root: 图像目录
+        :param owner: 共享模式下本实例的标识（LeaseManager.owner）
+        """
+        self.root = Path(root)
+        suffix = ".sqlite" if owner is None else f".{owner}.sqlite"
+        db_path = self.root / self.INDEX_DIR / self.DB_NAME.replace(".sqlite", suffix)
+        db_path.parent.mkdir(exist_ok=True)
+        legacy = self.root / self.LEGACY_NAME.replace(".sqlite", suffix)
+        if legacy.exists() and not db_path.exists():
+            for ext in ("", "-journal"):
+                if os.path.exists(f"{legacy}{ext}"):
+                    os.replace(f"{legacy}{ext}", f"{db_path}{ext}")
+        self._lock = threading.Lock()
+        self._view_lock = threading.Lock()  # 只保护内存中的浏览记录，UI 线程不等待索引锁
+        self._views = {}  # 尚未写入的 {路径: (w, h)}
+        self._last_view = None
+        self._view_timer = None
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        # WAL：提交不必每次 fsync；打开 / 关闭时创建、删除的 -wal / -shm 文件在隐藏子目录中，不改变图像目录的 mtime
+        # （目录 mtime 变了整个目录就要重新扫描）。共享模式下索引多在网络共享上，WAL 依赖的共享内存（-shm 映射）
+        # 不可靠，改用保留日志文件的回滚日志（PERSIST）
+        self._conn.execute("PRAGMA journal_mode=" + ("WAL" if owner is None else "PERSIST"))
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS dirs (rel TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, subdirs TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS files ("
+            "rel TEXT PRIMARY KEY, dir TEXT NOT NULL, size INTEGER, mtime_ns INTEGER, width INTEGER, height INTEGER);"
+            "CREATE INDEX IF NOT EXISTS files_dir ON files (dir);"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"
+            "CREATE TABLE IF NOT EXISTS checks (rel TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, status TEXT, "
+            "width INTEGER, height INTEGER, mode TEXT, error TEXT);"
+        )
+        self._conn.commit()
+    
+    def cached_dir(self, dir_path, mtime_ns):
+        """目录 mtime 未变时返回 (图像路径列表, 子目录列表)，否则返回 None"""
+        rel = self._rel(dir_path)
+        with self._lock:
+            row = self._conn.execute("SELECT mtime_ns, subdirs FROM dirs WHERE rel = ?", (rel,)).fetchone()
+            if row is None or row[0] != mtime_ns:
+                return None
+            names = self._conn.execute("SELECT rel FROM files WHERE dir = ? ORDER BY rel", (rel,)).fetchall()
+        return [self.root / name for (name,) in names], [self.root / sub for sub in json.loads(row[1])]
+    
+    def update_dir(self, dir_path, mtime_ns, files, subdirs):
+        """
+        用一次完整扫描的结果替换目录的索引
+        
+        扫描时不逐个 stat：只有已记录图像尺寸的文件才 stat 一次，大小与 mtime 均未变时保留尺寸；
+        其余文件的大小、mtime 留空，由完整性预检或浏览时补上
+        
+        :param files: [path, ...]
+        :param subdirs: [path, ...]
+        """
+        rel = self._rel(dir_path)
+        with self._lock:
+            old = {name: (size, mtime, w, h) for name, size, mtime, w, h in self._conn.execute(
+                "SELECT rel, size, mtime_ns, width, height FROM files WHERE dir = ? AND width IS NOT NULL", (rel,))}
+        rows = []
+        for path in files:
+            name = self._rel(path)
+            prev = old.get(name)
+            row = (name, rel, None, None, None, None)
+            if prev is not None:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    st = None
+                if st is not None and prev[:2] == (st.st_size, st.st_mtime_ns):
+                    row = (name, rel, *prev)
+            rows.append(row)
+        with self._lock:
+            self._conn.execute("DELETE FROM files WHERE dir = ?", (rel,))
+            self._conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._conn.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)",
+                               (rel, mtime_ns, json.dumps([self._rel(sub) for sub in subdirs])))
+            self._conn.commit()
+    
+    def files_moved(self, removed=(), added=(), dir_mtimes=None):
+        """
+        工具自身移动文件后同步索引
+        
+        移动前目录的 mtime 与索引一致（期间没有外部改动）时刷新为移动后的 mtime，避免下次打开时整目录重扫；
+        否则保持不变，下次打开时重新扫描该目录，外部放入的文件不会被漏掉
+        
+        :param dir_mtimes: 移动前各目录的 mtime {目录: mtime_ns}；未给出的目录一律留待重新扫描
+        """
+        before = {self._rel(d): mtime for d, mtime in (dir_mtimes or {}).items()}
+        dirs = set()
+        with self._lock:
+            for path in removed:
+                self._conn.execute("DELETE FROM files WHERE rel = ?", (self._rel(path),))
+                dirs.add(self._rel(os.path.dirname(path)))
+            for path in added:
+                dir_rel = self._rel(os.path.dirname(path))
+                if self._conn.execute("SELECT 1 FROM dirs WHERE rel = ?", (dir_rel,)).fetchone() is None:
+                    continue  # 未被索引的目录（如类别目录）
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                self._conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, NULL, NULL)",
+                                   (self._rel(path), dir_rel, st.st_size, st.st_mtime_ns))
+                dirs.add(dir_rel)
+            self._refresh_dirs(dirs, before)
+            self._conn.commit()
+    
+    def dir_touched(self, dir_path, mtime_ns):
+        """工具自身在目录中创建 / 替换了文件（日志压缩、标注清单）后调用，mtime_ns 为操作前的目录 mtime，规则同 files_moved"""
+        rel = self._rel(dir_path)
+        with self._lock:
+            self._refresh_dirs([rel], {rel: mtime_ns})
+            self._conn.commit()
+    
+    def record_view(self, path, width, height):
+        """
+        记录当前浏览位置和图像尺寸（在 UI 线程中调用）
+        
+        只更新内存，VIEW_FLUSH_DELAY 秒后由后台定时器一次写入期间浏览过的全部记录，close() 时写入剩余的；
+        扫描、预检正在写索引时浏览不会被阻塞
+        """
+        with self._view_lock:
+            self._views[path] = (width, height)
+            self._last_view = path
+            if self._view_timer is None:
+                self._view_timer = threading.Timer(self.VIEW_FLUSH_DELAY, self._flush_views)
+                self._view_timer.daemon = True
+                self._view_timer.start()
+    
+    def last_path(self):
+        with self._view_lock:
+            if self._last_view is not None:
+                return Path(self._last_view)
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'last_path'").fetchone()
+        return self.root / row[0] if row else None
+    
+    def dims(self, path):
+        """已记录的图像尺寸 (w, h)，未知时返回 None"""
+        with self._view_lock:
+            if path in self._views:
+                return self._views[path]
+        with self._lock:
+            row = self._conn.execute("SELECT width, height FROM files WHERE rel = ?", (self._rel(path),)).fetchone()
+        return tuple(row) if row and row[0] is not None else None
+    
+    def sizes(self):
+        """已索引文件的大小 {绝对路径字符串: 字节数}（按大小筛选时免去逐个 stat）"""
+        root = str(self.root)
+        with self._lock:
+            rows = self._conn.execute("SELECT rel, size FROM files WHERE size IS NOT NULL").fetchall()
+        return {os.path.join(root, rel): size for rel, size in rows}
+    
+    def cached_checks(self, paths):
+        """
+        已缓存的完整性检查结果 {路径字符串: (size, mtime_ns, 状态, 宽, 高, 模式, 说明)}，
+        大小或 mtime 与当前文件不一致的由调用方丢弃
+        """
+        names = {self._rel(path): str(path) for path in paths}
+        result = {}
+        keys = list(names)
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._conn.execute(
+                    "SELECT rel, size, mtime_ns, status, width, height, mode, error FROM checks "
+                    f"WHERE rel IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+                for rel, *values in rows:
+                    result[names[rel]] = tuple(values)
+        return result
+    
+    def record_checks(self, rows):
+        """
+        写入完整性检查结果，并补上文件表中的大小、mtime 与图像尺寸（扫描时不 stat，由预检顺带补上）
+        
+        :param rows: [(path, size, mtime_ns, 状态, 宽, 高, 模式, 说明), ...]
+        """
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO checks VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                   [(self._rel(path), *values) for path, *values in rows])
+            self._conn.executemany(
+                "UPDATE files SET size = ?, mtime_ns = ?, width = ?, height = ? WHERE rel = ?",
+                [(size, mtime, w, h, self._rel(path)) for path, size, mtime, _, w, h, _, _ in rows if w is not None]
+            )
+            self._conn.commit()
+    
+    def close(self):
+        with self._view_lock:
+            timer, self._view_timer = self._view_timer, None
+        if timer is not None:
+            timer.cancel()
+            timer.join()
+        self._flush_views()
+        with self._lock:
+            self._conn.close()
+    
+    def _flush_views(self):
+        """把内存中的浏览记录写入索引（定时器线程或 close() 中执行）；尺寸连同大小与 mtime 记录，重新扫描时据此判断是否仍有效"""
+        with self._view_lock:
+            views, self._views = self._views, {}
+            last, self._view_timer = self._last_view, None
+        if last is None:
+            return
+        rows = []
+        for path, (width, height) in views.items():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue  # 已被移走
+            rows.append((st.st_size, st.st_mtime_ns, width, height, self._rel(path)))
+        try:
+            with self._lock:
+                self._conn.executemany(
+                    "UPDATE files SET size = ?, mtime_ns = ?, width = ?, height = ? WHERE rel = ?", rows)
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('last_path', ?)", (self._rel(last),))
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"[Error] record view: {e}")
+    
+    def _refresh_dirs(self, dir_rels, before):
+        """索引中的 mtime 与操作前一致的目录刷新为当前 mtime（调用方持有锁）"""
+        for dir_rel in dir_rels:
+            row = self._conn.execute("SELECT mtime_ns FROM dirs WHERE rel = ?", (dir_rel,)).fetchone()
+            if row is None or before.get(dir_rel) != row[0]:
+                continue
+            try:
+                mtime_ns = os.stat(self.root / dir_rel).st_mtime_ns
+            except OSError:
+                continue
+            self._conn.execute("UPDATE dirs SET mtime_ns = ? WHERE rel = ?", (mtime_ns, dir_rel))
+    
+    def _rel(self, path):
+        return os.path.relpath(path, self.root)
+
+
+class DirectoryScanner:
+    """
+    后台扫描图像目录：用 os.scandir 的 dirent 类型信息判断文件/目录，
+    第一批结果尽快交给 UI 显示，其余按批追加
+    
+    给定 SessionIndex 时，mtime 未变的目录直接读取索引，变化的目录重新扫描并写回索引
+    """
+    FIRST_BATCH = 16
+    BATCH_SIZE = 1024
+    
+    def __init__(self, root, recursive=False, skip_dirs=(), exclude=(), index=None):
+        """
+        :param root: 图像目录
+        :param recursive: 是否递归子目录
+        :param skip_dirs: 递归时跳过的子目录名（工具自己创建的类别目录）
+        :param exclude: 不计入结果的路径（如正在后台移动的文件）
+        :param index: 可选的 SessionIndex
+        """
+        self.root = Path(root)
+        self.recursive = recursive
+        self.skip_dirs = set(skip_dirs)
+        self.exclude = set(exclude)
+        self.index = index
+        self.batches = queue.Queue()  # 每项为 PathBatch（list[Path]），None 表示扫描结束
+        self.found = 0
+        # 扫描完成时（放入 None 之前）设置：全部结果按 (目录, 文件名) 排序后的到达序号，在扫描线程中排好
+        self.order = None
+        self._keys = []
+        self._batch = []
+        self._limit = self.FIRST_BATCH
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="dir-scan", daemon=True)
+        self._thread.start()
+    
+    def cancel(self):
+        self._cancelled.set()
+    
+    def _run(self):
+        stack = [self.root]
+        try:
+            while stack and not self._cancelled.is_set():
+                dir_path = stack.pop()
+                with TRACER.span("scan_dir", path=str(dir_path)):
+                    subdirs = self._scan_dir(dir_path)
+                if self.recursive:
+                    stack.extend(sub for sub in subdirs if os.path.basename(sub) not in self.skip_dirs)
+        except (OSError, sqlite3.Error) as e:
+            print(f"[Error] scan {self.root}: {e}")
+        finally:
+            if self._batch:
+                self._emit()
+            if not self._cancelled.is_set():
+                keys = self._keys
+                self.order = array("I", sorted(range(len(keys)), key=keys.__getitem__))
+            self._keys = None
+            self.batches.put(None)
+    
+    def _scan_dir(self, dir_path):
+        # 先取目录 mtime 再列目录：列的过程中有变化，下次打开时会重新扫描
+        mtime_ns = os.stat(dir_path).st_mtime_ns
+        cached = self.index.cached_dir(dir_path, mtime_ns) if self.index is not None else None
+        if cached is not None:
+            files, subdirs = cached
+            for path in files:
+                self._add(path)
+            return subdirs
+        
+        # 不逐个 stat（NAS 上每次都是一次网络往返）：尺寸能否沿用由索引按需判断
+        records, subdirs = [], []
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                if self._cancelled.is_set():
+                    return []
+                if entry.name.startswith("."):
+                    continue  # 隐藏文件 / 工具自身的日志、清单、索引
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                    continue
+                if os.path.splitext(entry.name)[1].lower() not in IMAGE_EXTS:
+                    continue
+                if entry.is_file():
+                    records.append(entry.path)
+                    self._add(Path(entry.path))
+        if self.index is not None:
+            self.index.update_dir(dir_path, mtime_ns, records, subdirs)
+        return subdirs
+    
+    def _add(self, path):
+        if self.exclude and str(path) in self.exclude:
+            return
+        self._batch.append(path)
+        if len(self._batch) >= self._limit:
+            self._emit()
+            self._limit = self.BATCH_SIZE
+    
+    def _emit(self):
+        batch, self._batch = self._batch, []
+        batch.sort()
+        batch = PathBatch(batch)
+        # "目录\0文件名" 的字符串顺序与 (目录, 文件名) 相同，即 WorkQueue.sort_after 的顺序
+        self._keys.extend(f"{dir_name}\0{name}" for dir_name, name in map(os.path.split, map(str, batch)))
+        self.found += len(batch)
+        self.batches.put(batch)
@@ -0,0 +1,142 @@
+"""缩略图生成与持久缓存"""
+import io
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+from PIL import Image
+
+
+THUMB_EDGE = 160  # 缩略图最长边（像素）
+
+
+def make_thumbnail(image_path, edge=THUMB_EDGE):
+    """生成缩略图 JPEG 字节（在进程池中执行，必须是模块级函数）"""
+    with Image.open(image_path) as img:
+        img.draft("RGB", (edge, edge))  # JPEG 直接按 1/8 等比例解码
+        img = img.convert("RGB")
+    img.thumbnail((edge, edge), Image.Resampling.BILINEAR)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=80)
+    return buf.getvalue()
+
+
+class ThumbnailCache:
+    """缩略图磁盘缓存：全部缩略图存放在同一个 SQLite 文件中，按 (路径, 边长) 索引，并用文件大小与 mtime 校验"""
+    
+    def __init__(self, db_path):
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS thumbs ("
+            "path TEXT NOT NULL, edge INTEGER NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+            "data BLOB NOT NULL, PRIMARY KEY (path, edge))"
+        )
+        self._conn.commit()
+    
+    def get(self, path, edge, size, mtime_ns):
+        with self._lock:
+            row = self._conn.execute("SELECT size, mtime_ns, data FROM thumbs WHERE path = ? AND edge = ?",
+                                     (str(path), edge)).fetchone()
+        if row is None or row[:2] != (size, mtime_ns):
+            return None
+        return row[2]
+    
+    def put(self, path, edge, size, mtime_ns, data):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO thumbs VALUES (?, ?, ?, ?, ?)",
+                               (str(path), edge, size, mtime_ns, data))
+            self._conn.commit()
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ThumbnailLoader:
+    """
+    后台缩略图加载：先查磁盘缓存，未命中再交给进程池生成，结果经 results 队列交给 UI 线程
+    
+    只处理最近一次 request() 仍需要的图像，滚动后已不可见、尚未开始的任务直接取消
+    """
+    
+    def __init__(self, cache, edge=THUMB_EDGE, workers=None):
+        self.cache = cache
+        self.edge = edge
+        self.results = queue.Queue()  # (path, PIL.Image or None)
+        self._pool = ProcessPoolExecutor(max_workers=workers)
+        self._requests = queue.Queue()
+        self._lock = threading.Lock()
+        self._wanted = set()
+        self._futures = {}  # {path: Future}
+        self._thread = threading.Thread(target=self._run, name="thumb-loader", daemon=True)
+        self._thread.start()
+    
+    def request(self, paths):
+        """按优先级（可见区域在前）请求一批缩略图，取代之前的请求"""
+        paths = [str(p) for p in paths]
+        with self._lock:
+            self._wanted = set(paths)
+            for key in [k for k, f in self._futures.items() if k not in self._wanted and f.cancel()]:
+                del self._futures[key]
+        self._requests.put(paths)
+    
+    def shutdown(self):
+        self._requests.put(None)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+    
+    def _run(self):
+        while True:
+            paths = self._requests.get()
+            # 只处理最新的一次请求
+            while paths is not None and not self._requests.empty():
+                paths = self._requests.get()
+            if paths is None:
+                return
+            for key in paths:
+                if not self._requests.empty():
+                    break  # 又滚动了，先处理新请求
+                with self._lock:
+                    if key not in self._wanted or key in self._futures:
+                        continue
+                try:
+                    st = os.stat(key)
+                    data = self.cache.get(key, self.edge, st.st_size, st.st_mtime_ns)
+                    if data is not None:
+                        self.results.put((key, self._open(data)))
+                        continue
+                    future = self._pool.submit(make_thumbnail, key, self.edge)
+                except Exception as e:
+                    print(f"[Error] thumbnail {key}: {e}")
+                    self.results.put((key, None))
+                    continue
+                with self._lock:
+                    self._futures[key] = future
+                future.add_done_callback(partial(self._on_done, key, st.st_size, st.st_mtime_ns))
+    
+    def _on_done(self, key, size, mtime_ns, future):
+        with self._lock:
+            self._futures.pop(key, None)
+        if future.cancelled():
+            return
+        try:
+            data = future.result()
+            self.cache.put(key, self.edge, size, mtime_ns, data)
+            self.results.put((key, self._open(data)))
+        except Exception as e:
+            print(f"[Error] thumbnail {key}: {e}")
+            self.results.put((key, None))
+    
+    @staticmethod
+    def _open(data):
+        img = Image.open(io.BytesIO(data))
+        img.load()
+        return img
@@ -0,0 +1,237 @@
+"""热路径计时：span 记录每次调用的耗时，汇总后供状态栏显示，可导出为 Chrome trace 或 JSONL"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+_NULL_SPAN = nullcontext()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+    
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+
+class Tracer:
+    """
+    线程安全的计时记录器：未启用时 span() 返回空上下文，几乎没有开销
+    
+    - 事件保存在定长环形缓冲中（最近 MAX_EVENTS 条），供导出离线分析
+    - 每个 span 名称另行汇总次数、平均、p95、最大耗时（p95 基于最近 RECENT 次）
+    """
+    MAX_EVENTS = 200_000
+    RECENT = 256
+    
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        self._events = deque(maxlen=self.MAX_EVENTS)  # (ph, name, tid, ts_us, dur_us, args)
+        self._stats = {}  # {name: [count, total_s, max_s, deque(recent_s)]}
+        self._counters = {}  # {name: 最新值}
+    
+    def span(self, name, **args):
+        """with TRACER.span("decode", path=...): ... —— 记录代码块耗时"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+    
+    def record(self, name, start, end, args=None):
+        """记录一段已完成的耗时（start / end 为 time.perf_counter() 的值）"""
+        if not self.enabled:
+            return
+        dur = end - start
+        event = ("X", name, threading.get_ident(), (start - self._t0) * 1e6, dur * 1e6, args or None)
+        with self._lock:
+            self._events.append(event)
+            stat = self._stats.get(name)
+            if stat is None:
+                stat = self._stats[name] = [0, 0.0, 0.0, deque(maxlen=self.RECENT)]
+            stat[0] += 1
+            stat[1] += dur
+            stat[2] = max(stat[2], dur)
+            stat[3].append(dur)
+    
+    def counter(self, name, value):
+        """记录计数器当前值（缓存命中率、内存等），导出为 Chrome trace 的计数器曲线"""
+        if not self.enabled:
+            return
+        event = ("C", name, 0, (time.perf_counter() - self._t0) * 1e6, 0, {name: value})
+        with self._lock:
+            self._events.append(event)
+            self._counters[name] = value
+    
+    def summary(self):
+        """{name: {"count", "mean_ms", "p95_ms", "max_ms"}}"""
+        with self._lock:
+            stats = {name: (s[0], s[1], s[2], sorted(s[3])) for name, s in self._stats.items()}
+        result = {}
+        for name, (count, total, peak, recent) in stats.items():
+            result[name] = {
+                "count": count,
+                "mean_ms": total / count * 1000,
+                "p95_ms": recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000,
+                "max_ms": peak * 1000,
+            }
+        return result
+    
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+    
+    def reset(self):
+        with self._lock:
+            self._events.clear()
+            self._stats.clear()
+            self._counters.clear()
+    
+    def export(self, path):
+        """按扩展名导出：.jsonl 为逐行事件，其余为 Chrome trace（chrome://tracing、Perfetto 可直接打开）"""
+        with self._lock:
+            events = list(self._events)
+        pid = os.getpid()
+        with open(path, "w", encoding="utf-8") as f:
+            if str(path).lower().endswith(".jsonl"):
+                for ph, name, tid, ts, dur, args in events:
+                    record = {"type": "span" if ph == "X" else "counter", "name": name, "tid": tid,
+                              "ts_us": round(ts, 1)}
+                    if ph == "X":
+                        record["dur_us"] = round(dur, 1)
+                    if args:
+                        record["args"] = args
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                return len(events)
+            trace = []
+            for ph, name, tid, ts, dur, args in events:
+                event = {"name": name, "ph": ph, "ts": round(ts, 1), "pid": pid, "tid": tid}
+                if ph == "X":
+                    event["dur"] = round(dur, 1)
+                if args:
+                    event["args"] = args
+                trace.append(event)
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f, ensure_ascii=False, default=str)
+        return len(events)
+
+
+TRACER = Tracer()  # 全局记录器，引擎各模块的热路径共用
+
+
+def process_memory_mb():
+    """当前进程常驻内存（MB），平台不支持时返回 None"""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+            
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                    (name, ctypes.c_size_t) for name in (
+                        "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                        "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage",
+                    )
+                ]
+            
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+                return None
+            return counters.WorkingSetSize / 1024 / 1024
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def process_age(pid=None):
+    """进程已运行的秒数（默认当前进程），平台不支持或进程不存在时返回 None"""
+    pid = os.getpid() if pid is None else pid
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+            
+            kernel32 = ctypes.windll.kernel32
+            handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+            if not handle:
+                return None
+            try:
+                created, exited, kernel, user = (wintypes.FILETIME() for _ in range(4))
+                if not kernel32.GetProcessTimes(handle, ctypes.byref(created), ctypes.byref(exited),
+                                                ctypes.byref(kernel), ctypes.byref(user)):
+                    return None
+            finally:
+                kernel32.CloseHandle(handle)
+            now = wintypes.FILETIME()
+            kernel32.GetSystemTimeAsFileTime(ctypes.byref(now))
+            elapsed = ((now.dwHighDateTime - created.dwHighDateTime) << 32) + \
+                now.dwLowDateTime - created.dwLowDateTime
+            return elapsed / 1e7  # FILETIME 单位为 100ns
+        # Linux：/proc/<pid>/stat 第 22 项为启动时刻（开机后的时钟滴答数），与 /proc/uptime 相减
+        with open(f"/proc/{pid}/stat", "r") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", "r") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _launcher_pid():
+    """
+    PyInstaller --onefile 打包时，由父进程（引导程序）解压后再启动本进程，启动耗时从父进程算起；
+    其余情况（源码运行、--onedir）即当前进程
+    """
+    meipass = getattr(sys, "_MEIPASS", None)
+    if getattr(sys, "frozen", False) and meipass:
+        exe_dir = os.path.dirname(os.path.abspath(sys.executable))
+        try:
+            inside = os.path.commonpath([os.path.abspath(meipass), exe_dir]) == exe_dir
+        except ValueError:  # 不同盘符
+            inside = False
+        if not inside:
+            return os.getppid()
+    return None
+
+
+class StartupTimer:
+    """
+    启动耗时：记录各阶段完成的时刻，起点为进程创建（含解释器启动与打包程序的解压）
+    
+    取不到进程创建时刻时（非 Windows / Linux），起点为构造 StartupTimer 的时刻
+    """
+    
+    def __init__(self):
+        now = time.perf_counter()
+        age = process_age(_launcher_pid())
+        if age is None or age < 0:
+            age = process_age()
+        self.origin = now - age if age is not None and age >= 0 else now
+        self.marks = {}  # {阶段: 距起点的秒数}，按记录顺序
+    
+    def mark(self, name):
+        now = time.perf_counter()
+        self.marks[name] = now - self.origin
+        TRACER.record(f"startup:{name}", self.origin, now)
+        return self.marks[name]
+    
+    def report(self):
+        """{"阶段_ms": 距起点的毫秒数, ...}，附带运行方式"""
+        result = {f"{name}_ms": round(seconds * 1000, 1) for name, seconds in self.marks.items()}
+        result["frozen"] = bool(getattr(sys, "frozen", False))
+        return result
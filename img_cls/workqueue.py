@@ -0,0 +1,432 @@
+"""紧凑的待标注队列：数组存储 + 墓碑标记，替代 list[Path]"""
+import operator
+import os
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from pathlib import Path
+
+VISIBLE, REMOVED, HIDDEN = 0, 1, 2  # 条目状态：可见 / 已移出（墓碑）/ 被筛选隐藏
+
+
+class _Fenwick:
+    """树状数组：位置 i 的值为 1 表示该位置可见，支持 O(log n) 的前缀计数（rank）与第 k 个（select）"""
+    
+    def __init__(self):
+        self.tree = array("i", [0])  # 1 起始
+    
+    def __len__(self):
+        return len(self.tree) - 1
+    
+    def build(self, values):
+        # 节点 i 覆盖 (i - lowbit(i), i]：由前缀和直接求差
+        cum = list(accumulate(values, initial=0))
+        tree = array("i", [0])
+        tree.extend(cum[i] - cum[i - (i & -i)] for i in range(1, len(cum)))
+        self.tree = tree
+    
+    def extend(self, values):
+        # 新节点 m 覆盖 (m - lowbit(m), m]，等于两个前缀和之差：整批的前缀和一次累加得到，
+        # 只有跨过原末尾的少数（至多 log n 个）节点要查询原有的前缀和
+        tree = self.tree
+        old = len(tree) - 1
+        cum = list(accumulate(values, initial=self.prefix(old)))  # cum[j] = prefix(old + j)
+        for m in range(old + 1, old + len(cum)):
+            lo = m - (m & -m)
+            tree.append(cum[m - old] - (cum[lo - old] if lo >= old else self.prefix(lo)))
+    
+    def add(self, pos, delta):
+        i, tree = pos + 1, self.tree
+        n = len(tree) - 1
+        while i <= n:
+            tree[i] += delta
+            i += i & -i
+    
+    def prefix(self, count):
+        """前 count 个位置的和"""
+        total, i, tree = 0, count, self.tree
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+    
+    def select(self, k):
+        """第 k 个（0 起始）值为 1 的位置"""
+        pos, tree = 0, self.tree
+        n = len(tree) - 1
+        step = 1 << n.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= n and tree[nxt] <= k:
+                pos = nxt
+                k -= tree[nxt]
+            step >>= 1
+        return pos
+
+
+class PathBatch(list):
+    """
+    一批路径（list[Path]），构造时按目录分组、把文件名编码成 WorkQueue 的存储格式：
+    扫描线程中构造好，UI 线程里的 WorkQueue.extend 只做整块追加
+    """
+    
+    def __init__(self, paths=()):
+        super().__init__(paths)
+        self.groups = []  # [(目录, 文件名块 b"name\0...", 各文件名的字节数)]，按批内顺序
+        for path in self:
+            dir_name, name = os.path.split(str(path))
+            encoded = name.encode("utf-8", "surrogateescape")
+            if not self.groups or self.groups[-1][0] != dir_name:
+                self.groups.append((dir_name, bytearray(), array("H")))
+            self.groups[-1][1].extend(encoded + b"\0")
+            self.groups[-1][2].append(len(encoded))
+
+
+class WorkQueue:
+    """
+    待标注队列：对外表现为只含可见条目的序列（len / 下标 / 迭代 / in），内部为定长数组
+    
+    - 文件名以 UTF-8 追加到一块 bytearray（\\0 分隔），目录名驻留为编号，每个条目只占十几个字节
+    - 移出只打墓碑、撤回只清墓碑，均为 O(log n)，条目回到原来的位置
+    - 筛选只改变条目状态，可随时恢复；按类别的计数随移出 / 标注实时更新
+    """
+    
+    def __init__(self):
+        self._dirs = []  # 目录字符串（驻留）
+        self._dir_ids = {}
+        self._names = bytearray(b"\0")
+        self._dir = array("I")  # 以下按条目编号（slot）索引
+        self._off = array("I")  # 文件名在 _names 中的起始偏移（随 slot 单调递增）
+        self._len = array("H")
+        self._state = array("B")
+        self._cat = array("h")  # 类别编号，-1 表示未分类
+        self._order = array("I")  # 队列位置 → slot
+        self._pos = array("I")  # slot → 队列位置
+        self._visible = _Fenwick()
+        self._cats = []
+        self._cat_ids = {}
+        self._cat_counts = []
+        self._removed = 0
+        self._predicate = None
+    
+    # ---------- 序列接口（下标为可见条目的序号） ----------
+    
+    def __len__(self):
+        return self._visible.prefix(len(self._order))
+    
+    def __bool__(self):
+        return len(self) > 0
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("WorkQueue 切片不支持步长")
+            return self.paths(start, stop)
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("WorkQueue index out of range")
+        return self._path(self._order[self._visible.select(index)])
+    
+    def __iter__(self):
+        return iter(self.paths(0, len(self)))
+    
+    def __contains__(self, path):
+        slot = self._find(path)
+        return slot is not None and self._state[slot] == VISIBLE
+    
+    def index(self, path):
+        slot = self._find(path)
+        if slot is None or self._state[slot] != VISIBLE:
+            raise ValueError(f"{path} 不在队列中")
+        return self._visible.prefix(self._pos[slot])
+    
+    def paths(self, start, stop):
+        """可见条目 [start, stop) 的路径：定位一次后顺序扫描，适合网格等按屏读取"""
+        result = []
+        if start >= stop:
+            return result
+        pos, order, state = self._visible.select(start), self._order, self._state
+        # 大范围时整块解码文件名，比逐个切片解码快得多
+        if stop - start > 256:
+            names, dirs, dir_of = self._all_names(), self._dirs, self._dir
+            key = lambda slot: os.path.join(dirs[dir_of[slot]], names[slot])
+        else:
+            key = self._key
+        while len(result) < stop - start and pos < len(order):
+            slot = order[pos]
+            if state[slot] == VISIBLE:
+                result.append(Path(key(slot)))
+            pos += 1
+        return result
+    
+    # ---------- 修改 ----------
+    
+    def extend(self, paths):
+        """
+        追加到队尾（扫描结果按批到达），返回第一个新条目的 slot；当前有筛选时新条目同样按筛选条件处理
+        
+        传入 PathBatch 时直接追加其中已编码的文件名（扫描线程已经分组、编码好）
+        """
+        if not isinstance(paths, PathBatch):
+            paths = PathBatch(paths)
+        first = len(self._dir)
+        for dir_name, blob, lengths in paths.groups:
+            dir_id = self._dir_ids.get(dir_name)
+            if dir_id is None:
+                dir_id = self._dir_ids[dir_name] = len(self._dirs)
+                self._dirs.append(dir_name)
+            # 第 i 个文件名的偏移 = 块起点 + 前 i 个文件名的字节数 + i 个分隔符
+            offsets = map(operator.add, accumulate(lengths, initial=len(self._names)), range(len(lengths)))
+            self._off.extend(array("I", offsets)[:len(lengths)])
+            self._len.extend(lengths)
+            self._names += blob
+            self._dir.extend(array("I", [dir_id]) * len(lengths))
+        n = len(self._dir) - first
+        if self._predicate is None:
+            states = bytes(n)  # 全部 VISIBLE
+        else:
+            states = bytes(self._filtered_state(Path(path)) for path in paths)
+        self._state.frombytes(states)
+        self._cat.extend(array("h", [-1]) * n)
+        self._pos.extend(range(len(self._order), len(self._order) + n))
+        self._order.extend(range(first, first + n))
+        self._visible.extend(1 if state == VISIBLE else 0 for state in states)
+        return first
+    
+    def remove(self, index, category=None):
+        """
+        移出第 index 个可见条目（打墓碑），返回其 slot，撤回时交给 restore()
+        
+        :param category: 移入的类别，计入按类别计数；None 时保留条目已有的类别
+        """
+        slot = self._order[self._visible.select(index)]
+        self._remove_slot(slot, category)
+        return slot
+    
+    def remove_paths(self, paths, category=None):
+        """批量移出，返回 {Path: slot}（不在队列中的路径忽略）"""
+        slots = {}
+        for path, slot in self._find_many(paths).items():
+            if self._state[slot] != REMOVED:
+                self._remove_slot(slot, category)
+                slots[Path(path)] = slot
+        return slots
+    
+    def restore(self, slot):
+        """
+        撤回移出：条目回到原来的位置，返回其可见序号
+        
+        当前有筛选时按筛选条件重新判断：不符合的条目恢复为隐藏（返回值为它之前的可见条目数）
+        """
+        if self._state[slot] == REMOVED:
+            self._removed -= 1
+        self._set_category(slot, None)
+        self._set_state(slot, self._filtered_state(self._path(slot)))
+        return self._visible.prefix(self._pos[slot])
+    
+    def insert(self, index, path):
+        """在第 index 个可见条目前插入新路径（原本不在队列中的文件，如重启后撤回），O(n)"""
+        slot = self._find(path)
+        if slot is not None:
+            return self.restore(slot)
+        pos = self._visible.select(index) if index < len(self) else len(self._order)
+        self.extend([path])  # 按当前筛选条件决定是否可见
+        slot = self._order.pop()
+        self._order.insert(pos, slot)
+        self._rebuild()
+        return self._visible.prefix(self._pos[slot])
+    
+    def set_category(self, index, category):
+        """仅标注模式：记录第 index 个可见条目的类别（不移出）"""
+        self._set_category(self._order[self._visible.select(index)], category)
+    
+    def set_categories(self, labels):
+        """仅标注模式：批量记录 {路径: 类别}（None 清除类别），返回 {Path: 可见序号}，不可见的路径忽略"""
+        indices = {}
+        for path, slot in self._find_many(labels).items():
+            if self._state[slot] == VISIBLE:
+                self._set_category(slot, labels[path])
+                indices[Path(path)] = self._visible.prefix(self._pos[slot])
+        return indices
+    
+    def sort_after(self, index, ranks=None, order=None):
+        """
+        第 index 个可见条目之后的部分整体排序（扫描结束时，已浏览的顺序不变）
+        
+        :param ranks: 可选 {路径: 排序键}，有排序键的条目按键排在前面，其余按路径排在后面
+        :param order: 可选，已按路径排好序的 slot（扫描线程中排好）：按它重排，不在其中的条目保持原顺序排在后面
+        """
+        start = self._visible.select(index) + 1 if 0 <= index < len(self) else 0
+        if order is not None and not ranks:
+            pos = self._pos
+            tail = array("I", (slot for slot in order if pos[slot] >= start))
+            if len(tail) < len(self._order) - start:
+                listed = set(tail)
+                tail.extend(slot for slot in self._order[start:] if slot not in listed)
+            self._order[start:] = tail
+            self._rebuild()
+            return
+        names, dirs = self._all_names(), self._dirs
+        rank_of = {slot: ranks[path] for path, slot in self._find_many(ranks).items()} if ranks else {}
+        
+        def key(slot):
+            rank = rank_of.get(slot)
+            path_key = (dirs[self._dir[slot]], names[slot])
+            return (1, path_key) if rank is None else (0, rank, path_key)
+        
+        tail = sorted(self._order[start:], key=key)
+        self._order[start:] = array("I", tail)
+        self._rebuild()
+    
+    def group(self, groups):
+        """同组条目排到一起（放在组内最靠前一张的位置，组内按给定顺序），其余顺序不变"""
+        groups = [list(members) for members in groups]
+        slot_of = self._find_many(path for members in groups for path in members)
+        group_of = {}
+        for members in groups:
+            slots = [slot_of[path] for path in members if path in slot_of]
+            for slot in slots:
+                group_of[slot] = slots
+        order, emitted = array("I"), set()
+        for slot in self._order:
+            members = group_of.get(slot)
+            if members is None:
+                order.append(slot)
+            elif slot not in emitted:
+                order.extend(members)
+                emitted.update(members)
+        self._order = order
+        self._rebuild()
+    
+    def filter(self, predicate=None):
+        """按 predicate(Path) 筛选（None 取消筛选），已移出的条目不受影响"""
+        self._predicate = predicate
+        state, names, dirs, dir_of = self._state, self._all_names(), self._dirs, self._dir
+        for slot in range(len(state)):
+            if state[slot] != REMOVED:
+                state[slot] = self._filtered_state(Path(dirs[dir_of[slot]], names[slot]))
+        self._rebuild()
+    
+    def remaining_paths(self):
+        """尚未移出的全部条目（含被筛选隐藏的），按队列顺序"""
+        return [Path(key) for key in self.remaining_keys()]
+    
+    def remaining_keys(self):
+        """同 remaining_paths，返回路径字符串（交给后台线程批量查询时不必逐个构造 Path）"""
+        names, dirs, dir_of, state = self._all_names(), self._dirs, self._dir, self._state
+        return [os.path.join(dirs[dir_of[slot]], names[slot]) for slot in self._order if state[slot] != REMOVED]
+    
+    # ---------- 统计 ----------
+    
+    @property
+    def filtered(self):
+        return self._predicate is not None
+    
+    @property
+    def remaining(self):
+        """尚未移出的条目数（含被筛选隐藏的）"""
+        return len(self._state) - self._removed
+    
+    @property
+    def removed(self):
+        return self._removed
+    
+    def category_counts(self):
+        """{类别: 条目数}：移出到各类别的数量，仅标注模式下为已标注的数量"""
+        return {cat: n for cat, n in zip(self._cats, self._cat_counts) if n}
+    
+    # ---------- 内部 ----------
+    
+    def _name(self, slot):
+        off = self._off[slot]
+        return self._names[off:off + self._len[slot]].decode("utf-8", "surrogateescape")
+    
+    def _key(self, slot):
+        return os.path.join(self._dirs[self._dir[slot]], self._name(slot))
+    
+    def _path(self, slot):
+        return Path(self._key(slot))
+    
+    def _find(self, path):
+        """路径 → slot：在文件名块中直接查找 \\0name\\0（C 层搜索），再核对目录"""
+        dir_name, name = os.path.split(str(path))
+        dir_id = self._dir_ids.get(dir_name)
+        if dir_id is None:
+            return None
+        needle = b"\0" + name.encode("utf-8", "surrogateescape") + b"\0"
+        start = self._names.find(needle)
+        while start != -1:
+            slot = bisect_right(self._off, start + 1) - 1
+            if self._dir[slot] == dir_id:
+                return slot
+            start = self._names.find(needle, start + 1)
+        return None
+    
+    def _all_names(self):
+        """全部文件名（按 slot），一次解码整块，批量操作用"""
+        if len(self._names) <= 1:
+            return []
+        return self._names[1:-1].decode("utf-8", "surrogateescape").split("\0")
+    
+    def _find_many(self, paths):
+        """批量 路径 → slot（{路径: slot}，按给定顺序，找不到的省略）：少量时逐个查找，多时整块解码后扫描一遍"""
+        paths = list(paths)
+        if len(paths) <= 32:
+            found = ((path, self._find(path)) for path in paths)
+            return {path: slot for path, slot in found if slot is not None}
+        wanted = {}
+        for path in paths:
+            dir_name, name = os.path.split(str(path))
+            dir_id = self._dir_ids.get(dir_name)
+            if dir_id is not None:
+                wanted[(dir_id, name)] = path
+        found, dir_of = {}, self._dir
+        for slot, name in enumerate(self._all_names()):
+            path = wanted.get((dir_of[slot], name))
+            if path is not None:
+                found[path] = slot
+        return {path: found[path] for path in paths if path in found}
+    
+    def _remove_slot(self, slot, category):
+        if category is not None:
+            self._set_category(slot, category)
+        if self._state[slot] != REMOVED:
+            self._removed += 1
+        self._set_state(slot, REMOVED)
+    
+    def _filtered_state(self, path):
+        return VISIBLE if self._predicate is None or self._predicate(path) else HIDDEN
+    
+    def _set_state(self, slot, state):
+        old = self._state[slot]
+        if old == state:
+            return
+        self._state[slot] = state
+        if old == VISIBLE or state == VISIBLE:
+            self._visible.add(self._pos[slot], 1 if state == VISIBLE else -1)
+    
+    def _set_category(self, slot, category):
+        old = self._cat[slot]
+        if old >= 0:
+            self._cat_counts[old] -= 1
+        if category is None:
+            self._cat[slot] = -1
+            return
+        cat_id = self._cat_ids.get(category)
+        if cat_id is None:
+            cat_id = self._cat_ids[category] = len(self._cats)
+            self._cats.append(category)
+            self._cat_counts.append(0)
+        self._cat[slot] = cat_id
+        self._cat_counts[cat_id] += 1
+    
+    def _rebuild(self):
+        """顺序变化后重建 slot → 位置映射与可见计数"""
+        pos = array("I", bytes(4 * len(self._order)))
+        for i, slot in enumerate(self._order):
+            pos[slot] = i
+        self._pos = pos
+        self._visible.build(map(VISIBLE.__eq__, map(self._state.__getitem__, self._order)))
@@ -1,17 +1,83 @@
 # image_annotator.py
+import multiprocessing
+import sys
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包后进程池需要（子进程在这里接管并退出）
+    if len(sys.argv) > 1 and sys.argv[1:] != ["--startup-time"]:
+        # 带参数运行：命令行批量模式（python main.py apply labels.csv --dir ...），
+        # 在导入 Tk / customtkinter / ImageTk 之前分派，不加载 GUI
+        from img_cls.cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
+
 import json
+import math
 import os
-import shutil
+import queue
 import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from tkinter import messagebox, filedialog
 
 import customtkinter as ctk
 from PIL import Image, ImageTk
 
+# 去重 / 预标注依赖 numpy，在首次使用时才导入（见 find_duplicates / _build_predictor）
+from img_cls import (
+    CHECK_STATUS_NAMES, PREVIEW_RESAMPLE, THUMB_EDGE, TILE_SIZE, TRACER,
+    DirectoryScanner, FileMover, ImagePrefetcher, ImagePyramid, IntegrityChecker, LabelManifest, LeaseManager, LRUCache,
+    SessionIndex, StartupTimer, ThumbnailCache, ThumbnailLoader, WorkQueue, decode_image,
+    fit_view, render_tile, visible_tiles, process_memory_mb, zoom_at,
+)
+
+STARTUP = StartupTimer()  # 启动耗时（python main.py --startup-time 输出）
+STARTUP.mark("imports")
+
+REFINE_DELAY_MS = 150  # 输入停止多久后开始高质量重绘
+FRAME_INTERVAL_MS = 16  # 切换图像的最短间隔（约 60fps），按住方向键时只显示每帧最新的目标
+STATS_INTERVAL_MS = 500  # 性能统计浮层的刷新间隔
+STATS_SPANS = ("frame", "decode", "resize", "photoimage", "canvas", "scan_dir", "move")  # 浮层中显示的计时项（按此顺序）
+SUGGEST_COLOR = "#e0a800"  # 预测类别按钮的高亮边框
+STARTUP_REPORT = "startup_time.jsonl"  # --startup-time 的结果追加到此文件（打包的窗口程序没有控制台）
+FILTER_NAMES = ("全部", "未标注", "按扩展名…", "按大小…")  # 队列筛选
+CHECK_LOOKAHEAD = 64  # 完整性预检优先检查当前位置之后的张数
+SCAN_BATCHES_PER_TICK = 4  # 每次轮询最多并入的扫描批数（其余留到下一轮，不长时间占住 UI 线程）
+QUARANTINE_DIR = "_quarantine"  # "integrity_action": "move" 时问题图像移入的目录（image_dir 下）
+
+
+def parse_size_range(text):
+    """解析大小范围（MB）：「1-5」「>2」「<0.5」「3」（至少 3MB），返回字节数 (lo, hi)，None 表示不限"""
+    text = text.strip().replace(" ", "").lower().removesuffix("mb")
+    mb = 1024 * 1024
+    if text.startswith(">"):
+        return float(text[1:]) * mb, None
+    if text.startswith("<"):
+        return None, float(text[1:]) * mb
+    lo, _, hi = text.partition("-")
+    return float(lo) * mb, float(hi) * mb if hi else None
+
+
+def file_sizes(paths, known=None):
+    """{路径字符串: 字节数}：known 中有的直接用，其余逐个 stat（取不到为 None）；NAS 上每次 stat 都是一次往返，在后台线程中调用"""
+    known = known or {}
+    sizes = {}
+    for path in paths:
+        size = known.get(path)
+        if size is None:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                pass
+        sizes[path] = size
+    return sizes
+
 
 class ImageAnnotator(ctk.CTk):
-    def __init__(self, width=1400, height=900):
+    APPLY_MODE_NAMES = {"移动": "move", "复制": "copy", "硬链接": "hardlink"}
+    
+    def __init__(self, width=1400, height=900, measure_startup=False):
         super().__init__()
         self.title("图像分类工具")
         self.geometry(f"{width}x{height}")
@@ -21,11 +87,36 @@ class ImageAnnotator(ctk.CTk):
         
         # 配置 & 状态
         self.config_path = "config.json"
+        self.cfg = {}
         self.image_dir = None
         self.curr_idx = -1
         self.current_image_path = None
-        self.image_files = []
-        self.undo_stack = None  # (src_path, dst_path, category)
+        self.image_files = WorkQueue()  # 待标注队列：下标 / len 只针对可见条目，移出打墓碑，撤回原位恢复
+        self.mover = None  # FileMover，选择目录后创建
+        self.scanner = None  # DirectoryScanner，目录扫描完成后置 None
+        self.session = None  # SessionIndex，选择目录后创建
+        self.leases = None  # LeaseManager，config.json 中 "shared": true 时创建（多人同时标注同一共享目录）
+        self.checker = None  # IntegrityChecker，config.json 中 "integrity_check": true 时随目录扫描在后台预检
+        self.quarantine = {}  # {Path: (状态, 说明)}，预检发现的问题图像，已移出队列
+        self._quarantine_removed = 0  # 因隔离移出队列的张数（不计入「本次已分类」）
+        self._user_filter = None  # 筛选菜单选择的条件，与分片条件组合
+        self._resume_path = None  # 扫描到该路径时恢复上次的浏览位置
+        self.thumb_loader = None  # ThumbnailLoader，首次打开缩略图网格时创建
+        self.grid_view = None  # ThumbnailGrid 窗口
+        self.undo_stack = []  # 可撤回的操作（FileMover 移动记录 / 仅标注模式的 label 记录），支持多步撤回
+        self.manifest = None  # LabelManifest，仅标注模式下按需创建
+        self.label_only = False  # 仅记录标注，不移动文件（config.json 中 "label_mode": "manifest" 默认开启）
+        self._apply_future = None
+        self.clusters = {}  # {Path: 所在相似组（list[Path]）}，查找相似图后填充
+        self.digests = {}  # {Path: 文件内容摘要}，用于识别完全相同的文件
+        self._dedup_future = None
+        self._filter_future = None  # 按大小筛选时后台读取文件大小
+        self.category_buttons = {}  # {类别: 按钮}，按钮上显示该类别的计数
+        self.predictor = None  # LabelPredictor，「预测类别」后创建，之后随每次分类 / 撤回增量更新
+        self.suggestion = None  # 当前图像的预测类别（按钮高亮，回车确认）
+        self._predict_future = None
+        self._predict_backlog = []  # 建索引期间的标注 / 撤回 [(方法名, 参数)]，建好后按顺序补上
+        self.predict_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="predict")  # 建索引与增量更新按提交顺序执行
         
         # 缩放状态
         self.zoom_level = 1.0
@@ -33,29 +124,94 @@ class ImageAnnotator(ctk.CTk):
         self.max_zoom = 20.0
         self.pan_x = 0
         self.pan_y = 0
-        self.original_pil_image = None  # 原始未缩放 PIL 图像（只加载一次）
-        self.current_tk_photo = None  # 当前显示的 PhotoImage（缓存）
-        self.zoom_cache = {}  # {zoom_key: PhotoImage}，key = (w,h,zoom)
-        self._last_wheel_time = 0  # 防抖时间戳（秒）
+        self.original_pil_image = None  # 解码后的 PIL 图像（适配 canvas 时为降采样版本，放大时再换成全分辨率）
+        self.image_size = None  # 原图尺寸 (w, h)，缩放计算均以原图为准
+        self.image_mode = None  # 原图模式（RGB / L / P / CMYK 等），显示在状态栏
+        self.image_is_full = False  # original_pil_image 是否为全分辨率
+        self._full_res_future = None  # 后台全分辨率解码任务
+        self.pyramid = None  # original_pil_image 的多分辨率金字塔
+        self._tile_items = {}  # {(tile_key, is_preview): (canvas item id, PhotoImage)}，当前显示的瓦片
+        self._pan_anchor = None  # 拖拽平移起点 (x, y)
+        self.current_tk_photo = None  # 当前显示的瓦片 PhotoImage 列表（保持强引用）
+        self.zoom_cache = None  # LRUCache {tile_key: PhotoImage}，key = (path, 解码尺寸, 缩放尺寸, 瓦片索引)
+        self._preview_job = None  # 合并同一轮事件中的多次滚轮 → 只预览渲染一次
+        self._refine_job = None  # 输入空闲后的高质量重绘
+        self._render_generation = 0  # 每次交互递增，用于丢弃过期的后台渲染结果
+        self._frame_job = None  # 合并导航 / 分类事件 → 每帧只显示最新的 curr_idx
+        self._last_frame = 0.0
+        self._skipped_frames = 0  # 被合并掉、没有解码显示的中间图像数
+        self._on_screen = None  # 屏幕上显示、可以接受分类按键的图像；已被分类则为 None，等待下一帧
+        self.render_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render")
+        self.task_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task")  # 批量应用等长任务
         
-        # 加载配置
+        # 加载配置（出错时的提示在窗口显示之后再弹出）
+        self._config_error = None
         self.categories = self.load_config()
         
-        # 构建 UI
+        # 后台预取相邻图像（config.json 中 "prefetch": {"ahead", "behind", "memory_mb", "workers"}）
+        self.prefetcher = ImagePrefetcher(**self.cfg.get("prefetch", {}))
+        # 瓦片缓存按字节预算 LRU 淘汰，跨图像保留（回到上一张无需重新渲染）
+        self.zoom_cache = LRUCache(self.cfg.get("zoom_cache_mb", 256))
+        self.label_only = self.cfg.get("label_mode") == "manifest"
+        # 性能统计：F3 显示浮层，F4 导出 trace（config.json 中 "stats_overlay": true 默认显示，
+        # "trace_file" 指定关闭窗口时自动导出的路径，.jsonl 为逐行事件，其余为 Chrome trace）
+        self._stats_job = None
+        TRACER.enabled = bool(self.cfg.get("stats_overlay") or self.cfg.get("trace_file"))
+        
+        # 先显示窗口与占位文字，其余控件在第一帧画出之后再构建
+        self.measure_startup = measure_startup  # 启动完成后输出各阶段耗时并退出
+        self._placeholder = ctk.CTkLabel(self, text="正在加载…", font=ctk.CTkFont(size=16), text_color="gray50")
+        self._placeholder.place(relx=0.5, rely=0.5, anchor="center")
+        if self._windowingsystem == 'win32':
+            # Windows: 强制启用 DWM 缓冲 + 禁用重绘闪烁
+            # 避免从最小化到显示窗口的过程中，窗口出现重绘闪烁
+            self.wm_overrideredirect(True)  # 临时去边框（防闪烁）
+            self.update()
+            self.wm_overrideredirect(False)  # 立即恢复
+        self.update()
+        STARTUP.mark("window")
+        self.after(0, self._finish_startup)
+    
+    def _finish_startup(self):
+        """第一帧之后：构建 UI、绑定按键；事件循环第一次空闲即可交互"""
+        self._placeholder.destroy()
         self.setup_ui()
         self.bind_event()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after(200, self._poll_mover)
+        if self.cfg.get("stats_overlay"):
+            self.toggle_stats_overlay()
+        STARTUP.mark("ui")
+        self.after_idle(self._startup_done)
+    
+    def _startup_done(self):
+        STARTUP.mark("interactive")
+        if self.measure_startup:
+            report = STARTUP.report()
+            if sys.stdout is not None:
+                print("启动耗时（ms）：" + "，".join(f"{k[:-3]} {v}" for k, v in report.items() if k.endswith("_ms")))
+            try:
+                with open(STARTUP_REPORT, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"time": time.strftime("%Y-%m-%d %H:%M:%S"), **report}) + "\n")
+            except OSError as e:
+                print(f"[Error] write startup report: {e}")
+            self.on_close()
+            return
+        if self._config_error is not None:
+            messagebox.showerror(*self._config_error, parent=self)
     
     def load_config(self):
         cats = []
         try:
             with open(self.config_path, "r", encoding="utf-8") as f:
                 cfg = json.load(f)
+            self.cfg = cfg
             cats = cfg.get("categories", [])
             if not cats:
-                messagebox.showerror("加载 config.json 失败", "config.json 中 categories 为空")
+                self._config_error = ("加载 config.json 失败", "config.json 中 categories 为空")
             cats = list(map(str, cats))
         except FileNotFoundError:
-            messagebox.showerror("加载 config.json 失败", "已创建 config.json，请配置标签类别")
+            self._config_error = ("加载 config.json 失败", "已创建 config.json，请配置标签类别")
             tmp = {"categories": []}
             with open("config.json", 'w') as f:
                 json.dump(tmp, f)
@@ -118,6 +274,14 @@ class ImageAnnotator(ctk.CTk):
             font=ctk.CTkFont(size=14, weight="bold")
         ).grid(row=0, column=1, sticky='ew')
         
+        ctk.CTkButton(
+            file_btn_frame,
+            text="缩略图",
+            command=self.open_grid_view,
+            height=30,
+            font=ctk.CTkFont(size=14)
+        ).grid(row=1, column=0, columnspan=2, padx=(5, 0), pady=(6, 0), sticky='ew')
+        
         switch_image_frame = ctk.CTkFrame(control_frame, fg_color='transparent')
         switch_image_frame.grid_columnconfigure(0, weight=1)
         switch_image_frame.grid_columnconfigure(1, weight=1)
@@ -146,14 +310,15 @@ class ImageAnnotator(ctk.CTk):
         cat_btn_frame.grid_columnconfigure(tuple(range(num_col)), weight=1)
         cat_btn_frame.grid(row=3, column=0, padx=10, pady=10, sticky="nsew")
         for i, category in enumerate(self.categories):
-            ctk.CTkButton(
+            self.category_buttons[category] = ctk.CTkButton(
                 cat_btn_frame,
                 text=category,
                 # 避免闭包导致参数为遍历的最后一个元素，lambda中会出现闭包问题
                 command=lambda cat=category: self.move_to_category(cat),
                 height=10,
                 font=ctk.CTkFont(size=14)
-            ).grid(row=i // num_col, column=i % num_col, padx=5, pady=5, stick='ew')
+            )
+            self.category_buttons[category].grid(row=i // num_col, column=i % num_col, padx=5, pady=5, stick='ew')
         # 撤回按钮
         self.btn_undo = ctk.CTkButton(
             control_frame,
@@ -165,6 +330,83 @@ class ImageAnnotator(ctk.CTk):
             state='disabled'
         )
         self.btn_undo.grid(row=4, column=0, padx=10, pady=(6, 12), sticky="ew")
+        
+        # 仅标注模式：分类只记录到清单，最后一次性批量应用
+        manifest_frame = ctk.CTkFrame(control_frame, fg_color='transparent')
+        manifest_frame.grid_columnconfigure((0, 1), weight=1)
+        manifest_frame.grid(row=5, column=0, padx=10, pady=(0, 12), sticky="ew")
+        self.switch_label_only = ctk.CTkSwitch(
+            manifest_frame,
+            text="仅记录标注",
+            command=self.toggle_label_only,
+            font=ctk.CTkFont(size=14)
+        )
+        if self.label_only:
+            self.switch_label_only.select()
+        self.switch_label_only.grid(row=0, column=0, columnspan=2, pady=(0, 6), sticky="w")
+        self.apply_mode_menu = ctk.CTkOptionMenu(
+            manifest_frame,
+            values=list(self.APPLY_MODE_NAMES),
+            font=ctk.CTkFont(size=14)
+        )
+        self.apply_mode_menu.grid(row=1, column=0, padx=(0, 5), sticky="ew")
+        self.btn_apply = ctk.CTkButton(
+            manifest_frame,
+            text="应用标注",
+            command=self.apply_labels,
+            height=30,
+            font=ctk.CTkFont(size=14)
+        )
+        self.btn_apply.grid(row=1, column=1, sticky="ew")
+        
+        # 近重复检测：相似图排在一起，可整组一次标注
+        dedup_frame = ctk.CTkFrame(control_frame, fg_color='transparent')
+        dedup_frame.grid_columnconfigure(0, weight=1)
+        dedup_frame.grid(row=6, column=0, padx=10, pady=(0, 12), sticky="ew")
+        self.btn_dedup = ctk.CTkButton(
+            dedup_frame,
+            text="查找相似图",
+            command=self.find_duplicates,
+            height=30,
+            font=ctk.CTkFont(size=14)
+        )
+        self.btn_dedup.grid(row=0, column=0, sticky="ew")
+        self.switch_cluster_label = ctk.CTkSwitch(
+            dedup_frame,
+            text="按相似组标注",
+            font=ctk.CTkFont(size=14)
+        )
+        self.switch_cluster_label.grid(row=1, column=0, pady=(6, 0), sticky="w")
+        
+        # 预标注：从类别目录中已分好的图像学习，高亮预测的类别，回车确认
+        self.btn_predict = ctk.CTkButton(
+            control_frame,
+            text="预测类别",
+            command=self.start_prediction,
+            height=30,
+            font=ctk.CTkFont(size=14)
+        )
+        self.btn_predict.grid(row=7, column=0, padx=10, pady=(0, 12), sticky="ew")
+        
+        # 队列筛选与跳转
+        queue_frame = ctk.CTkFrame(control_frame, fg_color='transparent')
+        queue_frame.grid_columnconfigure(0, weight=1)
+        queue_frame.grid(row=8, column=0, padx=10, pady=(0, 12), sticky="ew")
+        self.filter_menu = ctk.CTkOptionMenu(
+            queue_frame,
+            values=list(FILTER_NAMES),
+            command=self.apply_filter,
+            font=ctk.CTkFont(size=14)
+        )
+        self.filter_menu.grid(row=0, column=0, padx=(0, 5), sticky="ew")
+        ctk.CTkButton(
+            queue_frame,
+            text="跳转",
+            command=self.ask_jump,
+            width=60,
+            height=30,
+            font=ctk.CTkFont(size=14)
+        ).grid(row=0, column=1, sticky="ew")
     
     def setup_bottom_frame(self):
         status_bar = ctk.CTkFrame(self, height=20, fg_color="transparent")
@@ -180,6 +422,16 @@ class ImageAnnotator(ctk.CTk):
         )
         self.status_left.pack(side="left", fill="y")
         
+        # 中间：性能统计浮层（F3 切换，默认隐藏）
+        self.status_stats = ctk.CTkLabel(
+            status_bar,
+            text="",
+            font=ctk.CTkFont(size=11),
+            anchor="w",
+            padx=10,
+            text_color="gray40"
+        )
+        
         # 右侧：图像尺寸/快捷键等（右对齐）
         self.status_right = ctk.CTkLabel(
             status_bar,
@@ -199,10 +451,15 @@ class ImageAnnotator(ctk.CTk):
         self.image_canvas.bind("<ButtonPress-1>", self._start_pan)  # 中键拖拽平移（可选）
         self.image_canvas.bind("<B1-Motion>", self._pan)
         self.bind("<KeyPress-r>", lambda e: self.reset_zoom())
+        self.bind("<F3>", lambda e: self.toggle_stats_overlay())
+        self.bind("<F4>", lambda e: self.export_trace())
+        self.bind("<Control-g>", lambda e: self.ask_jump())
+        self.bind("<Return>", lambda e: self.accept_suggestion())
         self.bind("<Left>", lambda e: self.prev_image())
         self.bind("<Right>", lambda e: self.next_image())
-        self.bind("<KeyRelease-a>", lambda e: self.next_image())
-        self.bind("<KeyRelease-d>", lambda e: self.next_image())
+        # 按住方向键时每次自动重复都会触发，显示由 _request_frame 按帧合并
+        self.bind("<KeyPress-a>", lambda e: self.prev_image())
+        self.bind("<KeyPress-d>", lambda e: self.next_image())
         # 避免闭包导致参数始终为遍历的最后一个元素，lambda中会出现闭包问题
         [self.bind(f"<KeyRelease-{i + 1}>", lambda e, cat=category: self.move_to_category(cat))
          for i, category in enumerate(self.categories) if i < 9]
@@ -225,6 +482,32 @@ class ImageAnnotator(ctk.CTk):
             if self.original_pil_image:
                 self.after(10, self._fit_to_canvas)
     
+    def on_close(self):
+        if self.scanner is not None:
+            self.scanner.cancel()
+        if self.mover is not None:
+            self.mover.close()  # 等待队列中的移动完成
+        if self.leases is not None:
+            self.leases.close()  # 归还分片
+        if self.checker is not None:
+            self.checker.stop(wait=True)
+        self.task_executor.shutdown(wait=True)  # 等待批量应用完成
+        self.predict_executor.shutdown(wait=False, cancel_futures=True)
+        self._close_manifest()  # 先于会话索引关闭
+        if self.session is not None:
+            self.session.close()
+        if self.thumb_loader is not None:
+            self.thumb_loader.shutdown()
+            self.thumb_loader.cache.close()
+        self.prefetcher.shutdown()
+        self.render_executor.shutdown(wait=False, cancel_futures=True)
+        if self.cfg.get("trace_file"):
+            try:
+                TRACER.export(self.cfg["trace_file"])
+            except OSError as e:
+                print(f"[Error] export trace: {e}")
+        self.destroy()
+    
     def get_center_position(self, width, height):
         screen_width = self.winfo_screenwidth()
         screen_height = self.winfo_screenheight()
@@ -241,41 +524,183 @@ class ImageAnnotator(ctk.CTk):
             os.startfile(dir_obj)
     
     def select_image_dir(self):
+        if self._apply_busy():
+            return
         dir_path = filedialog.askdirectory(title="请选择包含图像的目录")
         if not dir_path:
             return
         self.image_dir = Path(dir_path)
+        # 打开目录时工具自己会创建 / 压缩日志和索引文件：之前目录未被外部修改过的话，不因此整目录重扫
+        root_mtime = os.stat(self.image_dir).st_mtime_ns
         self.title(f"图像标注工具 - {dir_path}")
-        exts = {".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".webp"}
-        self.image_files = sorted([
-            p for p in self.image_dir.iterdir()
-            if p.is_file() and p.suffix.lower() in exts
-        ])
-        if self.image_files:
+        self.prefetcher.cancel()
+        if self.scanner is not None:
+            self.scanner.cancel()
+            self.scanner = None
+        # 切换目录前先完成旧目录的移动；新目录中崩溃前未完成的移动继续执行
+        if self.mover is not None:
+            self.mover.close()
+        if self.leases is not None:
+            self.leases.close()
+            self.leases = None
+        if self.checker is not None:
+            self.checker.stop(wait=True)  # 先于会话索引关闭
+            self.checker = None
+        if self.cfg.get("shared", False):
+            # 多人共享目录：先领取几个分片，只显示这些分片中的图像，处理完再领取
+            self.leases = LeaseManager(
+                self.image_dir,
+                chunks=self.cfg.get("lease_chunks", 64),
+                ttl=self.cfg.get("lease_ttl", 120),
+                owner=self.cfg.get("instance_name"),
+            )
+            self.leases.claim(count=self.cfg.get("lease_claim", 2))
+        self._close_manifest()
+        if self.session is not None:
+            self.session.close()
+        owner = self.leases.owner if self.leases is not None else None
+        self.session = SessionIndex(self.image_dir, owner=owner)
+        self._resume_path = self.session.last_path()
+        self.mover = FileMover(self.image_dir, on_done=self._sync_session, owner=owner)
+        replayed, self.undo_stack = self.mover.recover()
+        self.session.dir_touched(self.image_dir, root_mtime)
+        self.btn_undo.configure(state="normal" if self.undo_stack else "disabled")
+        moving = {op["src"] for op in replayed}
+        self.clusters = {}
+        self.digests = {}
+        self.predictor = None
+        self._predict_backlog = []
+        self.quarantine = {}
+        self._quarantine_removed = 0
+        if self.cfg.get("integrity_check", False):
+            # 完整性预检：进程池中完整解码一遍，截断 / 损坏 / 空文件在浏览到之前就移出队列
+            self.checker = IntegrityChecker(self.session, workers=self.cfg.get("integrity_workers"))
+        
+        # 后台流式扫描：找到第一批就显示，其余按批追加（config.json 中 "recursive_scan": true 递归子目录）
+        # 未变化的目录直接读会话索引
+        self.image_files = WorkQueue()
+        self._scan_slots = array("I")  # 扫描结果按到达顺序 → 队列中的 slot（扫描结束时按扫描线程排好的顺序重排）
+        self.curr_idx = -1
+        self.filter_menu.set(FILTER_NAMES[0])
+        self._user_filter = None
+        self._filter_future = None
+        self._refilter()
+        self._clear_canvas()
+        self.scanner = DirectoryScanner(
+            self.image_dir,
+            recursive=self.cfg.get("recursive_scan", False),
+            skip_dirs=self.categories + [self.cfg.get("quarantine_dir", QUARANTINE_DIR)],
+            exclude=moving,
+            index=self.session,
+        )
+        self.status_left.configure(text="扫描中…")
+        self._poll_scan(self.scanner)
+    
+    def _poll_scan(self, scanner):
+        if scanner is not self.scanner:
+            return  # 已切换目录
+        finished = busy = False
+        for _ in range(SCAN_BATCHES_PER_TICK):
+            try:
+                batch = scanner.batches.get_nowait()
+            except queue.Empty:
+                break
+            if batch is None:
+                finished = True
+                break
+            first = self.image_files.extend(batch)
+            self._scan_slots.extend(range(first, first + len(batch)))
+            if self.checker is not None:
+                self.checker.submit(batch)
+            if self._resume_path is not None and self._resume_path in batch and self.curr_idx <= 0:
+                # 恢复上次浏览位置（用户尚未开始翻页时；共享模式下该图像可能不在自己的分片中）
+                if self._resume_path in self.image_files:
+                    self.curr_idx = self.image_files.index(self._resume_path)
+                    self.load_and_show_image(self.image_files[self.curr_idx])
+                self._resume_path = None
+        else:
+            busy = True  # 本轮处理满了，队列里可能还有
+        
+        if finished:
+            self.scanner = None
+            self._resume_path = None
+            if self.checker is not None:
+                self.checker.finish()
+            # 扫描结束后对尚未浏览的部分整体排序（已看过的顺序不变）：顺序已在扫描线程中排好
+            if scanner.order is not None:
+                slots = self._scan_slots
+                self.image_files.sort_after(self.curr_idx, order=array("I", map(slots.__getitem__, scanner.order)))
+            else:
+                self.image_files.sort_after(self.curr_idx)
+            self._scan_slots = array("I")
+            if not self.image_files:
+                self._claim_more()  # 领取的分片里没有图像（已被其他人处理完）
+        if self.curr_idx < 0 and self.image_files:
             self.curr_idx = 0
             self.load_and_show_image(self.image_files[self.curr_idx])
-        else:
+        elif self.image_files and not self.label_only:
+            self.status_right.configure(text=self._progress_text() + ("" if finished else "（扫描中）"))
+        
+        self._refresh_grid()
+        if not finished:
+            self.after(0 if busy else 50, self._poll_scan, scanner)
+        elif not self.image_files:
             messagebox.showwarning("无图像", "该目录中未找到支持的图像文件（.jpg/.jpeg/.png/.bmp/.tiff/.webp）")
-            self.status_right.config(text="(无有效图像)")
+            self.status_left.configure(text="就绪")
+            self.status_right.configure(text="(无有效图像)")
     
     def load_and_show_image(self, image_path):
+        self._on_screen = image_path
         try:
             # ✅ 1. 只加载一次原始图像（缓存）
             if self.original_pil_image is None or self.current_image_path != image_path.__str__():
-                self.original_pil_image = Image.open(image_path).convert("RGBA")
+                # 优先使用后台预取好的图像，未命中再同步解码
+                decoded = self.prefetcher.take(image_path)
+                if decoded is None:
+                    decoded = decode_image(image_path, self._canvas_size())
+                    self.prefetcher.put(image_path, decoded)
+                self.original_pil_image = decoded.image
+                self.pyramid = ImagePyramid(decoded.image, decoded.full_size)
+                self.image_size = decoded.full_size
+                self.image_mode = decoded.mode
+                self.image_is_full = decoded.is_full
+                self._full_res_future = None
                 self.current_image_path = image_path
                 self.zoom_level = 1.0
                 self.pan_x = self.pan_y = 0
-                self.zoom_cache.clear()  # 清旧缓存
             
             # ✅ 2. 重置为 fit 模式（首次显示或 reset 后）
             self.reset_zoom()
             
             # ✅ 3. 更新窗口标题 & 状态栏
             filename = os.path.basename(image_path)
-            w, h = self.original_pil_image.size
-            self.status_left.configure(text=f"{filename} | {w}×{h} px | Zoom: {self.zoom_level:.2f}×")
-            self.status_right.configure(text=f"剩余{len(self.image_files)}张")
+            w, h = self.image_size
+            mode = self.image_mode  # 原图模式（解码时记录，显示用的图像已转为 RGBA）
+            if self.session is not None:
+                self.session.record_view(image_path, w, h)  # 只更新内存，后台写入
+            self.status_left.configure(
+                text=f"{filename} | {w}×{h} px" + (f" | {mode}" if mode else "") + f" | Zoom: {self.zoom_level:.2f}×"
+            )
+            if self.label_only:
+                label = self._manifest().get(image_path)
+                self.status_right.configure(text=self._progress_text() + (f" | 当前：{label}" if label else ""))
+            else:
+                self.status_right.configure(text=self._progress_text())
+            self._update_category_counts()
+            self._update_suggestion(image_path)
+            cluster = self.clusters.get(image_path)
+            if cluster is not None:
+                self.status_right.configure(
+                    text=self.status_right.cget("text") + f" | 相似组 {cluster.index(image_path) + 1}/{len(cluster)}"
+                )
+            
+            # ✅ 4. 预取相邻图像，并优先预检接下来的图像
+            self.prefetcher.schedule(self.image_files, self.curr_idx, self._canvas_size())
+            if self.checker is not None:
+                start = self.curr_idx + 1
+                stop = min(start + CHECK_LOOKAHEAD, len(self.image_files))
+                self.checker.prioritize(self.image_files.paths(start, stop))
+            self._refresh_grid()
         
         except Exception as e:
             self.status_left.configure(text=f"加载失败：{str(e)}")
@@ -284,70 +709,880 @@ class ImageAnnotator(ctk.CTk):
             print(f"[Error] load_and_show_image: {e}")
     
     def move_to_category(self, category_name):
-        if not self.image_files:
+        if not self.image_files or self._apply_busy() or not self._target_on_screen():
+            return
+        if self.switch_cluster_label.get() and self.image_files[self.curr_idx] in self.clusters:
+            self._label_cluster(category_name)
+            return
+        if self.label_only:
+            self._label_current(category_name)
             return
         src_path = Path(self.image_files[self.curr_idx])
-        dst_dir = Path(self.image_dir) / category_name
-        dst_dir.mkdir(exist_ok=True)
-        dst_path = dst_dir / src_path.name
-        
-        # 防止重名覆盖（加序号）
-        counter = 1
-        original_dst = dst_path
-        while dst_path.exists():
-            stem = original_dst.stem
-            suffix = original_dst.suffix
-            dst_path = original_dst.parent / f"{stem}_{counter}{suffix}"
-            counter += 1
         
         try:
-            # if src_path.exists():
-            shutil.move(str(src_path), str(dst_path))
-            # 记录撤回信息
-            self.undo_stack = (str(src_path), str(dst_path), category_name)
-            self.btn_undo.configure(state="normal")
-            
-            # 从列表中移除当前项（避免重复操作）
-            self.image_files.pop(self.curr_idx)
-            if self.curr_idx >= len(self.image_files):
-                self.curr_idx = max(0, len(self.image_files) - 1)
-            if self.image_files:
-                self.load_and_show_image(self.image_files[self.curr_idx])
-            else:
-                self._clear_canvas()
-                messagebox.showinfo("完成", message="图像已分类")
+            # 只登记移动，实际 I/O 由后台线程完成
+            op = self.mover.move(src_path, Path(self.image_dir) / category_name)
         except Exception as e:
             messagebox.showerror("移动失败", f"无法移动文件：\n{e}")
+            return
+        # 记录撤回信息
+        self.undo_stack.append(op)
+        self.btn_undo.configure(state="normal")
+        
+        # 从队列中移出当前项（打墓碑，撤回时原位恢复）；slot 只保存在内存中的操作记录里
+        op["slot"] = self.image_files.remove(self.curr_idx, category_name)
+        self._learn([src_path], category_name)
+        self.prefetcher.invalidate(src_path)
+        self.zoom_cache.discard(lambda key: key[0] == str(src_path))
+        # 列表清空时 curr_idx 为 -1，扫描中新到的图像会从头显示
+        self.curr_idx = min(self.curr_idx, len(self.image_files) - 1)
+        self._on_screen = None
+        if self.image_files:
+            self._request_frame()
+        elif not self._claim_more():
+            self._clear_canvas()
+            self.prefetcher.cancel()
+            self._refresh_grid()
+            self.status_right.configure(text=self._progress_text())
+            self._update_category_counts()
+            if self.scanner is None and (self.leases is not None or not self.image_files.filtered):
+                messagebox.showinfo("完成", message="图像已分类")
     
     def undo_last_move(self):
-        if self.undo_stack is None:
+        if not self.undo_stack or self._apply_busy():
+            return
+        op = self.undo_stack.pop()
+        if not self.undo_stack:
+            self.btn_undo.configure(state="disabled")
+        # 缩略图网格中多选分类的一组操作整体撤回
+        ops = op["ops"] if op["op"] == "group" else [op]
+        if not ops:
+            return
+        if ops[0]["op"] == "label":
+            # 仅标注模式：恢复清单中的上一个类别（整组一个事务），并回到该图像
+            prevs = {Path(sub["path"]): sub["prev"] for sub in ops}
+            self._manifest().restore_many(prevs)
+            self.image_files.set_categories(prevs)
+            by_prev = {}
+            for path, prev in prevs.items():
+                by_prev.setdefault(prev, []).append(path)
+            for prev, group in by_prev.items():
+                if prev is None:
+                    self._unlearn(group)
+                else:
+                    self._learn(group, prev)
+            path = Path(ops[0]["path"])
+            if path in self.image_files:
+                self.curr_idx = self.image_files.index(path)
+                self.load_and_show_image(path)
             return
-        src, dst, cat = self.undo_stack
-        self.btn_undo.configure(state="disabled")
         try:
-            shutil.move(dst, src)
-            self.image_files.insert(self.curr_idx, Path(src))
+            revs = [self.mover.undo(sub) for sub in reversed(ops)]
+        except Exception as e:
+            messagebox.showerror("撤回失败", f"无法还原文件：\n{e}")
+            return
+        srcs = [Path(sub["src"]) for sub in ops]
+        self._unlearn(srcs)
+        self.curr_idx = max(0, self.curr_idx)
+        for sub in reversed(ops):
+            if sub.get("slot") is not None:
+                self.image_files.restore(sub["slot"])  # 回到原来的位置
+            else:
+                self.image_files.insert(self.curr_idx, Path(sub["src"]))  # 重启前的操作，插到当前位置
+        shown = next((p for p in srcs if p in self.image_files), None)
+        if shown is None:
+            # 撤回的图像不符合当前筛选条件：放回队列但保持隐藏，停留在当前图像
+            self.curr_idx = min(self.curr_idx, len(self.image_files) - 1)
+            self.status_left.configure(text=f"{srcs[0].name} | 已撤回（不符合当前筛选，已隐藏）")
+            self.status_right.configure(text=self._progress_text())
+            self._refresh_grid()
+            return
+        self.curr_idx = self.image_files.index(shown)
+        pending = [rev for rev in revs if rev is not None]
+        if not pending:
+            # 移动尚未执行就被取消，文件仍在原处
+            self.load_and_show_image(shown)
+        else:
+            self.status_left.configure(text=f"{shown.name} | 撤回中…")
+            self._show_after_ops(pending, shown)
+    
+    def move_paths_to_category(self, paths, category_name):
+        """把多张图像一次性分类（缩略图网格多选），整组可一步撤回"""
+        if not paths or self._apply_busy():
+            return
+        if self.label_only:
+            # 整组一次查询、一个事务写入清单，队列中批量定位
+            manifest = self._manifest()
+            prevs = manifest.get_many(paths)
+            manifest.set_many([(p, category_name) for p in paths])
+            ops = [{"op": "label", "path": str(p), "prev": prevs.get(p)} for p in paths]
+            indices = self.image_files.set_categories({p: category_name for p in paths})
+            # 前进到这组中最靠后一张的下一张
+            self.curr_idx = min(max(indices.values(), default=self.curr_idx) + 1, len(self.image_files) - 1)
+        else:
+            ops = []
+            try:
+                for p in paths:
+                    ops.append(self.mover.move(p, Path(self.image_dir) / category_name))
+            except Exception as e:
+                messagebox.showerror("移动失败", f"无法移动文件：\n{e}")
+                if not ops:
+                    return
+                paths = [Path(op["src"]) for op in ops]  # 已登记的移动照常记录，可撤回
+            moved_keys = {str(p) for p in paths}
+            current = self.image_files[self.curr_idx] if 0 <= self.curr_idx < len(self.image_files) else None
+            slots = self.image_files.remove_paths(paths, category_name)
+            for op in ops:
+                op["slot"] = slots.get(Path(op["src"]))
+            for p in paths:
+                self.prefetcher.invalidate(p)
+            self.zoom_cache.discard(lambda key: key[0] in moved_keys)
+            if current in slots or current is None:
+                self.curr_idx = min(self.curr_idx, len(self.image_files) - 1)
+            else:
+                self.curr_idx = self.image_files.index(current)
+        self._learn(paths, category_name)  # 登记成功后才学习；后台移动失败时由 _poll_mover 撤销
+        self.undo_stack.append({"op": "group", "ops": ops})
+        self.btn_undo.configure(state="normal")
+        if self.image_files:
             self.load_and_show_image(self.image_files[self.curr_idx])
+        elif not self._claim_more():
+            self._clear_canvas()
+            self.prefetcher.cancel()
+            self._refresh_grid()
+            self.status_right.configure(text=self._progress_text())
+            self._update_category_counts()
+    
+    def find_duplicates(self):
+        """后台计算感知哈希并聚类，完成后把相似图重排到一起"""
+        if not self.image_files or self._dedup_future is not None:
+            return
+        from img_cls import find_similar_images
         
+        progress = {"done": 0, "total": len(self.image_files), "image_dir": self.image_dir}
+        self._dedup_future = self.task_executor.submit(
+            find_similar_images,
+            list(self.image_files),
+            self.cfg.get("dedup_threshold", 6),
+            self.cfg.get("dedup_hash", "phash"),
+            self.cfg.get("dedup_workers"),
+            lambda done, n: progress.update(done=done, total=n),
+        )
+        self.btn_dedup.configure(state="disabled")
+        self._poll_dedup(progress)
+    
+    def _poll_dedup(self, progress):
+        future = self._dedup_future
+        if not future.done():
+            self.status_left.configure(text=f"查找相似图… {progress['done']}/{progress['total']}")
+            self.after(100, self._poll_dedup, progress)
+            return
+        self._dedup_future = None
+        self.btn_dedup.configure(state="normal")
+        try:
+            result = future.result()
         except Exception as e:
-            messagebox.showerror("撤回失败", f"无法还原文件：\n{e}")
+            messagebox.showerror("查找相似图失败", str(e))
+            return
+        if progress["image_dir"] != self.image_dir:
+            return  # 期间切换了目录
+        self.digests = result["digests"]
+        self.clusters = {path: members for members in result["clusters"] for path in members}
+        # 同组图像排到一起（放在组内第一张原来的位置），其余顺序不变
+        current = self.image_files[self.curr_idx] if 0 <= self.curr_idx < len(self.image_files) else None
+        self.image_files.group(result["clusters"])
+        if current is not None:
+            self.curr_idx = self.image_files.index(current)
+        n_similar = sum(len(members) for members in result["clusters"])
+        n_identical = sum(len(members) - len({self.digests[p] for p in members}) for members in result["clusters"])
+        if self.clusters:
+            self.switch_cluster_label.select()
+        if self.image_files:
+            self.load_and_show_image(self.image_files[self.curr_idx])
+        messagebox.showinfo(
+            "查找相似图",
+            f"找到 {len(result['clusters'])} 组相似图像，共 {n_similar} 张，其中内容完全相同的副本 {n_identical} 张"
+            + (f"\n无法读取 {len(result['failed'])} 张" if result["failed"] else "")
+        )
+    
+    def start_prediction(self):
+        """后台提取特征并建立 k-NN 索引，完成后按预测类别（置信度高的在前）重排尚未浏览的部分"""
+        if not self.image_files or self._predict_future is not None:
+            return
+        references = None
+        if self.label_only:
+            # 仅标注模式下图像还在原处：清单中的标注也作为参考
+            references = [(Path(path), category) for path, category in self._manifest().labels().items()
+                          if category in self.categories]
+        cache_path = self.cfg.get("feature_cache", str(Path.home() / ".img_cls_tool" / "features.sqlite"))
+        progress = {"done": 0, "total": len(self.image_files), "image_dir": self.image_dir}
+        self._predict_future = self.predict_executor.submit(
+            self._build_predictor,
+            references or [],
+            list(self.image_files),
+            cache_path,
+            lambda done, n: progress.update(done=done, total=n),
+        )
+        self.btn_predict.configure(state="disabled")
+        self._poll_predict(progress)
+    
+    def _build_predictor(self, references, queries, cache_path, progress):
+        """在 predict 线程中执行：类别目录扫描、特征提取（带缓存）、建索引"""
+        from img_cls import FeatureCache, build_predictor, collect_references
+        
+        references = collect_references(self.image_dir, self.categories) + references
+        if not references:
+            return None, []
+        cache = FeatureCache(cache_path)
+        try:
+            return build_predictor(
+                references, queries, self.categories, cache,
+                k=self.cfg.get("predict_k", 7), workers=self.cfg.get("predict_workers"), progress=progress,
+            )
+        finally:
+            cache.close()
+    
+    def _poll_predict(self, progress):
+        future = self._predict_future
+        if not future.done():
+            self.status_left.configure(text=f"提取特征… {progress['done']}/{progress['total']}")
+            self.after(100, self._poll_predict, progress)
+            return
+        self._predict_future = None
+        self.btn_predict.configure(state="normal")
+        backlog, self._predict_backlog = self._predict_backlog, []
+        try:
+            predictor, failed = future.result()
+        except Exception as e:
+            messagebox.showerror("预测类别失败", str(e))
+            return
+        if progress["image_dir"] != self.image_dir:
+            return  # 期间切换了目录
+        if predictor is None:
+            messagebox.showinfo("预测类别", "类别目录中还没有已分类的图像，先手动分类一部分再预测")
+            return
+        self.predictor = predictor
+        for method, args in backlog:
+            self._update_predictor(method, *args)
+        predictions = predictor.predict_all()
+        if self.cfg.get("predict_sort", True):
+            # 同一预测类别排在一起，类别内置信度高的在前；已浏览的部分不动
+            order = {category: i for i, category in enumerate(self.categories)}
+            current = self.image_files[self.curr_idx] if 0 <= self.curr_idx < len(self.image_files) else None
+            self.image_files.sort_after(
+                self.curr_idx,
+                {Path(key): (order[category], -conf) for key, (category, conf) in predictions.items()},
+            )
+            if current is not None:
+                self.curr_idx = self.image_files.index(current)
+        if self.image_files:
+            self.load_and_show_image(self.image_files[self.curr_idx])
+        messagebox.showinfo(
+            "预测类别",
+            f"参考 {len(predictor)} 张已分类图像，预测 {len(predictions)} 张"
+            + (f"\n无法读取 {len(failed)} 张" if failed else "")
+        )
+    
+    def _update_suggestion(self, image_path):
+        """高亮当前图像的预测类别（置信度低于 predict_min_confidence 时不提示）"""
+        result = self.predictor.predict(str(image_path)) if self.predictor is not None else None
+        if result is not None and result[1] < self.cfg.get("predict_min_confidence", 0.5):
+            result = None
+        self.suggestion = result[0] if result is not None else None
+        for category, button in self.category_buttons.items():
+            width = 3 if category == self.suggestion else 0
+            if button.cget("border_width") != width:
+                button.configure(border_width=width, border_color=SUGGEST_COLOR)
+        if result is not None:
+            self.status_right.configure(text=self.status_right.cget("text") + f" | 建议：{result[0]} {result[1]:.0%}")
+    
+    def accept_suggestion(self):
+        """回车：确认预测的类别"""
+        if self.suggestion is not None:
+            self.move_to_category(self.suggestion)
+    
+    def _learn(self, paths, category):
+        """新的标注并入 k-NN 索引（predict 线程中增量更新）"""
+        self._update_predictor("label", [str(p) for p in paths], category)
+    
+    def _unlearn(self, paths):
+        self._update_predictor("unlabel", [str(p) for p in paths])
+    
+    def _update_predictor(self, method, *args):
+        if self.predictor is not None:
+            self.predict_executor.submit(getattr(self.predictor, method), *args)
+        elif self._predict_future is not None:
+            self._predict_backlog.append((method, args))  # 索引还在建：建好后补上
+    
+    def _label_cluster(self, category_name):
+        """按相似组标注：当前图像所在组一次性分类；内容完全相同的副本不重复移动，只记录下来"""
+        members = [p for p in self.clusters[self.image_files[self.curr_idx]] if p in self.image_files]
+        keep, duplicates, first = [], [], {}
+        for path in members:
+            digest = self.digests.get(path)
+            if digest is not None and digest in first:
+                duplicates.append((path, first[digest]))
+            else:
+                first[digest] = path
+                keep.append(path)
+        if duplicates and self.cfg.get("duplicate_action", "skip") == "skip":
+            self._flag_duplicates(duplicates)
+        else:
+            keep.extend(path for path, _ in duplicates)
+        self.move_paths_to_category(keep, category_name)
+    
+    def _flag_duplicates(self, duplicates):
+        """完全相同的副本：留在原处、移出队列，并记录到 image_dir/.img_cls_duplicates.jsonl"""
+        with open(Path(self.image_dir) / ".img_cls_duplicates.jsonl", "a", encoding="utf-8") as f:
+            for path, same_as in duplicates:
+                f.write(json.dumps({"path": str(path), "same_as": str(same_as)}, ensure_ascii=False) + "\n")
+        flagged = {path for path, _ in duplicates}
+        current = self.image_files[self.curr_idx]
+        self.image_files.remove_paths(flagged)
+        if current in flagged:
+            self.curr_idx = min(self.curr_idx, len(self.image_files) - 1)
+        else:
+            self.curr_idx = self.image_files.index(current)
+    
+    def jump_to(self, index):
+        if 0 <= index < len(self.image_files):
+            self.curr_idx = index
+            self.load_and_show_image(self.image_files[index])
+    
+    def open_grid_view(self):
+        if self.image_dir is None:
+            return
+        if self.grid_view is not None and self.grid_view.winfo_exists():
+            self.grid_view.focus()
+            return
+        if self.thumb_loader is None:
+            # 缩略图缓存放在本机（图像目录可能在 NAS 上），config.json 中 "thumb_cache" 可指定位置
+            cache_path = self.cfg.get("thumb_cache", str(Path.home() / ".img_cls_tool" / "thumbs.sqlite"))
+            self.thumb_loader = ThumbnailLoader(
+                ThumbnailCache(cache_path),
+                edge=self.cfg.get("thumb_size", THUMB_EDGE),
+                workers=self.cfg.get("thumb_workers"),
+            )
+        self.grid_view = ThumbnailGrid(self)
+    
+    def _refresh_grid(self):
+        if self.grid_view is not None and self.grid_view.winfo_exists():
+            self.grid_view.refresh()
+    
+    def _label_current(self, category_name):
+        """仅标注模式：只记录 (文件, 类别) 并前进到下一张，不移动文件"""
+        src_path = Path(self.image_files[self.curr_idx])
+        prev = self._manifest().set(src_path, category_name)
+        self.image_files.set_category(self.curr_idx, category_name)
+        self._learn([src_path], category_name)
+        self.undo_stack.append({"op": "label", "path": str(src_path), "prev": prev})
+        self.btn_undo.configure(state="normal")
+        if self.curr_idx < len(self.image_files) - 1:
+            self.curr_idx += 1
+        self._on_screen = None
+        self._request_frame()
+    
+    def _manifest(self):
+        if self.manifest is None:
+            mtime_ns = os.stat(self.image_dir).st_mtime_ns
+            self.manifest = LabelManifest(self.image_dir, owner=self.leases.owner if self.leases is not None else None)
+            if self.session is not None:
+                self.session.dir_touched(self.image_dir, mtime_ns)
+        return self.manifest
+    
+    def _close_manifest(self):
+        """关闭标注清单（等待后台写完）；关闭时删除 WAL 文件改变了目录 mtime，报告给会话索引"""
+        if self.manifest is None:
+            return
+        mtime_ns = os.stat(self.manifest.image_dir).st_mtime_ns
+        self.manifest.close()
+        if self.session is not None and self.session.root == self.manifest.image_dir:
+            self.session.dir_touched(self.manifest.image_dir, mtime_ns)
+        self.manifest = None
+    
+    def toggle_label_only(self):
+        self.label_only = bool(self.switch_label_only.get())
+        if self.image_files:
+            self.load_and_show_image(self.image_files[self.curr_idx])
+    
+    def apply_labels(self):
+        """把清单中的标注一次性批量应用到类别目录（后台线程池执行）"""
+        if self.image_dir is None or self._apply_future is not None:
+            return
+        manifest = self._manifest()
+        total = sum(manifest.counts().values())
+        if not total:
+            messagebox.showinfo("应用标注", "没有待应用的标注")
+            return
+        mode_name = self.apply_mode_menu.get()
+        if not messagebox.askyesno("应用标注", f"将{mode_name}{total}个已标注文件到类别目录，是否继续？"):
+            return
+        progress = {"done": 0, "total": total}
+        self._apply_future = self.task_executor.submit(
+            manifest.apply,
+            self.APPLY_MODE_NAMES[mode_name],
+            self.cfg.get("apply_workers", 4),
+            self.mover.names,
+            lambda done, n: progress.update(done=done, total=n),
+        )
+        self.btn_apply.configure(state="disabled")
+        self._poll_apply(progress)
+    
+    def _apply_busy(self):
+        """批量应用标注进行中：切换目录、分类与撤回都要等它完成（清单和队列中的文件正在被移走）"""
+        if self._apply_future is None:
+            return False
+        self.bell()
+        return True
+    
+    def _poll_apply(self, progress):
+        future = self._apply_future
+        if not future.done():
+            self.status_left.configure(text=f"应用标注中… {progress['done']}/{progress['total']}")
+            self.after(100, self._poll_apply, progress)
+            return
+        self._apply_future = None
+        self.btn_apply.configure(state="normal")
+        try:
+            summary = future.result()
+        except Exception as e:
+            messagebox.showerror("应用标注失败", str(e))
+            return
+        # 已应用的标注不能再撤回（包括网格多选的整组记录）；已移走的文件从队列中去掉
+        applied = {Path(p) for p in summary["done"]}
+        gone = {Path(p) for p in summary["done"] + summary["missing"]
+                if not os.path.exists(p)}
+        if applied:
+            undo_stack = []
+            for op in self.undo_stack:
+                if op["op"] == "group":
+                    op["ops"] = [sub for sub in op["ops"] if sub["op"] != "label" or Path(sub["path"]) not in applied]
+                    if not op["ops"]:
+                        continue
+                elif op["op"] == "label" and Path(op["path"]) in applied:
+                    continue
+                undo_stack.append(op)
+            self.undo_stack = undo_stack
+            self.btn_undo.configure(state="normal" if self.undo_stack else "disabled")
+        if gone and self.session is not None:
+            self.session.files_moved(removed=gone)
+        if gone:
+            current = self.image_files[self.curr_idx] if self.image_files else None
+            self.image_files.remove_paths(gone)
+            if current in self.image_files:
+                self.curr_idx = self.image_files.index(current)
+            self.curr_idx = min(max(0, self.curr_idx), max(0, len(self.image_files) - 1))
+        if self.image_files:
+            self.load_and_show_image(self.image_files[self.curr_idx])
+        else:
+            self._clear_canvas()
+            self.prefetcher.cancel()
+        seconds = summary["seconds"]
+        n_done = len(summary["done"])
+        message = f"完成 {n_done} 个，用时 {seconds:.1f}s（{n_done / max(seconds, 1e-6):.0f} 个/秒）"
+        if summary["missing"]:
+            message += f"\n源文件不存在 {len(summary['missing'])} 个"
+        if summary["failed"]:
+            message += f"\n失败 {len(summary['failed'])} 个：\n" + "\n".join(
+                f"{src}：{err}" for src, err in summary["failed"][:10])
+        messagebox.showinfo("应用标注", message)
+    
+    def _sync_session(self, ops, dir_mtimes):
+        """FileMover 每批完成后（工作线程中）同步会话索引"""
+        session = self.session
+        if session is None:
+            return
+        session.files_moved(
+            removed=[op["src"] for op in ops if op["op"] == "move"],
+            added=[op["dst"] for op in ops if op["op"] == "undo"],
+            dir_mtimes=dir_mtimes,
+        )
+    
+    def _show_after_ops(self, ops, image_path):
+        """等待后台操作完成后再显示图像（撤回时文件可能还在搬回途中）"""
+        if any(op["state"] in ("pending", "running") for op in ops):
+            self.after(30, self._show_after_ops, ops, image_path)
+            return
+        if self.image_files and self.image_files[self.curr_idx] == image_path:
+            self.load_and_show_image(image_path)
+    
+    def _poll_mover(self):
+        """在 UI 线程中处理后台移动失败：文件放回队列并提示；共享模式下顺带检查分片租约"""
+        if self.mover is not None:
+            errors = []
+            files = self.image_files
+            current = files[self.curr_idx] if 0 <= self.curr_idx < len(files) else None
+            while True:
+                try:
+                    op = self.mover.failures.get_nowait()
+                except queue.Empty:
+                    break
+                if op["op"] == "move" and Path(op["src"]) in self.quarantine:
+                    pass  # 移入隔离目录失败：图像留在原处，仍不在队列中
+                elif op["op"] == "move":
+                    if op in self.undo_stack:
+                        self.undo_stack.remove(op)
+                    for group in self.undo_stack:
+                        if group["op"] == "group" and op in group["ops"]:
+                            group["ops"].remove(op)
+                    if op.get("slot") is not None:
+                        self.image_files.restore(op["slot"])
+                    else:
+                        self.image_files.insert(self.curr_idx + 1, Path(op["src"]))
+                    self._unlearn([op["src"]])
+                else:
+                    # 撤回失败：文件仍在类别目录中
+                    self.image_files.remove_paths([Path(op["dst"])], Path(op["src"]).parent.name)
+                    self._learn([op["dst"]], Path(op["src"]).parent.name)
+                errors.append(f"{op['src']} → {op['dst']}：{op.get('error')}")
+            if errors:
+                # 放回 / 移出的项会使后面的下标整体移动：curr_idx 重新对齐到原来的目标图像，屏幕上的图像不在队列中时等下一帧
+                if current is not None and current in files:
+                    self.curr_idx = files.index(current)
+                else:
+                    self.curr_idx = min(self.curr_idx, len(files) - 1)
+                if self._on_screen is not None and self._on_screen not in files:
+                    self._on_screen = None
+                    if files and self.curr_idx >= 0:
+                        self._request_frame()
+            if not self.undo_stack:
+                self.btn_undo.configure(state="disabled")
+            if errors and self.current_image_path is None and self.image_files:
+                # 之前已全部分类完毕，重新显示放回的图像
+                self.curr_idx = 0
+                self.load_and_show_image(self.image_files[self.curr_idx])
+            if errors:
+                messagebox.showerror("移动失败", "无法移动文件：\n" + "\n".join(errors[:10]))
+        if self.leases is not None:
+            self._poll_leases()
+        if self.checker is not None:
+            self._poll_checker()
+        self.after(200, self._poll_mover)
+    
+    def _poll_checker(self):
+        """完整性预检发现的问题图像：移出队列，"integrity_action": "move" 时再移入隔离目录"""
+        checker = self.checker
+        # 先读完成标志再取结果：done 在最后一批结果入队之后才设置，先读可保证不会漏掉结果
+        done = checker.done.is_set()
+        bad = {}
+        while True:
+            try:
+                path, status, error = checker.bad.get_nowait()
+            except queue.Empty:
+                break
+            # 预检期间已被分类移走的文件（读取失败是因为文件不在了）
+            if path not in self.quarantine and os.path.exists(path):
+                bad[path] = (status, error)
+        if bad:
+            self.quarantine.update(bad)
+            files = self.image_files
+            current = files[self.curr_idx] if 0 <= self.curr_idx < len(files) else None
+            removed = files.remove_paths(list(bad))
+            self._quarantine_removed += len(removed)
+            if self.cfg.get("integrity_action", "flag") == "move":
+                dst_dir = self.image_dir / self.cfg.get("quarantine_dir", QUARANTINE_DIR)
+                for path in removed:
+                    if self.leases is None or self.leases.owns(path):  # 共享模式下只移动自己分片中的文件
+                        self.mover.move(path, dst_dir)
+            if current is not None and current in files:
+                self.curr_idx = files.index(current)
+            elif files:
+                self.curr_idx = min(self.curr_idx, len(files) - 1)
+                self.load_and_show_image(files[self.curr_idx])
+            else:
+                self.curr_idx = -1
+                self._clear_canvas()
+            self.status_right.configure(text=self._progress_text())
+            self._refresh_grid()
+            self.status_left.configure(text="预检发现问题图像，已移出队列：" + "，".join(
+                f"{path.name}（{CHECK_STATUS_NAMES[status]}）" for path, (status, _) in list(bad.items())[:3]
+            ) + (" 等" if len(bad) > 3 else ""))
+        if done:
+            self.checker = None
+            checker.stop()
+            counts = checker.counts
+            detail = "，".join(f"{name} {counts[status]}" for status, name in CHECK_STATUS_NAMES.items() if counts[status])
+            self.status_left.configure(
+                text=f"完整性预检完成：共 {checker.checked} 张，" + (f"问题图像（{detail}）已移出队列" if detail else "未发现问题")
+            )
+    
+    def toggle_stats_overlay(self):
+        """显示 / 隐藏状态栏中的性能统计（显示期间开启计时）"""
+        if self._stats_job is not None:
+            self.after_cancel(self._stats_job)
+            self._stats_job = None
+            self.status_stats.pack_forget()
+            TRACER.enabled = bool(self.cfg.get("trace_file"))
+            return
+        TRACER.enabled = True
+        self.status_stats.pack(side="left", fill="y")
+        self._update_stats_overlay()
+    
+    def _update_stats_overlay(self):
+        """刷新浮层：各热路径的 平均/p95 耗时、缓存命中率与进程内存；命中率与内存同时写入 trace 计数器"""
+        summary = TRACER.summary()
+        parts = [f"{name} {summary[name]['mean_ms']:.1f}/{summary[name]['p95_ms']:.1f}ms"
+                 for name in STATS_SPANS if name in summary]
+        prefetch_rate = self.prefetcher.stats()["hit_rate"]
+        zoom_rate = self.zoom_cache.stats()["hit_rate"]
+        TRACER.counter("prefetch_hit_rate", round(prefetch_rate, 3))
+        TRACER.counter("zoom_cache_hit_rate", round(zoom_rate, 3))
+        parts.append(f"预取命中 {prefetch_rate:.0%}")
+        parts.append(f"瓦片缓存 {zoom_rate:.0%}")
+        if self._skipped_frames:
+            TRACER.counter("skipped_frames", self._skipped_frames)
+            parts.append(f"合并跳过 {self._skipped_frames} 张")
+        memory = process_memory_mb()
+        if memory is not None:
+            TRACER.counter("memory_mb", round(memory, 1))
+            parts.append(f"内存 {memory:.0f}MB")
+        self.status_stats.configure(text=" · ".join(parts))
+        self._stats_job = self.after(STATS_INTERVAL_MS, self._update_stats_overlay)
+    
+    def export_trace(self):
+        """导出本次会话记录的计时事件（Chrome trace 可在 chrome://tracing 或 Perfetto 中打开）"""
+        if not TRACER.summary():
+            messagebox.showinfo("导出性能记录", "尚无记录：按 F3 打开性能统计后再操作")
+            return
+        path = filedialog.asksaveasfilename(
+            title="导出性能记录",
+            defaultextension=".json",
+            filetypes=[("Chrome trace", "*.json"), ("JSON Lines", "*.jsonl")],
+        )
+        if not path:
+            return
+        try:
+            count = TRACER.export(path)
+        except OSError as e:
+            messagebox.showerror("导出性能记录", f"写入失败：{e}")
+            return
+        self.status_left.configure(text=f"已导出 {count} 条性能记录 → {os.path.basename(path)}")
+    
+    def _progress_text(self):
+        """状态栏右侧的进度：当前位置、剩余 / 已标注张数，筛选时附带筛选后的张数"""
+        files = self.image_files
+        if self.label_only:
+            labeled = sum(self._manifest().counts().values())
+            text = f"已标注{labeled}/{files.remaining}张"
+        else:
+            classified = files.removed - self._quarantine_removed
+            text = f"剩余{files.remaining}张" + (f"（本次已分类{classified}张）" if classified else "")
+        if self.leases is not None:
+            text += f" | 本人分片{len(files)}张"
+        elif files.filtered:
+            text += f" | 筛选后{len(files)}张"
+        if self.quarantine:
+            text += f" | 已隔离{len(self.quarantine)}张"
+        if self.checker is not None:
+            text += f" | 预检{self.checker.checked}/{self.checker.total}"
+        if files and self.curr_idx >= 0:
+            text = f"第{self.curr_idx + 1}/{len(files)}张 | " + text
+        return text
+    
+    def _update_category_counts(self):
+        """类别按钮上显示计数：仅标注模式为清单中待应用的标注数，否则为本次移入各类别的张数"""
+        counts = self._manifest().counts() if self.label_only else self.image_files.category_counts()
+        for category, button in self.category_buttons.items():
+            n = counts.get(category, 0)
+            text = f"{category} ({n})" if n else category
+            if button.cget("text") != text:
+                button.configure(text=text)
+    
+    def apply_filter(self, choice):
+        """筛选队列：未标注 / 按扩展名 / 按大小，「全部」取消筛选（被筛掉的图像只是隐藏，不会移动）"""
+        if self.image_dir is None:
+            self.filter_menu.set(FILTER_NAMES[0])
+            return
+        self._filter_future = None  # 之前尚未完成的按大小筛选作废
+        predicate = None
+        if choice == "未标注":
+            labeled = self._manifest().labeled_paths() if self.label_only else set()
+            predicate = lambda p: str(p) not in labeled
+        elif choice == "按扩展名…":
+            text = ctk.CTkInputDialog(text="扩展名（逗号分隔，如 jpg,png）", title="按扩展名筛选").get_input()
+            exts = {"." + e.strip().lower().lstrip(".") for e in (text or "").split(",") if e.strip()}
+            if not exts:
+                self.filter_menu.set(FILTER_NAMES[0])
+                return
+            predicate = lambda p: p.suffix.lower() in exts
+        elif choice == "按大小…":
+            text = ctk.CTkInputDialog(text="文件大小（MB），如 1-5、>2、<0.5", title="按大小筛选").get_input()
+            try:
+                lo, hi = parse_size_range(text or "")
+            except ValueError:
+                self.filter_menu.set(FILTER_NAMES[0])
+                return
+            # 索引中没有的文件要逐个 stat：在后台线程中取得全部大小后再筛选，期间照常浏览
+            session, keys = self.session, self.image_files.remaining_keys()
+            self._filter_future = self.task_executor.submit(
+                lambda: file_sizes(keys, session.sizes() if session is not None else None)
+            )
+            self.status_left.configure(text=f"按大小筛选：读取{len(keys)}个文件的大小…")
+            self.after(50, self._poll_size_filter, self._filter_future, lo, hi)
+            return
+        self._set_user_filter(predicate)
+    
+    def _poll_size_filter(self, future, lo, hi):
+        if future is not self._filter_future:
+            return  # 期间切换了目录或筛选条件
+        if not future.done():
+            self.after(50, self._poll_size_filter, future, lo, hi)
+            return
+        self._filter_future = None
+        try:
+            sizes = future.result()
+        except Exception as e:
+            self.filter_menu.set(FILTER_NAMES[0])
+            messagebox.showerror("按大小筛选", f"读取文件大小失败：{e}")
+            return
+        
+        def predicate(p):
+            key = str(p)
+            if key not in sizes:
+                return True  # 筛选之后才扫描到的文件：大小未知，先显示
+            size = sizes[key]
+            return size is not None and (lo is None or size >= lo) and (hi is None or size <= hi)
+        
+        self.status_left.configure(text="就绪")
+        self._set_user_filter(predicate)
+    
+    def _set_user_filter(self, predicate):
+        """应用筛选菜单的条件，尽量停留在当前图像"""
+        files = self.image_files
+        current = files[self.curr_idx] if 0 <= self.curr_idx < len(files) else None
+        self._user_filter = predicate
+        self._refilter()
+        self.curr_idx = files.index(current) if current is not None and current in files else min(0, len(files) - 1)
+        if files:
+            self.load_and_show_image(files[self.curr_idx])
+        else:
+            self._clear_canvas()
+            self.prefetcher.cancel()
+            self.status_right.configure(text=self._progress_text())
+        self._refresh_grid()
+    
+    def _refilter(self):
+        """筛选菜单的条件 + 共享模式下只显示自己领取的分片"""
+        user, leases = self._user_filter, self.leases
+        if leases is None:
+            predicate = user
+        elif user is None:
+            predicate = leases.owns
+        else:
+            predicate = lambda p: leases.owns(p) and user(p)
+        self.image_files.filter(predicate)
+    
+    def _claim_more(self):
+        """
+        共享模式：自己的分片处理完后归还，再领取仍有图像的分片（跳过已被其他人处理完的），
+        领到则显示第一张并返回 True
+        """
+        if self.leases is None:
+            return False
+        files = self.image_files
+        by_chunk = {}
+        for path in files.remaining_paths():
+            by_chunk.setdefault(self.leases.chunk_of(path), []).append(path)
+        self.leases.release(self.leases.owned - set(by_chunk))
+        wanted = set(by_chunk) - self.leases.owned
+        while wanted:
+            claimed = self.leases.claim(wanted, self.cfg.get("lease_claim", 2))
+            if not claimed:
+                return False
+            wanted -= set(claimed)
+            # 本实例扫描之后被其他人移走的文件
+            gone = [p for chunk in claimed for p in by_chunk[chunk] if not os.path.exists(p)]
+            files.remove_paths(gone)
+            self._refilter()
+            if files:
+                self.curr_idx = 0
+                self.load_and_show_image(files[0])
+                return True
+            self.leases.release(claimed)
+        return False
+    
+    def _poll_leases(self):
+        """心跳超时后被其他实例接管的分片：隐藏其中的图像"""
+        lost = []
+        while True:
+            try:
+                lost.append(self.leases.lost.get_nowait())
+            except queue.Empty:
+                break
+        if not lost:
+            return
+        current = self.image_files[self.curr_idx] if 0 <= self.curr_idx < len(self.image_files) else None
+        self._refilter()
+        self.status_left.configure(text=f"{len(lost)} 个分片因心跳超时被其他实例接管，已隐藏")
+        if current is not None and current in self.image_files:
+            self.curr_idx = self.image_files.index(current)
+        elif self.image_files:
+            self.curr_idx = min(self.curr_idx, len(self.image_files) - 1)
+            self.load_and_show_image(self.image_files[self.curr_idx])
+        elif not self._claim_more():
+            self.curr_idx = -1
+            self._clear_canvas()
+    
+    def ask_jump(self):
+        """跳转到第 N 张（Ctrl+G）"""
+        if not self.image_files:
+            return
+        text = ctk.CTkInputDialog(text=f"跳转到第几张（1-{len(self.image_files)}）", title="跳转").get_input()
+        try:
+            index = int(text) - 1
+        except (TypeError, ValueError):
+            return
+        self.jump_to(min(max(index, 0), len(self.image_files) - 1))
     
     def prev_image(self):
         if self.image_files and self.curr_idx > 0:
             self.curr_idx -= 1
-            self.load_and_show_image(self.image_files[self.curr_idx])
+            self._request_frame()
     
     def next_image(self):
         if self.image_files and self.curr_idx < len(self.image_files) - 1:
             self.curr_idx += 1
-            self.load_and_show_image(self.image_files[self.curr_idx])
+            self._request_frame()
+    
+    def _request_frame(self):
+        """
+        导航 / 分类只更新 curr_idx，显示合并到下一帧：
+        同一帧内的多次按键只解码、渲染最后的目标，中间永远不会被看到的图像直接跳过
+        """
+        if self._frame_job is not None:
+            self._skipped_frames += 1
+            return
+        wait = self._last_frame + FRAME_INTERVAL_MS / 1000 - time.perf_counter()
+        self._frame_job = self.after(max(0, int(wait * 1000)), self._render_frame)
+    
+    def _render_frame(self):
+        self._frame_job = None
+        self._last_frame = time.perf_counter()
+        if not 0 <= self.curr_idx < len(self.image_files):
+            return
+        path = self.image_files[self.curr_idx]
+        if path != self._on_screen:
+            with TRACER.span("frame"):
+                self.load_and_show_image(path)
+    
+    def _target_on_screen(self):
+        """
+        分类按键作用于按下时屏幕上的图像，而不是尚未显示的导航目标：
+        把 curr_idx 对齐到屏幕上的图像；该图像已被上一次按键分类（下一帧还没显示）时返回 False，忽略本次按键
+        """
+        path = self._on_screen
+        if path is None:
+            return False
+        if not (0 <= self.curr_idx < len(self.image_files) and self.image_files[self.curr_idx] == path):
+            if path not in self.image_files:
+                return False
+            self.curr_idx = self.image_files.index(path)
+        return True
     
     def _on_mousewheel(self, event, delta=None):
-        # ✅ 防抖：100ms 内只响应一次
-        now = time.time()
-        if now - self._last_wheel_time < 0.1:
+        # ✅ 不丢弃任何滚轮事件：每次只更新缩放状态，渲染合并到空闲时进行
+        if not self.original_pil_image:
             return
-        self._last_wheel_time = now
         
         # 获取 canvas 上鼠标相对于 canvas 左上角的坐标
         x = self.image_canvas.canvasx(event.x)
@@ -359,48 +1594,19 @@ class ImageAnnotator(ctk.CTk):
         if delta == 0:
             return
         
-        # ✅ 缩放因子（每次滚轮 ≈ ×1.15）
-        scale_factor = 1.15 ** delta
-        
-        # 限制缩放范围
-        new_zoom = self.zoom_level * scale_factor
-        new_zoom = max(self.min_zoom, min(self.max_zoom, new_zoom))
-        
-        # ✅ 关键：以光标点 (x,y) 为中心缩放 → 先反推该点在图像中的原始坐标，再重新映射
-        # 当前图像左上角在 canvas 中的位置（考虑 pan 和 zoom）
-        img_x0 = self.pan_x
-        img_y0 = self.pan_y
-        
-        # 鼠标点在图像坐标系中的位置（缩放前）
-        rel_x = (x - img_x0) / self.zoom_level
-        rel_y = (y - img_y0) / self.zoom_level
-        
-        # 缩放后，该点应仍在光标下 → 新左上角 = 鼠标点 - (rel_x, rel_y) * new_zoom
-        new_pan_x = x - rel_x * new_zoom
-        new_pan_y = y - rel_y * new_zoom
-        
-        # 更新状态
-        self.zoom_level = new_zoom
-        self.pan_x = new_pan_x
-        self.pan_y = new_pan_y
+        # ✅ 以光标点 (x,y) 为中心缩放，缩放后该点仍在光标下
+        self.zoom_level, self.pan_x, self.pan_y = zoom_at(
+            self.zoom_level, (self.pan_x, self.pan_y), (x, y), delta, self.min_zoom, self.max_zoom
+        )
         
-        # ✅ 渲染
-        self._redraw()
+        # ✅ 渲染：先快速预览，空闲后再高质量重绘
+        self._schedule_progressive_redraw()
     
     def _fit_to_canvas(self):
         """重置为「自适应填充」模式"""
         if not self.original_pil_image:
             return
-        cw = self.image_canvas.winfo_width()
-        ch = self.image_canvas.winfo_height()
-        if cw <= 1 or ch <= 1:
-            cw, ch = 800, 600  # fallback
-        
-        iw, ih = self.original_pil_image.size
-        scale = min(cw / iw, ch / ih)
-        self.zoom_level = scale
-        self.pan_x = (cw - iw * scale) / 2
-        self.pan_y = (ch - ih * scale) / 2
+        self.zoom_level, self.pan_x, self.pan_y = fit_view(self.image_size, self._canvas_size())
         self._redraw()
     
     def reset_zoom(self):
@@ -410,75 +1616,379 @@ class ImageAnnotator(ctk.CTk):
             text=self.status_left.cget("text").rsplit(" | ", 1)[0] + f" | Zoom: {self.zoom_level:.2f}×"
         )
     
-    def _redraw(self):
-        """高性能重绘：只 resize + place，不 reload PIL"""
+    def _schedule_progressive_redraw(self):
+        """两阶段渲染：本轮事件处理完后立即出预览帧，输入空闲 REFINE_DELAY_MS 后在后台补齐 LANCZOS 瓦片"""
+        self._render_generation += 1
+        if self._preview_job is None:
+            self._preview_job = self.after_idle(self._render_preview)
+        if self._refine_job is not None:
+            self.after_cancel(self._refine_job)
+        self._refine_job = self.after(REFINE_DELAY_MS, self._refine)
+    
+    def _render_preview(self):
+        self._preview_job = None
+        self._redraw(preview=True)
+    
+    def _refine(self):
+        self._refine_job = None
         if not self.original_pil_image:
             return
+        image_key, target_size, _, tiles = self._viewport()
+        missing = [tile for tile in tiles if (*image_key, *tile) not in self.zoom_cache]
+        if not missing:
+            self._redraw()  # 全部命中缓存，直接替换预览瓦片
+            return
+        generation = self._render_generation
+        pyramid, zoom = self.pyramid, self.zoom_level
         
+        def render():
+            results = []
+            for tile in missing:
+                if generation != self._render_generation:
+                    return None  # 又有新的输入，放弃本轮
+                results.append((tile, render_tile(pyramid, zoom, tile, target_size)))
+            return results
+        
+        future = self.render_executor.submit(render)
+        self.after(15, self._poll_refine, generation, image_key, future)
+    
+    def _poll_refine(self, generation, image_key, future):
+        if generation != self._render_generation:
+            future.cancel()
+            return
+        if not future.done():
+            self.after(15, self._poll_refine, generation, image_key, future)
+            return
+        try:
+            results = future.result()
+        except Exception as e:
+            print(f"[Error] refine render: {e}")
+            return
+        for tile, resized in results or []:
+            # PhotoImage 必须在主线程创建
+            with TRACER.span("photoimage"):
+                tk_img = ImageTk.PhotoImage(resized)
+            self.zoom_cache.put((*image_key, *tile), tk_img, resized.width * resized.height * 4)
+        self._redraw()
+    
+    def _viewport(self):
+        """当前视口：(image_key, 缩放后整图尺寸, 图像左上角在 canvas 中的位置, 可见瓦片)"""
         # ✅ 获取当前 canvas 尺寸（安全获取）
         cw = max(1, self.image_canvas.winfo_width())
         ch = max(1, self.image_canvas.winfo_height())
         
-        # ✅ 计算目标缩放尺寸（带 zoom）
-        iw, ih = self.original_pil_image.size
-        target_w = int(iw * self.zoom_level)
-        target_h = int(ih * self.zoom_level)
-        
-        # ✅ 使用缓存 key：(target_w, target_h, hash of original size + mode)
-        # 简化策略：用 (iw, ih, target_w, target_h) 作 key（足够区分）
-        cache_key = (iw, ih, target_w, target_h)
-        
-        # ✅ 查缓存 or 创建新缩放图
-        if cache_key not in self.zoom_cache:
-            # ✅ 使用 Lanczos（高质量）；小图用 BILINEAR 更快（可配置）
-            resized = self.original_pil_image.resize((target_w, target_h), Image.Resampling.LANCZOS)
-            # 转为 PhotoImage（Tkinter 原生，比 CTkImage 更适合 Canvas）
-            self.zoom_cache[cache_key] = ImageTk.PhotoImage(resized)
-        else:
-            # 缓存命中
-            pass
+        # ✅ 计算目标缩放尺寸（带 zoom，以原图尺寸为准）；只作为坐标系，不会真的生成这么大的位图
+        iw, ih = self.image_size
+        target_w = max(1, int(iw * self.zoom_level))
+        target_h = max(1, int(ih * self.zoom_level))
+        origin = (round(self.pan_x), round(self.pan_y))
+        # key 含解码尺寸，换成全分辨率后不会误用低分辨率瓦片
+        image_key = (str(self.current_image_path), *self.original_pil_image.size, target_w, target_h)
+        tiles = visible_tiles(origin, (cw, ch), (target_w, target_h))
+        return image_key, (target_w, target_h), origin, tiles
+    
+    def _redraw(self, preview=False):
+        """
+        视口瓦片渲染：只重采样 canvas 可见区域（外扩一圈）的瓦片，已渲染瓦片直接复用
         
-        tk_img = self.zoom_cache[cache_key]
+        :param preview: True 时未缓存的瓦片用 PREVIEW_RESAMPLE 快速渲染且不入缓存（交互中使用）
+        """
+        if not self.original_pil_image:
+            return
+        start = time.perf_counter()
         
-        # ✅ 清空 canvas 并放置新图（居中 + 平移）
-        self.image_canvas.delete("all")
-        self.image_canvas.create_image(
-            self.pan_x + target_w // 2,
-            self.pan_y + target_h // 2,
-            image=tk_img,
-            anchor="center"
-        )
+        image_key, target_size, (origin_x, origin_y), tiles = self._viewport()
+        iw = self.image_size[0]
+        
+        # ✅ 逐个可见瓦片：查缓存 or 渲染；预览瓦片与高质量瓦片分开登记，便于之后替换
+        items = {}
+        for tile in tiles:
+            tile_key = (*image_key, *tile)
+            x = origin_x + tile[0] * TILE_SIZE
+            y = origin_y + tile[1] * TILE_SIZE
+            tk_img = self.zoom_cache.get(tile_key)
+            if tk_img is not None:
+                item_key = (tile_key, False)
+            else:
+                item_key = (tile_key, preview)
+                if item_key not in self._tile_items:
+                    resample = PREVIEW_RESAMPLE if preview else Image.Resampling.LANCZOS
+                    resized = render_tile(self.pyramid, self.zoom_level, tile, target_size, resample)
+                    # 转为 PhotoImage（Tkinter 原生，比 CTkImage 更适合 Canvas）
+                    with TRACER.span("photoimage"):
+                        tk_img = ImageTk.PhotoImage(resized)
+                    if not preview:
+                        self.zoom_cache.put(tile_key, tk_img, resized.width * resized.height * 4)
+            entry = self._tile_items.pop(item_key, None)
+            with TRACER.span("canvas"):
+                if entry is None:
+                    entry = (self.image_canvas.create_image(x, y, image=tk_img, anchor="nw"), tk_img)
+                else:
+                    self.image_canvas.coords(entry[0], x, y)
+            items[item_key] = entry
+        # 移出视口 / 过期的瓦片
+        with TRACER.span("canvas"):
+            for item, _ in self._tile_items.values():
+                self.image_canvas.delete(item)
+        self._tile_items = items
         # 保存引用防止 GC（关键！）
-        self.current_tk_photo = tk_img  # ← 必须保留强引用！
+        self.current_tk_photo = [photo for _, photo in items.values()]  # ← 必须保留强引用！
         
         # ✅ 更新状态栏 zoom 显示
         self.status_left.configure(
             text=self.status_left.cget("text").rsplit(" | ", 1)[0] + f" | Zoom: {self.zoom_level:.2f}×"
         )
+        
+        # ✅ 放大超过已解码分辨率 → 后台加载全分辨率（期间先显示低分辨率放大结果）
+        if not self.image_is_full and self.zoom_level * iw > self.original_pil_image.width * 1.01:
+            self._request_full_resolution()
+        TRACER.record("redraw", start, time.perf_counter(), {"preview": preview, "tiles": len(tiles)})
+    
+    def _request_full_resolution(self):
+        if self._full_res_future is not None:
+            return
+        self._full_res_future = self.prefetcher.submit_full(self.current_image_path)
+        self.after(20, self._poll_full_resolution, self.current_image_path, self._full_res_future)
+    
+    def _poll_full_resolution(self, image_path, future):
+        if future is not self._full_res_future or image_path != self.current_image_path:
+            return  # 已切换图像，结果作废
+        if not future.done():
+            self.after(20, self._poll_full_resolution, image_path, future)
+            return
+        try:
+            decoded = future.result()
+        except Exception as e:
+            print(f"[Error] full resolution decode: {e}")
+            return
+        self.original_pil_image = decoded.image
+        self.pyramid = ImagePyramid(decoded.image, decoded.full_size)
+        self.image_is_full = True
+        self._redraw()
+    
+    def _canvas_size(self):
+        cw = self.image_canvas.winfo_width()
+        ch = self.image_canvas.winfo_height()
+        if cw <= 1 or ch <= 1:
+            cw, ch = 800, 600  # fallback
+        return cw, ch
     
     def _start_pan(self, event):
-        self.image_canvas.scan_mark(event.x, event.y)
+        self._pan_anchor = (event.x, event.y)
     
     def _pan(self, event):
-        self.image_canvas.scan_dragto(event.x, event.y, gain=1)
-        # 同步更新 pan_x/pan_y（可选，用于 reset 或导出）
+        # 更新 pan_x/pan_y 后按瓦片重绘（已渲染瓦片只移动位置）
+        if self._pan_anchor is None or not self.original_pil_image:
+            return
+        self.pan_x += event.x - self._pan_anchor[0]
+        self.pan_y += event.y - self._pan_anchor[1]
+        self._pan_anchor = (event.x, event.y)
+        self._schedule_progressive_redraw()
     
     def _clear_canvas(self):
+        self._on_screen = None
         self.current_image_path = None
         self.current_tk_photo = None
         self.original_pil_image = None
+        self.pyramid = None
+        self.image_size = None
+        self._full_res_future = None
+        self._tile_items = {}
         self.image_canvas.delete("all")
 
 
+class ThumbnailGrid(ctk.CTkToplevel):
+    """
+    缩略图网格：浏览 image_files，多选后一次性分类
+    
+    只为可见区域的格子创建画布元素、请求缩略图，滚动从不等待解码
+    单击选中，Ctrl+单击增减，Shift+单击连选，Ctrl+A 全选，双击在主窗口中显示
+    """
+    PAD = 6
+    LABEL_H = 18
+    MAX_PHOTOS = 1500  # 内存中保留的缩略图 PhotoImage 数量
+    
+    def __init__(self, annotator):
+        super().__init__(annotator)
+        self.annotator = annotator
+        self.loader = annotator.thumb_loader
+        self.title("缩略图")
+        self.geometry("1000x700")
+        self.cell_w = self.loader.edge + 2 * self.PAD
+        self.cell_h = self.loader.edge + self.LABEL_H + 2 * self.PAD
+        self.cols = 1
+        self.photos = OrderedDict()  # {path_str: PhotoImage}，LRU
+        self.failed = set()  # 无法生成缩略图的路径，不再重复请求
+        self.selected = set()  # 选中的 Path
+        self._anchor = None  # Shift 连选起点
+        self._redraw_job = None
+        
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+        
+        # 顶部：类别按钮 + 选择计数
+        top = ctk.CTkFrame(self, fg_color="transparent")
+        top.grid(row=0, column=0, columnspan=2, padx=10, pady=(10, 5), sticky="ew")
+        self.label_selected = ctk.CTkLabel(top, text="已选 0 张", font=ctk.CTkFont(size=14))
+        self.label_selected.pack(side="left", padx=(0, 10))
+        for category in annotator.categories:
+            ctk.CTkButton(
+                top,
+                text=category,
+                width=60,
+                command=lambda cat=category: self.move_selected(cat),
+                font=ctk.CTkFont(size=14)
+            ).pack(side="left", padx=3)
+        
+        self.canvas = ctk.CTkCanvas(self, highlightthickness=0, bg="white")
+        self.canvas.grid(row=1, column=0, sticky="nsew")
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._yview)
+        self.scrollbar.grid(row=1, column=1, sticky="ns")
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        
+        self.canvas.bind("<Configure>", lambda e: self.refresh())
+        self.canvas.bind("<MouseWheel>", lambda e: self._scroll(-e.delta // 120))
+        self.canvas.bind("<Button-4>", lambda e: self._scroll(-1))
+        self.canvas.bind("<Button-5>", lambda e: self._scroll(1))
+        self.canvas.bind("<ButtonPress-1>", lambda e: self._click(e, "single"))
+        self.canvas.bind("<Control-Button-1>", lambda e: self._click(e, "toggle"))
+        self.canvas.bind("<Shift-Button-1>", lambda e: self._click(e, "range"))
+        self.canvas.bind("<Double-1>", self._open)
+        self.bind("<Control-a>", lambda e: self._select_all())
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self._poll_results()
+    
+    def refresh(self):
+        """image_files 或窗口尺寸变化后重新布局（合并到空闲时执行）"""
+        if self._redraw_job is None:
+            self._redraw_job = self.after_idle(self._redraw)
+    
+    def move_selected(self, category_name):
+        paths = [p for p in self.annotator.image_files if p in self.selected]
+        self.selected.clear()
+        self._anchor = None
+        self.annotator.move_paths_to_category(paths, category_name)
+        self.refresh()
+    
+    def close(self):
+        self.loader.request([])
+        self.destroy()
+    
+    def _redraw(self):
+        self._redraw_job = None
+        files = self.annotator.image_files
+        width = max(1, self.canvas.winfo_width())
+        height = max(1, self.canvas.winfo_height())
+        self.cols = max(1, width // self.cell_w)
+        rows = math.ceil(len(files) / self.cols)
+        self.canvas.configure(scrollregion=(0, 0, self.cols * self.cell_w, max(rows * self.cell_h, height)))
+        
+        top = self.canvas.canvasy(0)
+        row0 = int(top // self.cell_h)
+        row1 = int((top + height) // self.cell_h) + 1
+        first, last = row0 * self.cols, min(len(files), row1 * self.cols)
+        self.canvas.delete("cell")
+        current = self.annotator.curr_idx
+        edge = self.loader.edge
+        # 可见区域 + 下一屏一次取出（WorkQueue 下标访问需要定位，按段读取更快）
+        ahead = min(len(files), last + (last - first))
+        window = files[first:ahead]
+        for idx, path in enumerate(window[:last - first], first):
+            x = (idx % self.cols) * self.cell_w + self.PAD
+            y = (idx // self.cols) * self.cell_h + self.PAD
+            if path in self.selected or idx == current:
+                self.canvas.create_rectangle(
+                    x - 3, y - 3, x + edge + 3, y + edge + self.LABEL_H + 1,
+                    outline="#2fa572" if path in self.selected else "gray60",
+                    fill="#d8f0e4" if path in self.selected else "",
+                    width=2, tags="cell"
+                )
+            photo = self.photos.get(str(path))
+            if photo is not None:
+                self.photos.move_to_end(str(path))
+                self.canvas.create_image(x + edge // 2, y + edge // 2, image=photo, tags="cell")
+            else:
+                self.canvas.create_rectangle(x, y, x + edge, y + edge, fill="gray90", outline="", tags="cell")
+            self.canvas.create_text(x + edge // 2, y + edge + self.LABEL_H // 2, text=self._short_name(path.name),
+                                    font=("", 9), tags="cell")
+        self.label_selected.configure(text=f"已选 {len(self.selected)} 张 / 共 {len(files)} 张")
+        # 可见区域优先，再预取下一屏
+        wanted = [p for p in window if str(p) not in self.photos and str(p) not in self.failed]
+        self.loader.request(wanted)
+    
+    def _poll_results(self):
+        if not self.winfo_exists():
+            return
+        updated = False
+        while True:
+            try:
+                key, img = self.loader.results.get_nowait()
+            except queue.Empty:
+                break
+            if img is None:
+                self.failed.add(key)
+                continue
+            self.photos[key] = ImageTk.PhotoImage(img, master=self)
+            updated = True
+        while len(self.photos) > self.MAX_PHOTOS:
+            self.photos.popitem(last=False)
+        if updated:
+            self.refresh()
+        self.after(30, self._poll_results)
+    
+    def _yview(self, *args):
+        self.canvas.yview(*args)
+        self.refresh()
+    
+    def _scroll(self, units):
+        self.canvas.yview_scroll(units, "units")
+        self.refresh()
+    
+    def _index_at(self, event):
+        col = int(self.canvas.canvasx(event.x) // self.cell_w)
+        row = int(self.canvas.canvasy(event.y) // self.cell_h)
+        idx = row * self.cols + col
+        if col >= self.cols or not 0 <= idx < len(self.annotator.image_files):
+            return None
+        return idx
+    
+    def _click(self, event, mode):
+        idx = self._index_at(event)
+        if idx is None:
+            return
+        files = self.annotator.image_files
+        path = files[idx]
+        if mode == "toggle":
+            self.selected.symmetric_difference_update({path})
+            self._anchor = idx
+        elif mode == "range" and self._anchor is not None:
+            lo, hi = sorted((self._anchor, min(idx, len(files) - 1)))
+            self.selected.update(files[lo:hi + 1])
+        else:
+            self.selected = {path}
+            self._anchor = idx
+        self.refresh()
+        return "break"
+    
+    def _select_all(self):
+        self.selected = set(self.annotator.image_files)
+        self.refresh()
+    
+    def _open(self, event):
+        idx = self._index_at(event)
+        if idx is not None:
+            self.annotator.jump_to(idx)
+    
+    @staticmethod
+    def _short_name(name, limit=22):
+        return name if len(name) <= limit else name[:limit - 1] + "…"
+
+
 if __name__ == "__main__":
+    # 命令行批量模式已在文件开头分派
+    measure_startup = sys.argv[1:] == ["--startup-time"]
     # 设置全局主题（可选）
     ctk.set_appearance_mode("light")  # "Light", "Dark", or "System"
     ctk.set_default_color_theme("green")  # 内置主题：blue, green, dark-blue
-    app = ImageAnnotator()
-    if app._windowingsystem == 'win32':
-        # Windows: 强制启用 DWM 缓冲 + 禁用重绘闪烁
-        # 避免从最小化到显示窗口的过程中，窗口出现重绘闪烁
-        app.wm_overrideredirect(True)  # 临时去边框（防闪烁）
-        app.update()
-        app.wm_overrideredirect(False)  # 立即恢复
+    app = ImageAnnotator(measure_startup=measure_startup)
     app.mainloop()
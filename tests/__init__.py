@@ -0,0 +1 @@
+"""img_cls 的行为测试（python -m pytest tests）"""
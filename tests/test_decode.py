@@ -0,0 +1,51 @@
+"""降采样解码与后台预取"""
+import time
+
+from PIL import Image
+
+from img_cls import ImagePrefetcher, decode_image
+
+
+def _save(path, size=(800, 600), mode="RGB"):
+    Image.new(mode, size, 90).save(path)
+    return path
+
+
+def test_decode_reduced_resolution(tmp_path):
+    jpeg = _save(tmp_path / "a.jpg")
+    png = _save(tmp_path / "b.png", mode="L")
+    decoded = decode_image(jpeg, (200, 150))
+    assert decoded.full_size == (800, 600)
+    assert decoded.mode == "RGB" and decoded.image.mode == "RGBA"
+    assert 200 <= decoded.image.width < 800 and not decoded.is_full
+    decoded = decode_image(png, (200, 150))
+    assert decoded.mode == "L" and decoded.image.size == (200, 150)
+    assert decode_image(png).is_full
+
+
+def _wait_idle(prefetcher, timeout=5):
+    deadline = time.monotonic() + timeout
+    while prefetcher._pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_failed_decode_is_retried(tmp_path):
+    good = _save(tmp_path / "good.jpg")
+    broken = tmp_path / "broken.jpg"
+    broken.write_bytes(b"not yet written")
+    files = [good, broken]
+    prefetcher = ImagePrefetcher(ahead=1, behind=0, workers=1)
+    try:
+        prefetcher.schedule(files, 0, (200, 150))
+        _wait_idle(prefetcher)
+        assert str(broken) not in prefetcher._buffer
+        
+        # 文件写完后再次调度：之前失败的图像重新提交
+        _save(broken)
+        prefetcher.schedule(files, 0, (200, 150))
+        _wait_idle(prefetcher)
+        assert prefetcher.take(broken) is not None
+        assert prefetcher.take(good) is not None
+        assert prefetcher.misses == 0
+    finally:
+        prefetcher.shutdown()
@@ -0,0 +1,60 @@
+"""类别目录 → tar 分片导出：样本收集、类别交错与分层划分、分片内容"""
+import json
+import tarfile
+
+from img_cls import export_shards, list_samples, mix_samples
+
+
+def _touch(path, data=b"x"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+def test_list_samples_skips_placeholders_and_other_files(tmp_path):
+    _touch(tmp_path / "cat" / "b.jpg", b"b")
+    _touch(tmp_path / "cat" / "a.png", b"a")
+    _touch(tmp_path / "cat" / "c.jpg", b"")  # 共享模式下尚未替换的占位文件
+    _touch(tmp_path / "cat" / "notes.txt", b"n")
+    
+    by_category = list_samples(tmp_path, ["cat", "dog"])
+    
+    assert {category: [p.name for p in paths] for category, paths in by_category.items()} == {
+        "cat": ["a.png", "b.jpg"], "dog": []}
+
+
+def test_mix_samples_interleaves_and_stratifies(tmp_path):
+    by_category = {"a": [tmp_path / f"a{i}.jpg" for i in range(8)], "b": [tmp_path / f"b{i}.jpg" for i in range(4)]}
+    
+    mixed = list(mix_samples(by_category, val_ratio=0.25))
+    
+    assert [category for _, category, _ in mixed[:3]] == ["a", "b", "a"]
+    assert sorted(path.name for path, _, _ in mixed) == sorted(p.name for ps in by_category.values() for p in ps)
+    val = [(path.name, category) for path, category, split in mixed if split == "val"]
+    assert sum(1 for _, category in val if category == "a") == 2
+    assert sum(1 for _, category in val if category == "b") == 1
+
+
+def test_export_shards_writes_samples_and_index(tmp_path):
+    src = tmp_path / "src"
+    for i in range(5):
+        _touch(src / "cat" / f"c{i}.jpg", f"cat{i}".encode())
+    for i in range(3):
+        _touch(src / "dog" / f"d{i}.jpg", f"dog{i}".encode())
+    out = tmp_path / "out"
+    
+    summary = export_shards(list_samples(src, ["cat", "dog"]), out, shard_size=3)
+    
+    assert summary["samples"] == {"train": 8} and not summary["failed"]
+    dataset = json.loads((out / "dataset.json").read_text(encoding="utf-8"))
+    assert dataset["categories"] == ["cat", "dog"]
+    shards = dataset["shards"]["train"]
+    assert len(shards) == 3
+    index = [json.loads(line) for line in (out / "index.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert len(index) == 8
+    first = index[0]
+    with tarfile.open(out / first["shard"]) as tar:
+        data = tar.extractfile(f"{first['key']}.jpg").read()
+        cls = int(tar.extractfile(f"{first['key']}.cls").read())
+    assert data == open(first["source"], "rb").read()
+    assert dataset["categories"][cls] == first["category"]
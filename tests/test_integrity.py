@@ -0,0 +1,90 @@
+"""完整性预检：各类损坏文件的分类，以及 IntegrityChecker 的计数与缓存"""
+import io
+import random
+
+import pytest
+from PIL import Image
+
+from img_cls import IntegrityChecker, SessionIndex, check_image
+from img_cls.integrity import EMPTY, OK, TRUNCATED, UNREADABLE
+
+
+def _encode(fmt, size=(64, 48), mode="RGB"):
+    """随机像素：压缩数据远大于文件头，截掉一半时截断点落在数据中"""
+    rng = random.Random(0)
+    n = size[0] * size[1] * len(mode)
+    buf = io.BytesIO()
+    Image.frombytes(mode, size, bytes(rng.randrange(256) for _ in range(n))).save(buf, fmt)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def images(tmp_path):
+    jpeg, png = _encode("JPEG"), _encode("PNG", mode="L")
+    # PNG 第一个数据块（IHDR）之后改坏一个字节但不更新 CRC
+    broken_crc = bytearray(png)
+    broken_crc[20] ^= 0xFF
+    files = {
+        "ok.jpg": jpeg,
+        "gray.png": png,
+        "cut.jpg": jpeg[:len(jpeg) // 2],
+        "head.jpg": jpeg[:300],  # 文件头（量化表 / 霍夫曼表）读到一半
+        "cut.png": png[:len(png) - 20],
+        "crc.png": bytes(broken_crc),
+        "junk.jpg": b"not an image at all",
+        "empty.jpg": b"",
+    }
+    for name, data in files.items():
+        (tmp_path / name).write_bytes(data)
+    return tmp_path
+
+
+@pytest.mark.parametrize("name, status", [
+    ("ok.jpg", OK),
+    ("gray.png", OK),
+    ("cut.jpg", TRUNCATED),
+    ("head.jpg", TRUNCATED),
+    ("cut.png", TRUNCATED),
+    ("crc.png", UNREADABLE),
+    ("junk.jpg", UNREADABLE),
+])
+def test_check_image(images, name, status):
+    result = check_image(str(images / name))
+    assert result[0] == status
+    if status == OK:
+        assert result[1:] == (64, 48, "RGB" if name.endswith(".jpg") else "L", None)
+    else:
+        assert result[4]
+
+
+def _run(checker, paths):
+    checker.submit(paths)
+    checker.finish()
+    assert checker.done.wait(30)
+    checker.stop(wait=True)
+    bad = {}
+    while not checker.bad.empty():
+        path, status, _ = checker.bad.get()
+        bad[path.name] = status
+    return bad
+
+
+def test_checker_counts_and_cache(images):
+    paths = sorted(images.glob("*.*"))
+    index = SessionIndex(images)
+    try:
+        checker = IntegrityChecker(index, workers=2)
+        checker.prioritize(paths[:3])  # 优先项与顺序检查重叠，每个文件仍只计一次
+        bad = _run(checker, paths)
+        expected = {"cut.jpg": TRUNCATED, "head.jpg": TRUNCATED, "cut.png": TRUNCATED, "crc.png": UNREADABLE,
+                    "junk.jpg": UNREADABLE, "empty.jpg": EMPTY}
+        assert bad == expected
+        assert checker.checked == checker.total == len(paths)
+        assert sum(checker.counts.values()) == len(paths)
+        
+        # 第二次直接取缓存：结果相同
+        cached = index.cached_checks(paths)
+        assert len(cached) == len(paths)
+        assert _run(IntegrityChecker(index, workers=2), paths) == expected
+    finally:
+        index.close()
@@ -0,0 +1,64 @@
+"""FileMover 日志崩溃恢复与重名后缀分配"""
+import json
+import os
+
+from img_cls import FileMover
+
+
+def _touch(path, data=b"x"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+def test_recover_from_half_written_journal(tmp_path):
+    a = _touch(tmp_path / "a.jpg", b"a")
+    b = _touch(tmp_path / "b.jpg", b"b")
+    c = _touch(tmp_path / "c.jpg", b"c")
+    cat = tmp_path / "cat"
+    # c 在崩溃前已经移动完成，但日志还没来得及记下 done
+    _touch(cat / "c.jpg", b"c")
+    c.unlink()
+    records = [
+        {"id": 1, "op": "move", "src": str(a), "dst": str(cat / "a.jpg"), "state": "pending"},
+        {"id": 2, "op": "move", "src": str(b), "dst": str(cat / "b.jpg"), "state": "pending"},
+        {"id": 2, "state": "running"},
+        {"id": 3, "op": "move", "src": str(c), "dst": str(cat / "c.jpg"), "state": "running"},
+    ]
+    with open(tmp_path / FileMover.JOURNAL_NAME, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+        f.write('{"id": 4, "op": "move", "src": "')  # 崩溃时写了一半的行
+    
+    mover = FileMover(tmp_path)
+    replayed, history = mover.recover()
+    mover.close()
+    
+    assert sorted(op["id"] for op in replayed) == [1, 2]
+    assert [op["id"] for op in history] == [3]
+    assert not a.exists() and not b.exists()
+    assert {p.name: p.read_bytes() for p in cat.iterdir()} == {"a.jpg": b"a", "b.jpg": b"b", "c.jpg": b"c"}
+    
+    # 压缩后的日志可以再次读取，已完成的移动全部可撤回
+    mover = FileMover(tmp_path)
+    replayed, history = mover.recover()
+    mover.close()
+    assert replayed == []
+    assert sorted(op["id"] for op in history) == [1, 2, 3]
+
+
+def test_collision_names_get_suffix(tmp_path):
+    cat = tmp_path / "cat"
+    _touch(cat / "a0.jpg", b"old")
+    first = _touch(tmp_path / "x" / "a0.jpg", b"first")
+    second = _touch(tmp_path / "y" / "a0.jpg", b"second")
+    
+    mover = FileMover(tmp_path)
+    mover.recover()
+    ops = [mover.move(first, cat), mover.move(second, cat)]
+    mover.close()
+    
+    assert [os.path.basename(op["dst"]) for op in ops] == ["a0_1.jpg", "a0_2.jpg"]
+    assert (cat / "a0.jpg").read_bytes() == b"old"
+    assert (cat / "a0_1.jpg").read_bytes() == b"first"
+    assert (cat / "a0_2.jpg").read_bytes() == b"second"
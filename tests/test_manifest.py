@@ -0,0 +1,110 @@
+"""LabelManifest：逐张标注的后台写入、内存计数与中断后续做"""
+import pytest
+
+from img_cls import LabelManifest, files
+
+
+def _touch(path, data=b"x"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+def test_labels_written_in_background_and_counted(tmp_path):
+    paths = [_touch(tmp_path / f"img{i}.jpg") for i in range(4)]
+    manifest = LabelManifest(tmp_path)
+    assert manifest.set(paths[0], "cat") is None
+    assert manifest.set(paths[1], "cat") is None
+    assert manifest.set(paths[0], "dog") == "cat"  # 尚未落盘的标注也能查到
+    assert manifest.get(paths[0]) == "dog"
+    assert manifest.counts() == {"cat": 1, "dog": 1}
+    
+    manifest.set_many([(paths[2], "dog"), (paths[1], "cat"), (paths[3], "bird")])
+    assert manifest.counts() == {"cat": 1, "dog": 2, "bird": 1}
+    manifest.restore_many({paths[3]: None, paths[2]: "cat"})
+    assert manifest.counts() == {"cat": 2, "dog": 1}
+    manifest.close()
+    
+    # 重新打开：后台写入的标注都已提交，计数与内存中的一致
+    manifest = LabelManifest(tmp_path)
+    assert manifest.get_many(paths) == {paths[0]: "dog", paths[1]: "cat", paths[2]: "cat"}
+    assert manifest.counts() == {"cat": 2, "dog": 1}
+    manifest.apply("copy", workers=1)
+    assert manifest.counts() == {}
+    manifest.set(paths[0], "dog")  # 已应用的重新标注：再次待应用
+    assert manifest.counts() == {"dog": 1}
+    manifest.close()
+
+
+class _Crash(BaseException):
+    """模拟进程在 apply 中途退出（不被 apply 的 except Exception 捕获）"""
+
+
+def test_manifest_resumes_partial_apply(tmp_path, monkeypatch):
+    paths = [_touch(tmp_path / f"img{i}.jpg", bytes([i])) for i in range(6)]
+    _touch(tmp_path / "cat" / "img0.jpg", b"old")  # 重名：应分配 img0_1.jpg
+    manifest = LabelManifest(tmp_path)
+    manifest.set_many([(p, "cat" if i % 2 == 0 else "dog") for i, p in enumerate(paths)])
+    
+    transfer = LabelManifest._transfer
+    calls = []
+    
+    def crash_after_three(src, dst, *args):
+        calls.append(src)
+        if len(calls) > 3:
+            raise _Crash()
+        return transfer(src, dst, *args)
+    
+    monkeypatch.setattr(LabelManifest, "_transfer", staticmethod(crash_after_three))
+    with pytest.raises(_Crash):
+        manifest.apply("move", workers=1)
+    monkeypatch.setattr(LabelManifest, "_transfer", staticmethod(transfer))
+    assert sum(p.exists() for p in paths) == 3
+    assert len(manifest.labels()) == 6  # 中途退出：一行都没有标记为已应用
+    
+    summary = manifest.apply("move", workers=1)
+    assert sorted(summary["done"]) == sorted(str(p) for p in paths)
+    assert summary["failed"] == [] and summary["missing"] == []
+    assert manifest.labels() == {}
+    assert not any(p.exists() for p in paths)
+    assert sorted(p.name for p in (tmp_path / "cat").iterdir()) == ["img0.jpg", "img0_1.jpg", "img2.jpg", "img4.jpg"]
+    assert (tmp_path / "cat" / "img0_1.jpg").read_bytes() == bytes([0])
+    assert sorted(p.name for p in (tmp_path / "dog").iterdir()) == ["img1.jpg", "img3.jpg", "img5.jpg"]
+    
+    # 已应用的清单再次执行不会重复移动
+    assert manifest.apply("move")["done"] == []
+    manifest.close()
+
+
+def test_copy_resumes_after_partial_copy(tmp_path, monkeypatch):
+    paths = [_touch(tmp_path / f"img{i}.jpg", bytes([i]) * 1000) for i in range(2)]
+    manifest = LabelManifest(tmp_path)
+    manifest.set_many([(p, "cat") for p in paths])
+    
+    copy2 = files.shutil.copy2
+    
+    def crash_mid_copy(src, dst):
+        if src.endswith("img1.jpg"):
+            with open(dst, "wb") as f:
+                f.write(b"\1" * 300)  # 写了一半时进程退出
+            raise _Crash()
+        return copy2(src, dst)
+    
+    monkeypatch.setattr(files.shutil, "copy2", crash_mid_copy)
+    with pytest.raises(_Crash):
+        manifest.apply("copy", workers=1)
+    monkeypatch.setattr(files.shutil, "copy2", copy2)
+    cat = tmp_path / "cat"
+    assert sorted(p.name for p in cat.iterdir()) == ["img0.jpg"]  # 不完整的副本只在 .part 中，已清理
+    
+    # 旧版本直接写目标文件：中途退出留下的是同名的不完整副本
+    (cat / "img0.jpg").write_bytes(b"\0" * 10)
+    finished, missing, planned = manifest.plan("copy")
+    assert finished == [] and missing == [] and len(planned) == 2
+    
+    summary = manifest.apply("copy", workers=1)
+    assert sorted(summary["done"]) == sorted(str(p) for p in paths) and summary["failed"] == []
+    assert {p.name: p.read_bytes() for p in cat.iterdir()} == {p.name: p.read_bytes() for p in paths}
+    assert all(p.exists() for p in paths)
+    assert manifest.plan("copy") == ([], [], [])
+    manifest.close()
@@ -0,0 +1,77 @@
+"""LabelPredictor：增量标注 / 撤回后的预测与从头构建的结果一致"""
+import numpy as np
+import pytest
+
+from img_cls import FEATURE_DIM, LabelPredictor
+
+
+def _features(rng, center, n):
+    feats = center + 0.3 * rng.standard_normal((n, FEATURE_DIM)).astype(np.float32)
+    return feats / np.linalg.norm(feats, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((2, FEATURE_DIM)).astype(np.float32)
+    refs = np.vstack([_features(rng, centers[0], 10), _features(rng, centers[1], 10)])
+    queries = np.vstack([_features(rng, centers[0], 30), _features(rng, centers[1], 30)])
+    return {
+        "ref_keys": [f"ref{i}" for i in range(20)],
+        "ref_feats": refs,
+        "ref_cats": ["cat"] * 10 + ["dog"] * 10,
+        "query_keys": [f"q{i}" for i in range(60)],
+        "query_feats": queries,
+        "truth": ["cat"] * 30 + ["dog"] * 30,
+    }
+
+
+def _build(data, extra=()):
+    """从头构建：参考集 + extra 中的 (查询序号, 类别) 一起作为参考"""
+    predictor = LabelPredictor(["cat", "dog"], k=5)
+    labeled = dict(extra)
+    keys = data["ref_keys"] + [data["query_keys"][i] for i in labeled]
+    feats = np.vstack([data["ref_feats"], data["query_feats"][list(labeled)]])
+    predictor.add_references(keys, feats, data["ref_cats"] + list(labeled.values()))
+    rest = [i for i in range(len(data["query_keys"])) if i not in labeled]
+    predictor.add_queries([data["query_keys"][i] for i in rest], data["query_feats"][rest])
+    return predictor
+
+
+def test_predicts_clusters(data):
+    predictor = _build(data)
+    predictions = predictor.predict_all()
+    assert len(predictions) == 60
+    for key, truth in zip(data["query_keys"], data["truth"]):
+        category, confidence = predictions[key]
+        assert category == truth
+        assert 0.5 < confidence <= 1.0
+    assert predictor.predict("unknown") is None
+    assert len(predictor) == 20
+
+
+def _assert_same(a, b):
+    pa, pb = a.predict_all(), b.predict_all()
+    assert pa.keys() == pb.keys()
+    for key in pa:
+        assert pa[key][0] == pb[key][0]
+        assert pa[key][1] == pytest.approx(pb[key][1], abs=1e-5)
+
+
+def test_incremental_label_matches_rebuild(data):
+    predictor = _build(data)
+    predictor.label(["q0", "q1", "q40"], "dog")  # 故意标成与聚类不一致的类别
+    predictor.label(["q2"], "cat")
+    assert len(predictor) == 24
+    assert predictor.predict("q0") is None  # 已标注的图像不再预测
+    _assert_same(predictor, _build(data, [(0, "dog"), (1, "dog"), (40, "dog"), (2, "cat")]))
+
+
+def test_unlabel_restores_previous_state(data):
+    predictor = _build(data)
+    predictor.label(["q0", "q1", "q40"], "dog")
+    predictor.unlabel(["q0", "q40"])
+    assert len(predictor) == 21
+    _assert_same(predictor, _build(data, [(1, "dog")]))
+    predictor.unlabel(["q1", "never-seen"])
+    _assert_same(predictor, _build(data))
@@ -0,0 +1,63 @@
+"""目录扫描：扫描线程中预先排好的顺序、会话索引的目录缓存"""
+import os
+
+from img_cls import DirectoryScanner, SessionIndex, WorkQueue
+
+
+def _make_tree(root):
+    paths = []
+    for sub in ("b", "a-c", "a/b", ""):
+        for i in (3, 1, 2):
+            path = root / sub / f"img{i}.jpg"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b"x")
+            paths.append(path)
+    (root / "notes.txt").write_text("x")
+    return paths
+
+
+def _scan(root, index=None):
+    scanner = DirectoryScanner(root, recursive=True, index=index)
+    batches = []
+    while True:
+        batch = scanner.batches.get()
+        if batch is None:
+            return scanner, batches
+        batches.append(batch)
+
+
+def test_scanner_order_matches_queue_sort(tmp_path, monkeypatch):
+    # 小批量：结果分多批到达，批与批之间不按顺序
+    monkeypatch.setattr(DirectoryScanner, "FIRST_BATCH", 2)
+    monkeypatch.setattr(DirectoryScanner, "BATCH_SIZE", 2)
+    paths = _make_tree(tmp_path)
+    scanner, batches = _scan(tmp_path)
+    assert sorted(p for batch in batches for p in batch) == sorted(paths)
+    
+    presorted, resorted = WorkQueue(), WorkQueue()
+    slots = []
+    for batch in batches:
+        first = presorted.extend(batch)
+        slots.extend(range(first, first + len(batch)))
+        resorted.extend(list(batch))
+    presorted.sort_after(-1, order=[slots[i] for i in scanner.order])
+    resorted.sort_after(-1)
+    assert list(presorted) == list(resorted)
+    assert [presorted.index(p) for p in paths] == [resorted.index(p) for p in paths]
+
+
+def test_index_reuses_unchanged_dirs(tmp_path):
+    _make_tree(tmp_path)
+    root_mtime = os.stat(tmp_path).st_mtime_ns
+    index = SessionIndex(tmp_path)
+    index.dir_touched(tmp_path, root_mtime)  # 第一次打开时创建了索引目录
+    _, first = _scan(tmp_path, index)
+    index.close()
+    # 索引在隐藏子目录中，关闭时删除 WAL 文件不改变图像目录的 mtime
+    assert not any(name.startswith(".img_cls_index") for name in os.listdir(tmp_path))
+    
+    index = SessionIndex(tmp_path)
+    assert index.cached_dir(tmp_path, os.stat(tmp_path).st_mtime_ns) is not None
+    _, second = _scan(tmp_path, index)
+    index.close()
+    assert sorted(p for batch in second for p in batch) == sorted(p for batch in first for p in batch)
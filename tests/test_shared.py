@@ -0,0 +1,105 @@
+"""共享模式：占位文件占用文件名，批量应用标注时替换占位文件，读取类别目录时跳过占位文件"""
+import os
+
+import pytest
+
+from img_cls import LabelManifest, NameIndex, collect_references, list_samples
+
+
+def _touch(path, data=b"x"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+class _Crash(BaseException):
+    """模拟进程在 apply 中途退出（不被 apply 的 except Exception 捕获）"""
+
+
+def _labeled(tmp_path, n=4):
+    paths = [_touch(tmp_path / f"img{i}.jpg", bytes([i + 1]) * 100) for i in range(n)]
+    manifest = LabelManifest(tmp_path, owner="ours")
+    manifest.set_many([(p, "cat") for p in paths])
+    return manifest, paths
+
+
+def _contents(folder):
+    return {p.name: p.read_bytes() for p in folder.iterdir()}
+
+
+def test_shared_names_skip_other_instances(tmp_path):
+    """另一个实例（另一份内存索引）已占用的文件名通过占位文件避开"""
+    cat = tmp_path / "cat"
+    ours, theirs = NameIndex(shared=True), NameIndex(shared=True)
+    assert theirs.reserve(cat, "a0.jpg").name == "a0.jpg"
+    assert ours.reserve(cat, "a0.jpg").name == "a0_1.jpg"
+    assert theirs.reserve(cat, "a0.jpg").name == "a0_2.jpg"
+
+
+@pytest.mark.parametrize("mode", ["move", "copy", "hardlink"])
+def test_shared_apply_replaces_placeholders(tmp_path, mode):
+    manifest, paths = _labeled(tmp_path)
+    expected = {p.name: p.read_bytes() for p in paths}
+    NameIndex(shared=True).reserve(tmp_path / "cat", "img0.jpg")  # 另一个实例抢先占用
+    
+    summary = manifest.apply(mode, workers=2, names=NameIndex(shared=True))
+    assert summary["failed"] == [] and len(summary["done"]) == 4
+    cat = _contents(tmp_path / "cat")
+    assert cat.pop("img0.jpg") == b""  # 另一个实例的占位文件保持原样
+    assert cat == {"img0_1.jpg": expected["img0.jpg"], **{k: v for k, v in expected.items() if k != "img0.jpg"}}
+    assert all(p.exists() == (mode != "move") for p in paths)
+    manifest.close()
+
+
+def test_shared_copy_resumes_without_counting_placeholders(tmp_path, monkeypatch):
+    manifest, paths = _labeled(tmp_path)
+    transfer = LabelManifest._transfer
+    calls = []
+    
+    def crash_after_two(src, dst, *args):
+        calls.append(src)
+        if len(calls) > 2:
+            raise _Crash()
+        return transfer(src, dst, *args)
+    
+    monkeypatch.setattr(LabelManifest, "_transfer", staticmethod(crash_after_two))
+    with pytest.raises(_Crash):
+        manifest.apply("copy", workers=1, names=NameIndex(shared=True))
+    monkeypatch.setattr(LabelManifest, "_transfer", staticmethod(transfer))
+    sizes = sorted(p.stat().st_size for p in (tmp_path / "cat").iterdir())
+    assert sizes == [0, 0, 100, 100]  # 两个已复制，两个仍是占位文件
+    
+    # 续做：占位文件不算已完成，重新打开后（新的内存索引）照常替换
+    summary = manifest.apply("copy", workers=1, names=NameIndex(shared=True))
+    assert summary["failed"] == [] and len(summary["done"]) == 4
+    assert _contents(tmp_path / "cat") == {p.name: p.read_bytes() for p in paths}
+    assert manifest.plan("copy", NameIndex(shared=True)) == ([], [], [])
+    manifest.close()
+
+
+def test_shared_apply_failure_releases_placeholder(tmp_path, monkeypatch):
+    manifest, paths = _labeled(tmp_path, n=2)
+    transfer = LabelManifest._transfer
+    
+    def fail_first(src, dst, *args):
+        if src.endswith("img0.jpg"):
+            raise PermissionError("拒绝访问")
+        return transfer(src, dst, *args)
+    
+    monkeypatch.setattr(LabelManifest, "_transfer", staticmethod(fail_first))
+    summary = manifest.apply("move", workers=1, names=NameIndex(shared=True))
+    assert [src for src, _ in summary["failed"]] == [str(paths[0])]
+    assert os.listdir(tmp_path / "cat") == ["img1.jpg"]  # 失败项的占位文件已删除
+    assert manifest.labels() == {str(paths[0]): "cat"}
+    
+    monkeypatch.setattr(LabelManifest, "_transfer", staticmethod(transfer))
+    assert manifest.apply("move", workers=1, names=NameIndex(shared=True))["failed"] == []
+    assert sorted(os.listdir(tmp_path / "cat")) == ["img0.jpg", "img1.jpg"]
+    manifest.close()
+
+
+def test_readers_skip_placeholders(tmp_path):
+    _touch(tmp_path / "cat" / "a.jpg")
+    NameIndex(shared=True).reserve(tmp_path / "cat", "b.jpg")
+    assert collect_references(tmp_path, ["cat", "dog"]) == [(tmp_path / "cat" / "a.jpg", "cat")]
+    assert list_samples(tmp_path, ["cat", "dog"]) == {"cat": [tmp_path / "cat" / "a.jpg"], "dog": []}
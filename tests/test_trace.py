@@ -0,0 +1,56 @@
+"""热路径计时：汇总统计与导出格式；启动耗时"""
+import json
+
+from img_cls import StartupTimer, Tracer, process_age
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer()
+    with tracer.span("decode"):
+        pass
+    tracer.counter("cache_hit", 1)
+    assert tracer.summary() == {} and tracer.counters() == {}
+
+
+def test_summary_and_export(tmp_path):
+    tracer = Tracer(enabled=True)
+    for ms in range(1, 21):
+        tracer.record("decode", 0.0, ms / 1000, {"path": f"img{ms}.jpg"})
+    with tracer.span("move"):
+        pass
+    tracer.counter("cache_hit", 0.5)
+    
+    stats = tracer.summary()
+    assert stats["decode"]["count"] == 20 and stats["move"]["count"] == 1
+    assert abs(stats["decode"]["mean_ms"] - 10.5) < 1e-6
+    assert abs(stats["decode"]["p95_ms"] - 20) < 1e-6 and abs(stats["decode"]["max_ms"] - 20) < 1e-6
+    assert tracer.counters() == {"cache_hit": 0.5}
+    
+    assert tracer.export(tmp_path / "trace.json") == 22
+    events = json.loads((tmp_path / "trace.json").read_text(encoding="utf-8"))["traceEvents"]
+    assert [e["ph"] for e in events] == ["X"] * 21 + ["C"]
+    assert events[0]["args"] == {"path": "img1.jpg"} and events[0]["dur"] == 1000.0
+    
+    tracer.export(tmp_path / "trace.jsonl")
+    lines = [json.loads(line) for line in (tmp_path / "trace.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert [r["type"] for r in lines] == ["span"] * 21 + ["counter"]
+    assert lines[-1]["args"] == {"cache_hit": 0.5} and "dur_us" not in lines[-1]
+    
+    tracer.reset()
+    assert tracer.summary() == {}
+
+
+def test_startup_timer_marks_from_process_start():
+    age = process_age()
+    timer = StartupTimer()
+    first = timer.mark("window")
+    second = timer.mark("first_image")
+    report = timer.report()
+    
+    assert list(timer.marks) == ["window", "first_image"]
+    assert 0 <= first <= second
+    if age is not None:
+        # 起点为进程创建：在本测试之前已经运行的时间都计入
+        assert first >= age
+    assert report["window_ms"] == round(first * 1000, 1) and report["first_image_ms"] == round(second * 1000, 1)
+    assert report["frozen"] is False
@@ -0,0 +1,116 @@
+"""WorkQueue 与普通列表模型逐步对照：随机移出 / 撤回 / 插入后，可见顺序、下标与计数保持一致"""
+import random
+from pathlib import Path
+
+from img_cls import WorkQueue
+
+
+def _paths(n, start=0):
+    return [Path("/data", f"d{i % 3}", f"img{i:05d}.jpg") for i in range(start, start + n)]
+
+
+class ListModel:
+    """参照实现：order 为全部条目的顺序，removed 为已移出的条目"""
+    
+    def __init__(self):
+        self.order = []
+        self.removed = set()
+    
+    def visible(self):
+        return [p for p in self.order if p not in self.removed]
+
+
+def _check(queue, model):
+    visible = model.visible()
+    assert len(queue) == len(visible)
+    assert list(queue) == visible
+    assert queue.remaining == len(visible)
+    for i in random.Random(len(visible)).sample(range(len(visible)), min(20, len(visible))):
+        assert queue[i] == visible[i]
+        assert queue.index(visible[i]) == i
+        assert visible[i] in queue
+    for path in list(model.removed)[:20]:
+        assert path not in queue
+
+
+def test_matches_list_model():
+    rng = random.Random(12345)
+    queue, model = WorkQueue(), ListModel()
+    initial = _paths(500)
+    queue.extend(initial)
+    model.order.extend(initial)
+    slots = {}  # {路径: slot}，已移出、可撤回的条目
+    fresh = iter(_paths(1000, start=500))
+    for step in range(1500):
+        visible = model.visible()
+        action = rng.random()
+        if action < 0.35 and visible:
+            i = rng.randrange(len(visible))
+            slots[visible[i]] = queue.remove(i, "cat")
+            model.removed.add(visible[i])
+        elif action < 0.5 and visible:
+            # 批量移出（缩略图网格多选），夹带不在队列中的路径
+            picked = rng.sample(visible, min(len(visible), rng.randint(1, 40))) + [Path("/nowhere/x.jpg")]
+            removed = queue.remove_paths(picked, "dog")
+            assert set(removed) == set(picked[:-1])
+            slots.update(removed)
+            model.removed.update(removed)
+        elif action < 0.8 and slots:
+            path = rng.choice(list(slots))
+            index = queue.restore(slots.pop(path))
+            model.removed.discard(path)
+            assert model.visible()[index] == path
+        elif action < 0.9:
+            # 插入新路径（重启后撤回的文件）
+            path = next(fresh)
+            index = rng.randint(0, len(visible))
+            pos = model.order.index(visible[index]) if index < len(visible) else len(model.order)
+            model.order.insert(pos, path)
+            assert queue.insert(index, path) == index
+        else:
+            path = next(fresh)
+            queue.extend([path])
+            model.order.append(path)
+        if step % 50 == 0:
+            _check(queue, model)
+    _check(queue, model)
+    assert queue.removed == len(model.removed)
+
+
+def test_category_counts():
+    queue = WorkQueue()
+    paths = _paths(10)
+    queue.extend(paths)
+    slot = queue.remove(0, "cat")
+    queue.remove_paths(paths[3:6], "dog")
+    assert queue.category_counts() == {"cat": 1, "dog": 3}
+    queue.restore(slot)
+    assert queue.category_counts() == {"dog": 3}
+    # 仅标注模式：记录类别但不移出
+    indices = queue.set_categories({paths[0]: "cat", paths[1]: "cat", paths[4]: "cat"})
+    assert indices == {paths[0]: 0, paths[1]: 1}
+    assert queue.category_counts() == {"cat": 2, "dog": 3}
+    queue.set_categories({paths[1]: None})
+    assert queue.category_counts() == {"cat": 1, "dog": 3}
+    assert len(queue) == 7
+
+
+def test_restore_respects_filter():
+    queue = WorkQueue()
+    paths = _paths(9)
+    queue.extend(paths)
+    slots = queue.remove_paths(paths[:2], "cat")
+    queue.filter(lambda p: p.parent.name != "d0")  # 隐藏 d0 目录下的条目（img0、img3、img6）
+    assert list(queue) == [paths[i] for i in (2, 4, 5, 7, 8)]
+    # 撤回被筛掉的条目：放回队列但保持隐藏；符合条件的照常回到原位
+    assert queue.restore(slots[paths[0]]) == 0 and paths[0] not in queue
+    assert queue.restore(slots[paths[1]]) == 0 and queue.index(paths[1]) == 0
+    assert queue.insert(1, Path("/data/d0/new.jpg")) == 1 and len(queue) == 6
+    assert queue.remaining == 10 and queue.category_counts() == {}
+    queue.filter(None)
+    assert queue[0] == paths[0] and len(queue) == 10
+    
+    # 筛选之后追加的条目同样按条件处理
+    queue.filter(lambda p: p.name != "img00009.jpg")
+    queue.extend(_paths(1, start=9))
+    assert len(queue) == 10